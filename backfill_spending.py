@@ -0,0 +1,27 @@
+"""
+Rebuild the per-user spending rollups behind /stats
+
+Usage:
+    python backfill_spending.py
+
+Recomputes user_spending_rollups from session_participants and the
+archive in one transaction. Safe to re-run and to run next to the bot:
+it locks session_participants against writes first, so selections,
+settlements and payment updates pause for the rebuild and then apply on
+top of it. Reads are not blocked.
+"""
+import asyncio
+import logging
+from database.connection import init_db
+from services.spending_service import backfill_spending
+
+
+async def main():
+    await init_db()
+    rows = await backfill_spending()
+    print(f"Spending rollups rebuilt: {rows} rows")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main())
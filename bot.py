@@ -4,11 +4,32 @@ import sys
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN,
+    FSM_STORAGE,
+    DB_RESET_ON_START,
+    BOT_MODE,
+    SCHEDULER_WORKERS,
+    SCHEDULER_MAX_CHAT_QUEUE,
+    THROTTLE_PHOTO_LIMIT,
+    THROTTLE_PHOTO_PERIOD,
+    THROTTLE_CALLBACK_LIMIT,
+    THROTTLE_CALLBACK_PERIOD,
+    THROTTLE_MESSAGE_LIMIT,
+    THROTTLE_MESSAGE_PERIOD
+)
 from database.connection import init_db
-from handlers import start_router, receipt_router, session_setup_router, meal_selection_router
-from middleware import LoggingMiddleware
+from database.fsm_storage import PostgresStorage, TTLMemoryStorage
+from handlers import start_router, join_router, board_router, receipt_router, session_setup_router, meal_selection_router, callback_router, debts_router, payments_router, history_router, stats_router
+from middleware import LoggingMiddleware, UpdateScheduler, ThrottlingMiddleware, OutboundRateLimiter
+from services.archive_service import ArchiveService
+from services.janitor_service import LifecycleJanitor
+from services.calculation_service import ledgers
+from services.session_snapshot import snapshots
+from services.session_board import boards
+from services.reminder_service import reminders
+from services.history_service import history
+from webhook_server import run_webhook
 
 # Configure logging
 logging.basicConfig(
@@ -29,45 +50,98 @@ async def main():
     try:
         logger.info("📊 Initializing database...")
         
-        await init_db(reset=True)
+        await init_db(reset=DB_RESET_ON_START)
         logger.info("✅ Database initialized!")
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {e}")
         return
 
+    archive_task = None
+    janitor_task = None
+    reminder_task = None
+    storage = None
+    scheduler = None
+    rate_limiter = None
+
     try:
         logger.info("🤖 Creating bot instance...")
         bot = Bot(
             token=BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
+        rate_limiter = OutboundRateLimiter()
+        bot.session.middleware(rate_limiter)
         
         logger.info("⚙️ Creating dispatcher...")
-        storage = MemoryStorage()
+        if FSM_STORAGE == "memory":
+            storage = TTLMemoryStorage()
+        else:
+            storage = PostgresStorage()
+        logger.info(f"💾 FSM storage: {type(storage).__name__}")
         dp = Dispatcher(storage=storage)
 
         logger.info("🔧 Setting up middleware...")
+        # Throttling runs first so floods never reach the scheduler queues
+        dp.update.outer_middleware(ThrottlingMiddleware(
+            photo_limit=(THROTTLE_PHOTO_LIMIT, THROTTLE_PHOTO_PERIOD),
+            callback_limit=(THROTTLE_CALLBACK_LIMIT, THROTTLE_CALLBACK_PERIOD),
+            message_limit=(THROTTLE_MESSAGE_LIMIT, THROTTLE_MESSAGE_PERIOD)
+        ))
+        scheduler = UpdateScheduler(workers=SCHEDULER_WORKERS, max_chat_queue=SCHEDULER_MAX_CHAT_QUEUE)
+        dp.update.outer_middleware(scheduler)
         dp.message.middleware(LoggingMiddleware())
         dp.callback_query.middleware(LoggingMiddleware())
 
         logger.info("📝 Registering handlers...")
+        dp.include_router(join_router)  # Deep-link /start before the plain one
+        dp.include_router(board_router)
         dp.include_router(start_router)
+        dp.include_router(debts_router)
+        dp.include_router(payments_router)
+        dp.include_router(history_router)
+        dp.include_router(stats_router)
         dp.include_router(receipt_router)
         dp.include_router(session_setup_router)
         dp.include_router(meal_selection_router)
+        dp.include_router(callback_router)
+
+        logger.info("📦 Starting session archiver, janitor and payment reminders...")
+        archive_task = asyncio.create_task(ArchiveService().run_forever())
+        janitor_task = asyncio.create_task(LifecycleJanitor(storage).run_forever())
+        reminder_task = asyncio.create_task(reminders.run_forever(bot))
 
         logger.info("=" * 70)
         logger.info("✅ Bot started successfully!")
-        logger.info("👂 Waiting for messages...")
+        logger.info(f"👂 Waiting for messages ({BOT_MODE})...")
         logger.info("⌨️  Press Ctrl+C to stop")
         logger.info("=" * 70)
         
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            # Polling and webhooks are mutually exclusive on Telegram's side
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
         
     except Exception as e:
         logger.error(f"❌ Error: {e}", exc_info=True)
     finally:
         logger.info("🔌 Closing bot...")
+        for task in (archive_task, janitor_task, reminder_task):
+            if task:
+                task.cancel()
+        if rate_limiter:
+            logger.info(f"📊 Outbound: {rate_limiter.metrics()}")
+        if scheduler:
+            logger.info(f"📊 Scheduler: {scheduler.metrics()}")
+            await scheduler.close()
+        logger.info(f"📊 Settlement: {ledgers.stats}")
+        logger.info(f"📊 Snapshots: {snapshots.stats}")
+        logger.info(f"📊 Boards: {boards.stats}")
+        logger.info(f"📊 Reminders: {reminders.counters}")
+        logger.info(f"📊 History cache: {history.stats}")
+        if storage:
+            await storage.close()
         await bot.session.close()
 
 
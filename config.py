@@ -20,4 +20,84 @@ if not OPENAI_API_KEY:
 CURRENCY_SYMBOL = "so'm"
 
 # Telegram file size limit
-MAX_FILE_SIZE_MB = 20
\ No newline at end of file
+MAX_FILE_SIZE_MB = 20
+
+# Session archival (services/archive_service.py)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '200'))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv('ARCHIVE_BATCH_PAUSE_SECONDS', '1.0'))
+ARCHIVE_MAX_BATCHES_PER_RUN = int(os.getenv('ARCHIVE_MAX_BATCHES_PER_RUN', '50'))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv('ARCHIVE_INTERVAL_SECONDS', '3600'))
+
+# FSM storage: "postgres" (survives restarts, shared across processes) or "memory"
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'postgres')
+FSM_TTL_SECONDS = int(os.getenv('FSM_TTL_SECONDS', str(24 * 60 * 60)))
+# Write buffering per process; set 0 (write-through) when several bot processes share the table
+FSM_FLUSH_INTERVAL_MS = int(os.getenv('FSM_FLUSH_INTERVAL_MS', '50'))
+
+# Drop and recreate all tables on startup (development only)
+DB_RESET_ON_START = os.getenv('DB_RESET_ON_START', 'false').lower() == 'true'
+
+# Lifecycle janitor (services/janitor_service.py)
+SESSION_ABANDON_AFTER_SECONDS = int(os.getenv('SESSION_ABANDON_AFTER_SECONDS', str(2 * 24 * 60 * 60)))
+JANITOR_BATCH_SIZE = int(os.getenv('JANITOR_BATCH_SIZE', '500'))
+JANITOR_BATCH_PAUSE_SECONDS = float(os.getenv('JANITOR_BATCH_PAUSE_SECONDS', '0.5'))
+JANITOR_INTERVAL_SECONDS = int(os.getenv('JANITOR_INTERVAL_SECONDS', '600'))
+
+# Update transport: "polling" or "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')  # e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+
+if BOT_MODE == 'webhook' and not (WEBHOOK_BASE_URL and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_BASE_URL and WEBHOOK_SECRET are required in webhook mode")
+
+# Per-chat ordered update scheduler (middleware/update_scheduler.py)
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '32'))
+SCHEDULER_MAX_CHAT_QUEUE = int(os.getenv('SCHEDULER_MAX_CHAT_QUEUE', '100'))
+
+# Keyboard edit coalescing window for rapid taps (services/edit_coalescer.py)
+EDIT_COALESCE_WINDOW_MS = int(os.getenv('EDIT_COALESCE_WINDOW_MS', '300'))
+
+# Incoming flood throttling (middleware/throttling_middleware.py), hits per window
+THROTTLE_PHOTO_LIMIT = int(os.getenv('THROTTLE_PHOTO_LIMIT', '3'))
+THROTTLE_PHOTO_PERIOD = float(os.getenv('THROTTLE_PHOTO_PERIOD', '60'))
+THROTTLE_CALLBACK_LIMIT = int(os.getenv('THROTTLE_CALLBACK_LIMIT', '20'))
+THROTTLE_CALLBACK_PERIOD = float(os.getenv('THROTTLE_CALLBACK_PERIOD', '10'))
+THROTTLE_MESSAGE_LIMIT = int(os.getenv('THROTTLE_MESSAGE_LIMIT', '10'))
+THROTTLE_MESSAGE_PERIOD = float(os.getenv('THROTTLE_MESSAGE_PERIOD', '10'))
+
+# Smallest photo resolution (width * height) still legible for receipt text
+RECEIPT_MIN_PIXELS = int(os.getenv('RECEIPT_MIN_PIXELS', str(1280 * 800)))
+
+# Local receipt image quality gate (services/image_service.py)
+QUALITY_MIN_SHORT_SIDE = int(os.getenv('QUALITY_MIN_SHORT_SIDE', '480'))
+QUALITY_MIN_SHARPNESS = float(os.getenv('QUALITY_MIN_SHARPNESS', '60'))  # variance of Laplacian
+QUALITY_MIN_BRIGHTNESS = float(os.getenv('QUALITY_MIN_BRIGHTNESS', '50'))
+QUALITY_MAX_CLIPPED = float(os.getenv('QUALITY_MAX_CLIPPED', '0.5'))  # share of blown-out pixels
+QUALITY_MIN_RECEIPT_AREA = float(os.getenv('QUALITY_MIN_RECEIPT_AREA', '0.12'))
+
+# Meals per keyboard page for long receipts
+KEYBOARD_PAGE_SIZE = int(os.getenv('KEYBOARD_PAGE_SIZE', '10'))
+
+# Live session board in group chats (services/session_board.py)
+BOARD_DEBOUNCE_MS = int(os.getenv('BOARD_DEBOUNCE_MS', '1000'))
+BOARD_MIN_EDIT_INTERVAL_SECONDS = float(os.getenv('BOARD_MIN_EDIT_INTERVAL_SECONDS', '3'))  # Groups allow ~20 messages a minute
+
+# Payment reminders (services/reminder_service.py)
+REMINDER_INTERVAL_SECONDS = int(os.getenv('REMINDER_INTERVAL_SECONDS', str(24 * 60 * 60)))  # After joining, then between reminders
+REMINDER_MAX_COUNT = int(os.getenv('REMINDER_MAX_COUNT', '3'))
+REMINDER_SCAN_INTERVAL_SECONDS = int(os.getenv('REMINDER_SCAN_INTERVAL_SECONDS', '600'))
+REMINDER_SCAN_LIMIT = int(os.getenv('REMINDER_SCAN_LIMIT', '5000'))
+REMINDER_TICK_SECONDS = float(os.getenv('REMINDER_TICK_SECONDS', '5'))
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '25'))
+
+# My Sessions history (services/history_service.py)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '5'))
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv('HISTORY_CACHE_TTL_SECONDS', '120'))
+
+# Spending stats (services/spending_service.py)
+STATS_MONTHS = int(os.getenv('STATS_MONTHS', '12'))
@@ -1,5 +1,18 @@
 from database.connection import init_db, get_session, async_session_maker
-from database.models import Session, SessionParticipant, Meal, UserMealSelection, SessionStatus, PaymentStatus
+from database.types import Money
+from database.models import (
+    Session,
+    SessionParticipant,
+    Meal,
+    UserMealSelection,
+    SessionStatus,
+    PaymentStatus,
+    ArchivedSession,
+    ArchivedSessionMember,
+    UserSpendingRollup,
+    DebtTransfer,
+    FSMRecord
+)
 
 __all__ = [
     'init_db', 
@@ -10,5 +23,11 @@ __all__ = [
     'Meal', 
     'UserMealSelection',
     'SessionStatus',
-    'PaymentStatus'
+    'PaymentStatus',
+    'ArchivedSession',
+    'ArchivedSessionMember',
+    'UserSpendingRollup',
+    'DebtTransfer',
+    'FSMRecord',
+    'Money'
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 # database/connection.py
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from database.models import Base
 from config import DATABASE_URL
@@ -29,6 +30,8 @@ async def init_db(reset: bool = False):
                 logger.warning("⚠️ Dropping all tables and resetting database...")
                 await conn.run_sync(Base.metadata.drop_all)
             
+            # Trigram indexes on names require pg_trgm
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
             await conn.run_sync(Base.metadata.create_all)
         logger.info("✅ Database initialized successfully")
     except Exception as e:
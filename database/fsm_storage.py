@@ -0,0 +1,337 @@
+import asyncio
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Coroutine, Dict, Mapping, Optional, Set, Tuple
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from database.models import FSMRecord
+from database.connection import async_session_maker
+from config import FSM_TTL_SECONDS, FSM_FLUSH_INTERVAL_MS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Payload headers
+_RAW = b"j"
+_ZLIB = b"z"
+_COMPRESS_ABOVE = 512
+
+# Backoff for retrying a failed background flush
+_RETRY_BASE_SECONDS = 0.5
+_RETRY_MAX_SECONDS = 30.0
+
+
+def _encode(value: Any) -> Any:
+    """Make FSM data JSON-safe without losing sets or int dict keys"""
+    if isinstance(value, (set, frozenset)):
+        return {"$s": [_encode(v) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("$") for k in value):
+            return {k: _encode(v) for k, v in value.items()}
+        return {"$d": [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "$s" in value:
+            return {_decode(v) for v in value["$s"]}
+        if len(value) == 1 and "$d" in value:
+            return {_decode(k): _decode(v) for k, v in value["$d"]}
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def dumps(data: Mapping[str, Any]) -> bytes:
+    """Serialize FSM data: compact JSON, zlib-compressed when large"""
+    raw = json.dumps(_encode(dict(data)), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) > _COMPRESS_ABOVE:
+        return _ZLIB + zlib.compress(raw)
+    return _RAW + raw
+
+
+def loads(payload: Optional[bytes]) -> Dict[str, Any]:
+    if not payload:
+        return {}
+    header, body = payload[:1], payload[1:]
+    if header == _ZLIB:
+        body = zlib.decompress(body)
+    return _decode(json.loads(body.decode("utf-8")))
+
+
+def build_key(key: StorageKey) -> str:
+    """Flatten a StorageKey into a row key"""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id:
+        parts.append(f"t{key.thread_id}")
+    business_connection_id = getattr(key, "business_connection_id", None)
+    if business_connection_id:
+        parts.append(f"b{business_connection_id}")
+    parts.append(key.destiny)
+    return ":".join(parts)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    aiogram FSM storage backed by the fsm_storage table
+
+    Writes are buffered for flush_interval and upserted in one batch, so the
+    set_state + update_data pair of a handler becomes a single row write.
+    Reads see local writes first, both pending ones and the batch being
+    written, which is only dropped once its transaction has committed.
+    Every write refreshes the row's
+    expires_at; expired rows read as empty and are removed by purge_expired().
+
+    A failed batch is requeued (newer local writes win) and retried in the
+    background with exponential backoff; background flushes never raise.
+    close() waits for a batch in flight and flushes what is left.
+
+    Buffered writes are invisible to other processes until flushed, so
+    buffering is only safe while every update of a chat is handled by the
+    same process. With several bot processes set flush_interval to 0
+    (FSM_FLUSH_INTERVAL_MS=0): every write is then flushed before the
+    storage call returns.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker = async_session_maker,
+        ttl: int = FSM_TTL_SECONDS,
+        state_ttl: Optional[Dict[str, int]] = None,
+        flush_interval: float = FSM_FLUSH_INTERVAL_MS / 1000,
+        max_batch: int = 500
+    ):
+        self.session_maker = session_maker
+        self.ttl = ttl
+        self.state_ttl = state_ttl or {}
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        # key -> {"state": ..., "data": ..., "ttl": ...}; missing field = unchanged
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, Dict[str, Any]] = {}  # Batch being written, same shape
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+        self._failures = 0
+
+    def _ttl_for(self, state: Any) -> int:
+        if isinstance(state, str):
+            return self.state_ttl.get(state, self.ttl)
+        return self.ttl
+
+    async def _write(self, key: StorageKey, **fields):
+        row_key = build_key(key)
+        pending = self._pending.setdefault(row_key, {})
+        pending.update(fields)
+
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif len(self._pending) >= self.max_batch:
+            self._spawn(self._flush_later(0))
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._spawn(self._flush_later(self.flush_interval))
+
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Background flush task, tracked so close() can wait for it"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        # Cancelling the task (close()) must not abort a batch halfway
+        await asyncio.shield(self._flush_quietly())
+
+    async def _flush_quietly(self):
+        """Flush from a background task; flush() already logged and rescheduled a failure"""
+        try:
+            await self.flush()
+        except Exception:
+            pass
+
+    def _schedule_retry(self):
+        self._failures += 1
+        delay = min(_RETRY_BASE_SECONDS * 2 ** (self._failures - 1), _RETRY_MAX_SECONDS)
+        self._flush_task = self._spawn(self._flush_later(delay))
+        return delay
+
+    async def flush(self):
+        """
+        Write all pending changes in one transaction
+
+        Raises:
+            The database error; the batch is requeued and a retry scheduled
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            now = datetime.utcnow()
+
+            deletes = []
+            upserts = {"state": [], "data": [], "both": []}
+            for row_key, fields in batch.items():
+                has_state = "state" in fields
+                has_data = "data" in fields
+
+                if has_state and has_data and fields["state"] is None and not fields["data"]:
+                    deletes.append(row_key)
+                    continue
+
+                row = {
+                    "key": row_key,
+                    "state": fields.get("state"),
+                    "data": dumps(fields["data"]) if has_data else None,
+                    "expires_at": now + timedelta(seconds=fields.get("ttl", self.ttl)),
+                    "updated_at": now
+                }
+                group = "both" if has_state and has_data else "state" if has_state else "data"
+                upserts[group].append(row)
+
+            committed = False
+            try:
+                async with self.session_maker() as session:
+                    async with session.begin():
+                        if deletes:
+                            await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+
+                        for group, rows in upserts.items():
+                            if not rows:
+                                continue
+                            stmt = insert(FSMRecord)
+                            columns = {"expires_at": stmt.excluded.expires_at, "updated_at": stmt.excluded.updated_at}
+                            if group in ("state", "both"):
+                                columns["state"] = stmt.excluded.state
+                            if group in ("data", "both"):
+                                columns["data"] = stmt.excluded.data
+                            await session.execute(
+                                stmt.on_conflict_do_update(index_elements=[FSMRecord.key], set_=columns),
+                                rows
+                            )
+                committed = True
+            except Exception as e:
+                delay = self._schedule_retry()
+                logger.error(f"❌ FSM flush failed ({len(batch)} keys), retrying in {delay:.1f}s: {e}")
+                raise
+            finally:
+                if not committed:
+                    # Also on cancellation; newer writes made during the flush win
+                    for row_key, fields in batch.items():
+                        self._pending[row_key] = {**fields, **self._pending.get(row_key, {})}
+                self._inflight = {}
+
+            self._failures = 0
+
+    def _buffered(self, key: StorageKey, field: str) -> Tuple[bool, Any]:
+        """(True, value) if a local write not yet committed holds field, else (False, None)"""
+        row_key = build_key(key)
+        for buffer in (self._pending, self._inflight):
+            fields = buffer.get(row_key)
+            if fields and field in fields:
+                return True, fields[field]
+        return False, None
+
+    async def _load(self, key: StorageKey) -> Optional[FSMRecord]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(FSMRecord)
+                .where(FSMRecord.key == build_key(key))
+                .where(FSMRecord.expires_at > datetime.utcnow())
+            )
+            return result.scalar_one_or_none()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self._write(key, state=state, ttl=self._ttl_for(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        found, state = self._buffered(key, "state")
+        if found:
+            return state
+        record = await self._load(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        fields = {"data": dict(data)}
+        pending = self._pending.get(build_key(key), {})
+        if "ttl" not in pending:
+            fields["ttl"] = self.ttl
+        await self._write(key, **fields)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        found, data = self._buffered(key, "data")
+        if found:
+            return dict(data)
+        record = await self._load(key)
+        return loads(record.data) if record else {}
+
+    async def purge_expired(self, limit: int = 1000) -> int:
+        """Delete up to `limit` expired rows, returns how many were removed"""
+        async with self.session_maker() as session:
+            async with session.begin():
+                expired = (
+                    select(FSMRecord.key)
+                    .where(FSMRecord.expires_at <= datetime.utcnow())
+                    .limit(limit)
+                    .scalar_subquery()
+                )
+                result = await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(expired)))
+                return result.rowcount or 0
+
+    async def close(self) -> None:
+        # Sleeping flushes are cancelled; one already writing is shielded and holds the lock
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush()
+        # A retry scheduled by a failure during shutdown has nothing left to write
+        for task in list(self._tasks):
+            task.cancel()
+
+
+class TTLMemoryStorage(MemoryStorage):
+    """MemoryStorage that forgets contexts idle for longer than ttl seconds"""
+
+    def __init__(self, ttl: int = FSM_TTL_SECONDS):
+        super().__init__()
+        self.ttl = ttl
+        self._touched: Dict[StorageKey, float] = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        self._touched[key] = time.monotonic()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await super().set_data(key, data)
+        self._touched[key] = time.monotonic()
+
+    async def purge_expired(self, limit: Optional[int] = None) -> int:
+        """Drop idle contexts (and empty records created by reads)"""
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, touched in self._touched.items() if touched < cutoff]
+        expired += [
+            key for key, record in self.storage.items()
+            if key not in self._touched and record.state is None and not record.data
+        ]
+        if limit is not None:
+            expired = expired[:limit]
+
+        for key in expired:
+            self.storage.pop(key, None)
+            self._touched.pop(key, None)
+        return len(expired)
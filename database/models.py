@@ -1,7 +1,9 @@
-from datetime import datetime
-from sqlalchemy import BigInteger, String, Integer, Numeric, Boolean, Text, DateTime, Enum as SQLEnum, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from datetime import date, datetime
+from sqlalchemy import BigInteger, String, Integer, Boolean, DateTime, Date, LargeBinary, Enum as SQLEnum, ForeignKey, Index, CheckConstraint, UniqueConstraint, event
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from database.types import Money
+from utils.money import unit_price
 import enum
 import uuid
 
@@ -31,17 +33,27 @@ class Session(Base):
     creator_first_name: Mapped[str] = mapped_column(String(255))
     
     restaurant_name: Mapped[str] = mapped_column(String(255), nullable=True)
-    total_amount: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)
+    total_amount: Mapped[int] = mapped_column(Money, nullable=True)
     receipt_image_id: Mapped[str] = mapped_column(String(255))
-    receipt_text: Mapped[str] = mapped_column(Text)
+    
+    # Parsed receipt document (see services/receipt_store.py)
+    receipt_data: Mapped[dict] = mapped_column(JSONB, nullable=True)
+    receipt_schema_version: Mapped[int] = mapped_column(Integer, nullable=True)
     
     card_number: Mapped[str] = mapped_column(String(20), nullable=True)
     participant_count: Mapped[int] = mapped_column(Integer, nullable=True)
     has_delivery: Mapped[bool] = mapped_column(Boolean, default=False)
     
     # NEW: Calculated totals
-    shared_total: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)  # Total of shared meals
-    individual_total: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)  # Total of individual meals
+    shared_total: Mapped[int] = mapped_column(Money, nullable=True)  # Total of shared meals
+    individual_total: Mapped[int] = mapped_column(Money, nullable=True)  # Total of individual meals
+    
+    # Pinned live board in a group chat (see services/session_board.py)
+    board_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    board_message_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    
+    # Bumped by every settlement write; cached ledgers of another version are stale
+    settlement_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     
     status: Mapped[SessionStatus] = mapped_column(SQLEnum(SessionStatus), default=SessionStatus.CREATING)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -51,6 +63,27 @@ class Session(Base):
     meals: Mapped[list["Meal"]] = relationship("Meal", back_populates="session", cascade="all, delete-orphan")
     participants: Mapped[list["SessionParticipant"]] = relationship("SessionParticipant", back_populates="session", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Containment search over parsed receipts: receipt_data @> '{"items": [{"name": "..."}]}'
+        Index(
+            "ix_sessions_receipt_data",
+            "receipt_data",
+            postgresql_using="gin",
+            postgresql_ops={"receipt_data": "jsonb_path_ops"}
+        ),
+        # Fuzzy restaurant lookup (ILIKE '%...%'), needs pg_trgm
+        Index(
+            "ix_sessions_restaurant_name_trgm",
+            "restaurant_name",
+            postgresql_using="gin",
+            postgresql_ops={"restaurant_name": "gin_trgm_ops"}
+        ),
+        # Lifecycle scans: archival of old COMPLETED sessions
+        Index("ix_sessions_status_updated_at", "status", "updated_at"),
+        # Netting groups: the sessions posted to one board chat
+        Index("ix_sessions_board_chat_id", "board_chat_id"),
+    )
+    
     def __repr__(self):
         return f"<Session {self.id} - {self.restaurant_name}>"
 
@@ -71,11 +104,14 @@ class SessionParticipant(Base):
     # NEW: Payment tracking
     payment_status: Mapped[PaymentStatus] = mapped_column(SQLEnum(PaymentStatus), default=PaymentStatus.PENDING)
     paid_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    reminder_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Payment reminders sent so far
+    last_reminded_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     
     # NEW: Calculated amounts
-    individual_total: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)  # User's individual meals
-    shared_portion: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)  # User's share of shared meals
-    total_amount: Mapped[float] = mapped_column(Numeric(10, 2), nullable=True)  # individual_total + shared_portion
+    individual_total: Mapped[int] = mapped_column(Money, nullable=True)  # User's individual meals
+    shared_portion: Mapped[int] = mapped_column(Money, nullable=True)  # User's share of shared meals
+    total_amount: Mapped[int] = mapped_column(Money, nullable=True)  # individual_total + shared_portion
+    rolled_up_amount: Mapped[int] = mapped_column(Money, nullable=True)  # Part of total_amount already in user_spending_rollups
     
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
@@ -83,6 +119,15 @@ class SessionParticipant(Base):
     session: Mapped["Session"] = relationship("Session", back_populates="participants")
     selections: Mapped[list["UserMealSelection"]] = relationship("UserMealSelection", back_populates="participant", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # One row per user per session; deep-link joins upsert against it
+        UniqueConstraint("session_id", "user_id", name="uq_session_participants_session_user"),
+        # Reminder scans: pending debts joined to their sessions (services/reminder_service.py)
+        Index("ix_session_participants_payment_status_session", "payment_status", "session_id"),
+        # My Sessions keyset pages: WHERE user_id = ? AND (created_at, id) < (?, ?) (services/history_service.py)
+        Index("ix_session_participants_user_created_id", "user_id", "created_at", "id"),
+    )
+    
     def __repr__(self):
         return f"<Participant {self.first_name} - Session {self.session_id}>"
 
@@ -94,8 +139,10 @@ class Meal(Base):
     session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"))
     
     name: Mapped[str] = mapped_column(String(255))
-    price: Mapped[float] = mapped_column(Numeric(10, 2))
+    price: Mapped[int] = mapped_column(Money)  # Line total for all units, in tiyin
     quantity_available: Mapped[int] = mapped_column(Integer, default=1)
+    unit_price: Mapped[int] = mapped_column(Money)  # price / quantity_available, kept in sync on flush
+    claimed: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Units reserved by confirmed participants
     
     is_shared: Mapped[bool] = mapped_column(Boolean, default=False)
     is_delivery: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -107,6 +154,18 @@ class Meal(Base):
     session: Mapped["Session"] = relationship("Session", back_populates="meals")
     selections: Mapped[list["UserMealSelection"]] = relationship("UserMealSelection", back_populates="meal", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Fuzzy item search (ILIKE '%лагман%'), needs pg_trgm
+        Index(
+            "ix_meals_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+        # Last line of defence behind services/claim_service.py
+        CheckConstraint("claimed >= 0 AND claimed <= quantity_available", name="ck_meals_claimed_range"),
+    )
+    
     def __repr__(self):
         return f"<Meal {self.name} - {self.price}>"
 
@@ -126,4 +185,132 @@ class UserMealSelection(Base):
     participant: Mapped["SessionParticipant"] = relationship("SessionParticipant", back_populates="selections")
     
     def __repr__(self):
-        return f"<Selection Meal:{self.meal_id} Qty:{self.quantity_selected}>"
\ No newline at end of file
+        return f"<Selection Meal:{self.meal_id} Qty:{self.quantity_selected}>"
+
+
+class ArchivedSession(Base):
+    """Completed session moved out of the hot tables (see services/archive_service.py)"""
+    __tablename__ = "archived_sessions"
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    creator_user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    restaurant_name: Mapped[str] = mapped_column(String(255), nullable=True)
+    total_amount: Mapped[int] = mapped_column(Money, nullable=True)
+    
+    # Full snapshot: session columns, meals, participants with their selections
+    payload: Mapped[dict] = mapped_column(JSONB)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    completed_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    members: Mapped[list["ArchivedSessionMember"]] = relationship("ArchivedSessionMember", back_populates="session", cascade="all, delete-orphan")
+    
+    def __repr__(self):
+        return f"<ArchivedSession {self.id} - {self.restaurant_name}>"
+
+
+class ArchivedSessionMember(Base):
+    """Per-user index into archived sessions, so history stays queryable by user"""
+    __tablename__ = "archived_session_members"
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("archived_sessions.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    first_name: Mapped[str] = mapped_column(String(255))
+    is_creator: Mapped[bool] = mapped_column(Boolean, default=False)
+    
+    total_amount: Mapped[int] = mapped_column(Money, nullable=True)
+    payment_status: Mapped[PaymentStatus] = mapped_column(SQLEnum(PaymentStatus), default=PaymentStatus.PENDING)
+    paid_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # When the participant joined
+    
+    session: Mapped["ArchivedSession"] = relationship("ArchivedSession", back_populates="members")
+    
+    __table_args__ = (
+        Index("ix_archived_session_members_user_session", "user_id", "session_id"),
+        # Same keyset order as ix_session_participants_user_created_id
+        Index("ix_archived_session_members_user_created_id", "user_id", "created_at", "id"),
+    )
+    
+    def __repr__(self):
+        return f"<ArchivedMember {self.first_name} - Session {self.session_id}>"
+
+
+class DebtTransfer(Base):
+    """
+    Netted transfer between two members of a board group (see services/netting_service.py)
+    
+    Confirmed transfers give the payer credit in the group. Credit is spent
+    on the payer's pending participant debts as soon as it covers one; each
+    debt cleared that way is recorded as an allocation row (participant_id
+    set), which moves the credit on to the debt's creditor. When no credit
+    is left anywhere, the rows are marked settled.
+    """
+    __tablename__ = "debt_transfers"
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    group_chat_id: Mapped[int] = mapped_column(BigInteger)  # sessions.board_chat_id
+    debtor_user_id: Mapped[int] = mapped_column(BigInteger)
+    creditor_user_id: Mapped[int] = mapped_column(BigInteger)
+    amount: Mapped[int] = mapped_column(Money)
+    # Allocation rows: the session_participants debt this credit cleared (no FK, archival deletes those rows)
+    participant_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    
+    status: Mapped[PaymentStatus] = mapped_column(SQLEnum(PaymentStatus), default=PaymentStatus.PAID)
+    settled: Mapped[bool] = mapped_column(Boolean, default=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    confirmed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_debt_transfers_group_settled", "group_chat_id", "settled"),
+    )
+    
+    def __repr__(self):
+        return f"<DebtTransfer {self.debtor_user_id} -> {self.creditor_user_id} {self.amount}>"
+
+
+class UserSpendingRollup(Base):
+    """Spending per user × month × restaurant, kept in step with participant totals (see services/spending_service.py)"""
+    __tablename__ = "user_spending_rollups"
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    month: Mapped[date] = mapped_column(Date)  # First day of the session's month
+    restaurant_key: Mapped[str] = mapped_column(String(255))  # Normalized name, "" when unknown
+    restaurant_name: Mapped[str] = mapped_column(String(255), nullable=True)
+    
+    total_amount: Mapped[int] = mapped_column(Money, default=0)
+    session_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Upsert target, and the /stats scan: WHERE user_id = ? AND month >= ?
+        UniqueConstraint("user_id", "month", "restaurant_key", name="uq_user_spending_rollups_user_month_restaurant"),
+    )
+    
+    def __repr__(self):
+        return f"<UserSpendingRollup {self.user_id} {self.month} {self.restaurant_key}>"
+
+
+class FSMRecord(Base):
+    """aiogram FSM state/data row (see database/fsm_storage.py)"""
+    __tablename__ = "fsm_storage"
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)  # fsm_storage.dumps()
+    
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<FSMRecord {self.key} - {self.state}>"
+
+
+@event.listens_for(Meal, "before_insert")
+@event.listens_for(Meal, "before_update")
+def _sync_meal_unit_price(mapper, connection, target: Meal):
+    """Precompute unit price so keyboards and calculators never divide"""
+    quantity = target.quantity_available if target.quantity_available is not None else 1
+    target.unit_price = unit_price(target.price, quantity)
\ No newline at end of file
@@ -0,0 +1,28 @@
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+
+class Money(TypeDecorator):
+    """
+    Fixed-point money column stored as integer minor units (tiyin)
+
+    Only Python ints are accepted, so a stray float or Decimal fails
+    loudly at flush time instead of silently drifting.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError(
+                f"Money columns take integer minor units, got {type(value).__name__}"
+            )
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return int(value)
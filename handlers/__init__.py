@@ -1,6 +1,13 @@
 from handlers.start import router as start_router
+from handlers.join import router as join_router
+from handlers.board import router as board_router
 from handlers.receipt_upload import router as receipt_router
 from handlers.session_setup import router as session_setup_router
 from handlers.meal_selection import router as meal_selection_router
+from handlers.callback_dispatch import router as callback_router
+from handlers.debts import router as debts_router
+from handlers.payments import router as payments_router
+from handlers.history import router as history_router
+from handlers.stats import router as stats_router
 
-__all__ = ['start_router', 'receipt_router', 'session_setup_router', 'meal_selection_router']
\ No newline at end of file
+__all__ = ['start_router', 'join_router', 'board_router', 'receipt_router', 'session_setup_router', 'meal_selection_router', 'callback_router', 'debts_router', 'payments_router', 'history_router', 'stats_router']
\ No newline at end of file
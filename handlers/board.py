@@ -0,0 +1,133 @@
+from aiogram import Router, F
+from aiogram.filters import CommandStart, CommandObject
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+from sqlalchemy import select, update, delete
+from database.models import Session as DBSession, SessionParticipant, UserMealSelection, SessionStatus, PaymentStatus
+from database.connection import async_session_maker
+from services.session_snapshot import snapshots
+from services.session_board import boards
+from services.history_service import history
+from services.calculation_service import apply_selection_changes, ledgers
+from services.netting_service import debt_network
+from services.claim_service import claim_units
+from handlers.join import join_participant
+from handlers.callback_dispatch import callback_handler
+from utils import format_amount, Op, BOARD_PREFIX, parse_start_payload
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+@router.message(
+    CommandStart(deep_link=True, magic=F.args.startswith(BOARD_PREFIX)),
+    F.chat.type.in_({"group", "supergroup"})
+)
+async def post_board(message: Message, command: CommandObject):
+    """Creator picked a group from the board link: /start b<token>"""
+    session_id = parse_start_payload(command.args, BOARD_PREFIX)
+    snapshot = await snapshots.get(session_id) if session_id else None
+
+    if snapshot is None or snapshot.status != SessionStatus.SELECTING:
+        await message.answer("❌ Sessiya topilmadi yoki allaqachon yopilgan.")
+        return
+
+    if snapshot.creator_user_id != message.from_user.id:
+        await message.answer("⚠️ Faqat sessiya yaratuvchisi boardni joylay oladi.")
+        return
+
+    try:
+        await boards.post(message.bot, message.chat.id, session_id)
+        debt_network.reset()  # The session's debts now net within this chat's group
+    except Exception as e:
+        logger.error(f"Error posting board for {session_id}: {e}", exc_info=True)
+        await message.answer("❌ Xatolik yuz berdi.")
+
+
+@callback_handler(Op.BOARD_CLAIM)
+async def board_claim(callback: CallbackQuery, state: FSMContext, session_id: uuid.UUID, meal_id: int):
+    """
+    Claim one unit of a meal from the group board, or release it
+
+    Each tap is its own short transaction: the unit is reserved with the
+    same conditional UPDATE as private-chat confirmation, so board taps and
+    private confirmations cannot oversell a meal. The board itself is only
+    re-rendered by the debounced scheduler.
+    """
+    snapshot = await snapshots.get(session_id)
+    if snapshot is None or snapshot.status != SessionStatus.SELECTING:
+        await callback.answer("Sessiya yopilgan", show_alert=True)
+        return
+
+    meal = next((m for m in snapshot.individual_meals if m.id == meal_id), None)
+    if meal is None:
+        await callback.answer("⚠️ Menyu o'zgargan.", show_alert=True)
+        return
+
+    try:
+        participant = await join_participant(snapshot, callback.from_user)
+    except Exception as e:
+        logger.error(f"Error joining session {session_id} from board: {e}", exc_info=True)
+        await callback.answer("Xatolik yuz berdi", show_alert=True)
+        return
+
+    if participant.payment_status != PaymentStatus.PENDING:
+        # A paid share is frozen: changing it would move a settled amount
+        await callback.answer("To'lov belgilangan, tanlovni o'zgartirib bo'lmaydi.", show_alert=True)
+        return
+
+    async with async_session_maker() as session:
+        try:
+            db_session = (await session.execute(
+                select(DBSession).where(DBSession.id == session_id)
+            )).scalar_one()
+
+            current = (await session.execute(
+                select(UserMealSelection)
+                .where(UserMealSelection.participant_id == participant.id)
+                .where(UserMealSelection.meal_id == meal_id)
+            )).scalars().first()
+
+            if current is not None:
+                # Second tap by a claimer gives the units back
+                await claim_units(session, session_id, meal_id, -current.quantity_selected)
+                await session.execute(
+                    delete(UserMealSelection)
+                    .where(UserMealSelection.participant_id == participant.id)
+                    .where(UserMealSelection.meal_id == meal_id)
+                )
+                changes = [(participant.id, meal_id, 0)]
+            else:
+                if not await claim_units(session, session_id, meal_id, 1):
+                    await session.rollback()
+                    await callback.answer(f"❌ {meal.name} qolmagan", show_alert=True)
+                    return
+                session.add(UserMealSelection(meal_id=meal_id, participant_id=participant.id, quantity_selected=1))
+                changes = [(participant.id, meal_id, 1)]
+
+            await session.execute(
+                update(SessionParticipant)
+                .where(SessionParticipant.id == participant.id)
+                .values(has_confirmed=True)
+            )
+
+            amounts = await apply_selection_changes(session, db_session, changes, joined=[participant.id])
+            await session.commit()
+
+        except Exception as e:
+            ledgers.invalidate(session_id)
+            debt_network.reset()
+            logger.error(f"Error claiming meal {meal_id} from board: {e}", exc_info=True)
+            await callback.answer("Xatolik yuz berdi", show_alert=True)
+            return
+
+    total = amounts[participant.id]['total_amount'] if participant.id in amounts else participant.total_amount or 0
+    action = "bekor qilindi" if current is not None else "sizniki"
+    await callback.answer(f"{meal.name} {action}. To'lash kerak: {format_amount(total)} so'm")
+
+    boards.schedule(callback.bot, session_id)
+    history.invalidate(callback.from_user.id, snapshot.creator_user_id)
+    logger.info(f"📌 User {callback.from_user.id} {'released' if current is not None else 'claimed'} meal {meal_id} in session {session_id}")
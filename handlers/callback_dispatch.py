@@ -0,0 +1,56 @@
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+from aiogram import Router
+from aiogram.types import CallbackQuery
+from aiogram.fsm.context import FSMContext
+from utils import unpack, CallbackDecodeError
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+# op code (or (op code, first field)) -> handler(callback, state, *fields)
+_handlers: Dict[Hashable, Callable[..., Awaitable]] = {}
+
+
+def callback_handler(op: str, first_field: Optional[str] = None):
+    """
+    Register a handler for one callback op
+
+    Instead of one F.data filter per handler, evaluated in turn across all
+    routers, every callback goes through dispatch_callback below: the
+    payload is decoded once and the handler is a single dict lookup.
+    Decoded fields are passed positionally after (callback, state).
+
+    Ops shared by several screens (pagination) register per value of their
+    first field, e.g. callback_handler(Op.PAGE, SELECTION).
+    """
+    key = op if first_field is None else (op, first_field)
+
+    def register(func: Callable[..., Awaitable]):
+        if key in _handlers:
+            raise ValueError(f"Callback {key!r} already handled by {_handlers[key].__name__}")
+        _handlers[key] = func
+        return func
+    return register
+
+
+@router.callback_query()
+async def dispatch_callback(callback: CallbackQuery, state: FSMContext):
+    """Decode the packed callback data and route it by op code"""
+    try:
+        payload = unpack(callback.data or "")
+    except CallbackDecodeError as e:
+        logger.warning(f"⚠️ Stale callback from user {callback.from_user.id}: {e}")
+        await callback.answer("⚠️ Bu tugma eskirgan. Iltimos, qaytadan boshlang.")
+        return
+
+    handler = _handlers.get(payload.op)
+    if handler is None and payload.args:
+        handler = _handlers.get((payload.op, payload.args[0]))
+    if handler is None:
+        logger.warning(f"⚠️ No handler for callback op {payload.op!r}")
+        await callback.answer()
+        return
+
+    await handler(callback, state, *payload.args)
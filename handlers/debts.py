@@ -0,0 +1,184 @@
+from datetime import datetime
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update
+from database.models import DebtTransfer, PaymentStatus
+from database.connection import async_session_maker
+from keyboards import get_transfer_paid_keyboard, get_confirm_transfer_keyboard
+from services.netting_service import load_debt_network, debt_network, apply_transfers, Transfer
+from services.reminder_service import reminders
+from services.session_board import boards
+from services.history_service import history
+from services.session_snapshot import snapshots
+from services.archive_service import complete_settled_sessions
+from handlers.callback_dispatch import callback_handler
+from utils import format_amount, Op
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+@router.message(Command("debts"))
+async def debts_command(message: Message):
+    """Show the netted transfer plan of every board group the user is part of"""
+    user_id = message.from_user.id
+    network = await load_debt_network()
+    plans = network.plan_for(user_id)
+
+    shown = 0
+    for group, plan in plans.items():
+        my_transfers = [t for t in plan if user_id in (t.debtor, t.creditor)]
+        if not my_transfers:
+            continue
+
+        lines = [f"🔄 <b>Qarzlar hisob-kitobi</b>\n🏪 {', '.join(sorted(network.labels[group]))}\n"]
+        to_pay = []
+        for transfer in my_transfers:
+            if transfer.debtor == user_id:
+                name = network.names.get(transfer.creditor, "?")
+                card = network.cards.get(transfer.creditor)
+                card_line = f"\n   💳 <code>{card}</code>" if card else ""
+                lines.append(f"➡️ Siz <b>{name}</b>ga {format_amount(transfer.amount)} so'm o'tkazasiz{card_line}")
+                to_pay.append((transfer.creditor, name, transfer.amount))
+            else:
+                name = network.names.get(transfer.debtor, "?")
+                lines.append(f"⬅️ <b>{name}</b> sizga {format_amount(transfer.amount)} so'm o'tkazadi")
+
+        lines.append(
+            f"\nGuruh bo'yicha {network.debts_in_group(group)} ta qarz o'rniga "
+            f"{len(plan)} ta o'tkazma yetarli."
+        )
+        await message.answer(
+            "\n".join(lines),
+            reply_markup=get_transfer_paid_keyboard(group, to_pay) if to_pay else None
+        )
+        shown += len(my_transfers)
+
+    if not shown:
+        await message.answer("✅ Sizda guruhlar bo'yicha ochiq qarzlar yo'q.")
+        return
+    logger.info(f"🔄 Debt plans for user {user_id}: {shown} transfers in {len(plans)} groups")
+
+
+@callback_handler(Op.TRANSFER_PAID)
+async def transfer_paid(callback: CallbackQuery, state: FSMContext, group_chat_id: int, creditor_user_id: int, amount: int):
+    """Debtor says a netted transfer was sent; recorded as PAID until the creditor confirms"""
+    user_id = callback.from_user.id
+    network = await load_debt_network()
+    if Transfer(user_id, creditor_user_id, amount) not in network.plan(group_chat_id):
+        await callback.answer("⚠️ Reja o'zgargan, /debts ni qayta oching.", show_alert=True)
+        return
+
+    async with async_session_maker() as session:
+        try:
+            waiting = (await session.execute(
+                select(DebtTransfer.id)
+                .where(DebtTransfer.group_chat_id == group_chat_id)
+                .where(DebtTransfer.debtor_user_id == user_id)
+                .where(DebtTransfer.creditor_user_id == creditor_user_id)
+                .where(DebtTransfer.status == PaymentStatus.PAID)
+                .limit(1)
+            )).scalar_one_or_none()
+            if waiting is not None:
+                await callback.answer("Bu to'lov allaqachon belgilangan.", show_alert=True)
+                return
+
+            transfer = DebtTransfer(
+                group_chat_id=group_chat_id,
+                debtor_user_id=user_id,
+                creditor_user_id=creditor_user_id,
+                amount=amount,
+                status=PaymentStatus.PAID
+            )
+            session.add(transfer)
+            await session.commit()
+
+        except Exception as e:
+            logger.error(f"Error recording transfer {user_id} -> {creditor_user_id}: {e}", exc_info=True)
+            await callback.answer("Xatolik yuz berdi", show_alert=True)
+            return
+
+    name = network.names.get(creditor_user_id, "?")
+    await callback.message.edit_text(
+        f"{callback.message.html_text}\n\n💸 <i>{name}: to'landi, tasdiq kutilmoqda</i>",
+        reply_markup=callback.message.reply_markup
+    )
+    await callback.answer("✅ Belgilandi")
+
+    try:
+        await callback.bot.send_message(
+            creditor_user_id,
+            f"💸 <b>{network.names.get(user_id, callback.from_user.first_name)}</b> "
+            f"{format_amount(amount)} so'm o'tkazganini belgiladi\n"
+            f"🏪 {', '.join(sorted(network.labels[group_chat_id]))}",
+            reply_markup=get_confirm_transfer_keyboard(transfer.id)
+        )
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        logger.info(f"Creditor {creditor_user_id} not reachable: {e}")
+
+    logger.info(f"💸 Transfer {transfer.id} marked paid in group {group_chat_id}")
+
+
+@callback_handler(Op.TRANSFER_CONFIRM)
+async def confirm_transfer(callback: CallbackQuery, state: FSMContext, transfer_id: int):
+    """
+    Creditor confirms a netted transfer arrived: PAID -> CONFIRMED
+
+    Every pending debt in the group that confirmed transfers now cover is
+    cleared in the same transaction (see apply_transfers()), so sessions
+    complete without waiting for the whole group to net to zero.
+    """
+    async with async_session_maker() as session:
+        try:
+            transfer = (await session.execute(
+                update(DebtTransfer)
+                .where(DebtTransfer.id == transfer_id)
+                .where(DebtTransfer.creditor_user_id == callback.from_user.id)
+                .where(DebtTransfer.status == PaymentStatus.PAID)
+                .values(status=PaymentStatus.CONFIRMED, confirmed_at=datetime.utcnow())
+                .returning(DebtTransfer)
+            )).scalar_one_or_none()
+
+            if transfer is None:
+                await callback.answer("Bu to'lov allaqachon tasdiqlangan.", show_alert=True)
+                return
+
+            cleared = await apply_transfers(session, transfer.group_chat_id)
+            completed = await complete_settled_sessions(session, {row[3] for row in cleared})
+            await session.commit()
+
+        except Exception as e:
+            logger.error(f"Error confirming transfer {transfer_id}: {e}", exc_info=True)
+            await callback.answer("Xatolik yuz berdi", show_alert=True)
+            return
+
+    if cleared:
+        debt_network.reset()
+        for participant_id, user_id, creator_user_id, session_id in cleared:
+            reminders.cancel(participant_id)
+            history.invalidate(user_id, creator_user_id)
+        for session_id in completed:
+            snapshots.invalidate(session_id)
+        for session_id in {row[3] for row in cleared}:
+            boards.schedule(callback.bot, session_id)
+    else:
+        debt_network.record_transfer(transfer)
+
+    await callback.message.edit_text(f"{callback.message.html_text}\n\n✅ <i>Tasdiqlandi</i>")
+    await callback.answer("✅ Tasdiqlandi")
+
+    settled_line = f"\n🧾 {len(cleared)} ta qarz yopildi." if cleared else ""
+    try:
+        await callback.bot.send_message(
+            transfer.debtor_user_id,
+            f"✅ {format_amount(transfer.amount)} so'mlik o'tkazmangiz tasdiqlandi. Rahmat!{settled_line}"
+        )
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        logger.info(f"Debtor {transfer.debtor_user_id} not reachable: {e}")
+
+    logger.info(f"✅ Transfer {transfer_id} confirmed in group {transfer.group_chat_id}, {len(cleared)} debts cleared")
@@ -0,0 +1,85 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
+from database.models import PaymentStatus
+from keyboards import build_history_keyboard
+from services.history_service import history, HistoryPage, Cursor, FIRST_PAGE, HOT, ARCHIVE
+from handlers.callback_dispatch import callback_handler
+from utils import format_amount, Op
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+_STATUS_MARKS = {
+    "creating": "📝",
+    "selecting": "🟢",
+    "completed": "✔️",
+    "archived": "🗄"
+}
+
+_PAYMENT_LABELS = {
+    PaymentStatus.PENDING: "⏳ to'lanmagan",
+    PaymentStatus.PAID: "💸 to'landi",
+    PaymentStatus.CONFIRMED: "✅ tasdiqlangan"
+}
+
+
+def format_history_page(page: HistoryPage) -> str:
+    if not page.entries:
+        return "📋 Sizda hali sessiyalar yo'q.\n\nBoshlash uchun <b>📸 New Receipt</b> tugmasini bosing!"
+
+    lines = ["📋 <b>Mening sessiyalarim</b>"]
+    for entry in page.entries:
+        lines.append(
+            f"\n{_STATUS_MARKS.get(entry.status, '•')} <b>{entry.restaurant_name or 'Nomsiz'}</b>"
+            f" · {entry.created_at:%d.%m.%Y}"
+        )
+        lines.append(f"   💰 Check: {format_amount(entry.session_total or 0)} so'm")
+        if entry.is_creator:
+            lines.append(
+                f"   👑 Sizga qarz: {format_amount(entry.owed_to_me)} so'm"
+                f" · to'langan: {format_amount(entry.paid_to_me)} so'm"
+            )
+        else:
+            lines.append(
+                f"   💵 Siz: {format_amount(entry.my_amount or 0)} so'm"
+                f" · {_PAYMENT_LABELS.get(entry.my_payment_status, '')}"
+            )
+    return "\n".join(lines)
+
+
+@router.message(F.text == "📋 My Sessions")
+@router.message(Command("history"))
+async def my_sessions(message: Message, state: FSMContext):
+    """First page of the user's session history, usually from the cache"""
+    page = await history.get_page(message.from_user.id)
+    await message.answer(
+        format_history_page(page),
+        reply_markup=build_history_keyboard(None, page.next_cursor)
+    )
+    logger.info(f"📋 History for user {message.from_user.id}: {len(page.entries)} sessions")
+
+
+@callback_handler(Op.HISTORY_PAGE)
+async def history_page(callback: CallbackQuery, state: FSMContext, phase: str, created_at_us: int, row_id: int):
+    if phase not in (HOT, ARCHIVE):
+        await callback.answer("⚠️ Bu tugma eskirgan.")
+        return
+
+    cursor = Cursor(phase, created_at_us, row_id)
+    page = await history.get_page(callback.from_user.id, cursor)
+    first_cursor = None if cursor == FIRST_PAGE else FIRST_PAGE
+
+    try:
+        await callback.message.edit_text(
+            format_history_page(page),
+            reply_markup=build_history_keyboard(first_cursor, page.next_cursor)
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
@@ -0,0 +1,105 @@
+from aiogram import Router, F
+from aiogram.filters import CommandStart, CommandObject
+from aiogram.types import Message
+from aiogram.fsm.context import FSMContext
+from sqlalchemy.dialects.postgresql import insert
+from database.models import SessionParticipant, SessionStatus
+from database.connection import async_session_maker
+from states.receipt_states import ReceiptStates
+from keyboards import build_meal_selection_keyboard, get_main_menu_keyboard
+from services.session_snapshot import snapshots, SessionSnapshot
+from services.history_service import history
+from utils import format_amount, MealSelection, JOIN_PREFIX, parse_start_payload
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+async def join_participant(snapshot: SessionSnapshot, user) -> SessionParticipant:
+    """
+    Single upsert for the joiner's participant row
+
+    Repeated taps on the link hit the (session_id, user_id) unique
+    constraint and return the existing row instead of a duplicate.
+    """
+    async with async_session_maker() as session:
+        stmt = insert(SessionParticipant).values(
+            session_id=snapshot.id,
+            user_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            is_creator=False,
+            has_confirmed=False
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_session_participants_session_user",
+            set_={"username": stmt.excluded.username, "first_name": stmt.excluded.first_name}
+        ).returning(SessionParticipant)
+        participant = (await session.execute(stmt)).scalar_one()
+        await session.commit()
+        return participant
+
+
+@router.message(
+    CommandStart(deep_link=True, magic=F.args.startswith(JOIN_PREFIX)),
+    F.chat.type == "private"
+)
+async def join_session(message: Message, state: FSMContext, command: CommandObject):
+    """Participant opened a session link: /start j<token>"""
+    session_id = parse_start_payload(command.args, JOIN_PREFIX)
+    snapshot = await snapshots.get(session_id) if session_id else None
+    user = message.from_user
+
+    if snapshot is None or snapshot.status != SessionStatus.SELECTING:
+        await message.answer(
+            "❌ Sessiya topilmadi yoki allaqachon yopilgan.",
+            reply_markup=get_main_menu_keyboard()
+        )
+        return
+
+    if snapshot.creator_user_id == user.id:
+        await message.answer("ℹ️ Bu sizning sessiyangiz. Linkni boshqa ishtirokchilarga yuboring.")
+        return
+
+    try:
+        participant = await join_participant(snapshot, user)
+    except Exception as e:
+        logger.error(f"Error joining session {session_id}: {e}", exc_info=True)
+        await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
+        return
+    history.invalidate(user.id)
+
+    if participant.has_confirmed:
+        await message.answer(
+            f"✅ Siz bu sessiyada allaqachon tanlov qilgansiz.\n\n"
+            f"💵 To'lash kerak: <b>{format_amount(participant.total_amount)} so'm</b>"
+        )
+        return
+
+    individual_meals = snapshot.individual_meals
+
+    await state.clear()
+    await state.set_state(ReceiptStates.selecting_own_meals)
+    await state.update_data(
+        session_id=str(snapshot.id),
+        participant_id=participant.id,
+        snapshot_version=snapshot.version,
+        meal_ids=[meal.id for meal in individual_meals],
+        selection=MealSelection(len(individual_meals)).encode()
+    )
+
+    shared_names = ", ".join(meal.name for meal in snapshot.shared_meals)
+    shared_line = f"🤝 Umumiy: {shared_names}\n\n" if shared_names else ""
+
+    await message.answer(
+        f"👋 <b>{snapshot.creator_first_name}</b> sizni hisob-kitobga taklif qildi\n\n"
+        f"🏪 <b>{snapshot.restaurant_name or '—'}</b>\n"
+        f"💰 Jami check: {format_amount(snapshot.total_amount)} so'm\n"
+        f"{shared_line}"
+        f"👇 <b>O'zingiz nimalar yeganingizni tanlang:</b>",
+        reply_markup=build_meal_selection_keyboard(list(individual_meals))
+    )
+
+    logger.info(f"🔗 User {user.id} joined session {snapshot.id} (snapshot {snapshot.version})")
@@ -1,12 +1,28 @@
-from aiogram import Router, F
+from typing import List, Tuple
+from aiogram import Router
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from database.models import Session as DBSession, Meal, SessionParticipant, UserMealSelection
+from database.models import Session as DBSession, Meal, SessionParticipant, UserMealSelection, SessionStatus
 from database.connection import async_session_maker
 from states.receipt_states import ReceiptStates
-from keyboards import build_meal_selection_keyboard
-from utils import format_amount
+from keyboards import (
+    build_meal_selection_keyboard,
+    build_letter_keyboard,
+    get_keyboard_view,
+    apply_view_callback,
+    get_mark_paid_keyboard,
+    SELECTION
+)
+from services.edit_coalescer import edit_coalescer
+from services.calculation_service import apply_selection_changes, ledgers
+from services.netting_service import debt_network
+from services.claim_service import claim_meals, remaining_units
+from services.session_snapshot import snapshots
+from services.session_board import boards
+from services.history_service import history
+from handlers.callback_dispatch import callback_handler
+from utils import format_amount, MealSelection, Op, create_join_link, create_board_link
 import logging
 import uuid
 
@@ -15,148 +31,175 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 
-@router.callback_query(F.data.startswith("select_meal:"))
-async def toggle_meal_selection(callback: CallbackQuery, state: FSMContext):
-    """Toggle meal selection on/off"""
-    meal_id = int(callback.data.split(":")[1])
+def load_selection(data: dict) -> Tuple[List[int], MealSelection]:
+    """Read the compact selection written by show_own_meal_selection"""
+    meal_ids = data.get('meal_ids', [])
+    return meal_ids, MealSelection.decode(data.get('selection', ''), len(meal_ids))
+
+
+def schedule_selection_keyboard(callback: CallbackQuery, state: FSMContext):
+    """
+    Queue a re-render of the individual meal selection keyboard
+
+    The render runs once per burst of taps and reads the latest FSM
+    selection at that point (see services/edit_coalescer.py). Meals come
+    from the in-memory session snapshot, not the meals table.
+    """
+    async def render():
+        data = await state.get_data()
+        meal_ids, selection = load_selection(data)
+        
+        snapshot = await snapshots.get(uuid.UUID(data.get('session_id')))
+        meals = list(snapshot.individual_meals) if snapshot else []
+        
+        view = get_keyboard_view(data, callback.message.message_id)
+        if view['picking']:
+            return build_letter_keyboard(SELECTION, meals)
+        
+        selected_meal_ids, meal_quantities = selection.to_ids(meal_ids)
+        return build_meal_selection_keyboard(
+            meals, selected_meal_ids, meal_quantities,
+            page=view['page'], letter=view['letter']
+        )
     
+    edit_coalescer.schedule(callback.message, render)
+
+
+@callback_handler(Op.PAGE, SELECTION)
+@callback_handler(Op.LETTER, SELECTION)
+@callback_handler(Op.LETTERS, SELECTION)
+async def change_selection_page(callback: CallbackQuery, state: FSMContext, *_):
+    """Page navigation and letter filter for the meal selection keyboard"""
     data = await state.get_data()
-    selected_meal_ids = data.get('selected_meal_ids', set())
-    meal_quantities = data.get('meal_quantities', {})
-    session_id = data.get('session_id')
-    
-    # Toggle selection
-    if meal_id in selected_meal_ids:
-        selected_meal_ids.remove(meal_id)
-        meal_quantities.pop(meal_id, None)
-    else:
-        selected_meal_ids.add(meal_id)
-        meal_quantities[meal_id] = 1  # Default quantity
-    
     await state.update_data(
-        selected_meal_ids=selected_meal_ids,
-        meal_quantities=meal_quantities
+        keyboard_views=apply_view_callback(data, callback.message.message_id, callback.data)
     )
     
-    # Rebuild keyboard
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(Meal)
-            .where(Meal.session_id == uuid.UUID(session_id))
-            .where(Meal.is_shared == False)
-            .order_by(Meal.position)
-        )
-        meals = result.scalars().all()
-        
-        keyboard = build_meal_selection_keyboard(meals, selected_meal_ids, meal_quantities)
-        
-        await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback.answer()
+    schedule_selection_keyboard(callback, state)
+
+
+@callback_handler(Op.SELECT_MEAL)
+async def toggle_meal_selection(callback: CallbackQuery, state: FSMContext, meal_id: int):
+    """Toggle meal selection on/off"""
+    
+    data = await state.get_data()
+    meal_ids, selection = load_selection(data)
+    
+    if meal_id not in meal_ids:
         await callback.answer()
+        return
+    
+    index = meal_ids.index(meal_id)
+    if not selection.is_selected(index):
+        async with async_session_maker() as session:
+            remaining = await remaining_units(session, meal_id)
+        
+        if not remaining:
+            await callback.answer("❌ Bu ovqatni boshqalar tanlab bo'lishdi", show_alert=True)
+            return
+    
+    selection.toggle(index)
+    await state.update_data(selection=selection.encode())
+    
+    await callback.answer()
+    schedule_selection_keyboard(callback, state)
 
 
-@router.callback_query(F.data.startswith("qty_inc:"))
-async def increase_quantity(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.QTY_INC)
+async def increase_quantity(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Increase meal quantity"""
-    meal_id = int(callback.data.split(":")[1])
     
     data = await state.get_data()
-    meal_quantities = data.get('meal_quantities', {})
-    selected_meal_ids = data.get('selected_meal_ids', set())
-    session_id = data.get('session_id')
+    meal_ids, selection = load_selection(data)
+    
+    if meal_id not in meal_ids:
+        await callback.answer()
+        return
     
-    # Get meal to check max quantity
+    # Units not yet claimed by anyone else who confirmed
     async with async_session_maker() as session:
-        result = await session.execute(
-            select(Meal).where(Meal.id == meal_id)
-        )
-        meal = result.scalar_one_or_none()
+        remaining = await remaining_units(session, meal_id)
+    
+    if remaining is None:
+        await callback.answer()
+        return
+    
+    index = meal_ids.index(meal_id)
+    
+    # Don't exceed what is left; the claim on confirm re-checks atomically
+    if selection.increment(index, remaining):
+        await state.update_data(selection=selection.encode())
         
-        if meal:
-            current_qty = meal_quantities.get(meal_id, 1)
-            
-            # Don't exceed available quantity
-            if current_qty < meal.quantity_available:
-                meal_quantities[meal_id] = current_qty + 1
-                
-                await state.update_data(meal_quantities=meal_quantities)
-                
-                # Rebuild keyboard
-                meals_result = await session.execute(
-                    select(Meal)
-                    .where(Meal.session_id == uuid.UUID(session_id))
-                    .where(Meal.is_shared == False)
-                    .order_by(Meal.position)
-                )
-                meals = meals_result.scalars().all()
-                
-                keyboard = build_meal_selection_keyboard(meals, selected_meal_ids, meal_quantities)
-                
-                await callback.message.edit_reply_markup(reply_markup=keyboard)
-                await callback.answer(f"Miqdor: {meal_quantities[meal_id]}")
-            else:
-                await callback.answer(f"Maksimal: {meal.quantity_available}", show_alert=True)
+        await callback.answer(f"Miqdor: {selection.quantity(index)}")
+        schedule_selection_keyboard(callback, state)
+    else:
+        await callback.answer(f"Maksimal: {remaining}", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("qty_dec:"))
-async def decrease_quantity(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.QTY_DEC)
+async def decrease_quantity(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Decrease meal quantity"""
-    meal_id = int(callback.data.split(":")[1])
     
     data = await state.get_data()
-    meal_quantities = data.get('meal_quantities', {})
-    selected_meal_ids = data.get('selected_meal_ids', set())
-    session_id = data.get('session_id')
+    meal_ids, selection = load_selection(data)
     
-    current_qty = meal_quantities.get(meal_id, 1)
+    if meal_id not in meal_ids:
+        await callback.answer()
+        return
     
-    if current_qty > 1:
-        meal_quantities[meal_id] = current_qty - 1
-        
-        await state.update_data(meal_quantities=meal_quantities)
+    index = meal_ids.index(meal_id)
+    
+    if selection.decrement(index):
+        await state.update_data(selection=selection.encode())
         
-        # Rebuild keyboard
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(Meal)
-                .where(Meal.session_id == uuid.UUID(session_id))
-                .where(Meal.is_shared == False)
-                .order_by(Meal.position)
-            )
-            meals = result.scalars().all()
-            
-            keyboard = build_meal_selection_keyboard(meals, selected_meal_ids, meal_quantities)
-            
-            await callback.message.edit_reply_markup(reply_markup=keyboard)
-            await callback.answer(f"Miqdor: {meal_quantities[meal_id]}")
+        await callback.answer(f"Miqdor: {selection.quantity(index)}")
+        schedule_selection_keyboard(callback, state)
     else:
         await callback.answer("Minimal: 1", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("qty_noop:"))
-async def quantity_noop(callback: CallbackQuery):
+@callback_handler(Op.QTY_NOOP)
+async def quantity_noop(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """No-op for quantity display button"""
     await callback.answer()
 
 
-@router.callback_query(F.data == "confirm_own_meals")
+@callback_handler(Op.CONFIRM_OWN_MEALS)
 async def confirm_own_meals(callback: CallbackQuery, state: FSMContext):
     """Confirm main user's meal selections"""
     data = await state.get_data()
-    selected_meal_ids = data.get('selected_meal_ids', set())
-    meal_quantities = data.get('meal_quantities', {})
+    meal_ids, selection = load_selection(data)
+    selected_meal_ids, meal_quantities = selection.to_ids(meal_ids)
     session_id = data.get('session_id')
     
-    if not selected_meal_ids:
+    participant_id = data.get('participant_id')
+    
+    # A Confirm button left over from a finished or cancelled flow
+    if not session_id:
+        await callback.answer("Sessiya tugagan. Linkni qaytadan oching.", show_alert=True)
+        return
+    session_uuid = uuid.UUID(session_id)
+    
+    if not selected_meal_ids and meal_ids:
         await callback.answer("Kamida bitta ovqat tanlang!", show_alert=True)
         return
     
+    # Joiners chose from a snapshot; make sure the menu did not change since
+    snapshot_version = data.get('snapshot_version')
+    if snapshot_version:
+        snapshot = await snapshots.get(session_uuid)
+        if snapshot is None or snapshot.version != snapshot_version:
+            await callback.answer("Menyu o'zgargan. Linkni qaytadan oching.", show_alert=True)
+            return
+    
     async with async_session_maker() as session:
         try:
             user = callback.from_user
             
             # Get session
             session_result = await session.execute(
-                select(DBSession).where(DBSession.id == uuid.UUID(session_id))
+                select(DBSession).where(DBSession.id == session_uuid)
             )
             db_session = session_result.scalar_one_or_none()
             
@@ -164,65 +207,86 @@ async def confirm_own_meals(callback: CallbackQuery, state: FSMContext):
                 await callback.answer("Session topilmadi", show_alert=True)
                 return
             
-            # Create participant record for main user
-            participant = SessionParticipant(
-                session_id=uuid.UUID(session_id),
-                user_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                is_creator=True,
-                has_confirmed=True
+            if participant_id:
+                # Joined through the link, the row already exists
+                participant = await session.get(SessionParticipant, participant_id)
+                if participant is None or participant.has_confirmed:
+                    await callback.answer("Tanlov allaqachon saqlangan", show_alert=True)
+                    return
+                participant.has_confirmed = True
+            else:
+                # Create participant record for main user
+                participant = SessionParticipant(
+                    session_id=session_uuid,
+                    user_id=user.id,
+                    username=user.username,
+                    first_name=user.first_name,
+                    is_creator=True,
+                    has_confirmed=True
+                )
+                session.add(participant)
+                await session.flush()
+            
+            # Reserve units atomically; someone may have confirmed the same meals meanwhile
+            claimed, rejected = await claim_meals(
+                session,
+                session_uuid,
+                {meal_id: meal_quantities.get(meal_id, 1) for meal_id in selected_meal_ids}
             )
-            session.add(participant)
-            await session.flush()
+            
+            if rejected:
+                await session.rollback()
+                names_result = await session.execute(select(Meal.name).where(Meal.id.in_(rejected)))
+                names = ", ".join(names_result.scalars().all())[:120]
+                await callback.answer(
+                    f"❌ Yetarli qolmagan: {names}\nMiqdorni kamaytiring yoki boshqasini tanlang.",
+                    show_alert=True
+                )
+                return
             
             # Save meal selections
-            individual_total = 0.0
-            for meal_id in selected_meal_ids:
+            changes = []
+            for meal_id in claimed:
                 qty = meal_quantities.get(meal_id, 1)
-                
-                # Get meal
-                meal_result = await session.execute(
-                    select(Meal).where(Meal.id == meal_id)
-                )
-                meal = meal_result.scalar_one_or_none()
-                
-                if meal:
-                    selection = UserMealSelection(
-                        meal_id=meal_id,
-                        participant_id=participant.id,
-                        quantity_selected=qty
-                    )
-                    session.add(selection)
-                    
-                    individual_total += float(meal.price) * float(qty)
+                session.add(UserMealSelection(
+                    meal_id=meal_id,
+                    participant_id=participant.id,
+                    quantity_selected=qty
+                ))
+                changes.append((participant.id, meal_id, qty))
             
-            # Calculate totals
-            # Calculate totals
-            shared_portion = float(db_session.shared_total) / db_session.participant_count if db_session.participant_count > 0 else 0.0
-            total = individual_total + shared_portion
-
-            participant.individual_total = individual_total
-            participant.shared_portion = shared_portion
-            participant.total_amount = total
+            # Calculate totals, only rows touched by this participant
+            amounts = await apply_selection_changes(session, db_session, changes, joined=[participant.id])
+            total = amounts[participant.id]['total_amount']
+            
+            # Setup is done, so the janitor no longer treats it as abandoned
+            if participant.is_creator:
+                db_session.status = SessionStatus.SELECTING
             
             await session.commit()
+            if participant.is_creator:
+                snapshots.invalidate(db_session.id)
+            boards.schedule(callback.bot, db_session.id)
+            history.invalidate(user.id, db_session.creator_user_id)
             
+            edit_coalescer.cancel(callback.message)
             await callback.message.edit_text("✅ Ovqatlaringiz saqlandi!")
             
             # Show summary
-            await show_main_user_summary(callback.message, state, session_id)
+            await show_participant_summary(callback.message, state, session_id, participant.id)
             
             await callback.answer()
-            logger.info(f"Main user {user.id} confirmed meals. Total: {total}")
+            logger.info(f"User {user.id} confirmed meals in session {session_id}. Total: {total}")
             
         except Exception as e:
+            ledgers.invalidate(session_uuid)
+            debt_network.reset()
             logger.error(f"Error confirming meals: {e}", exc_info=True)
             await callback.answer("Xatolik yuz berdi", show_alert=True)
 
 
-async def show_main_user_summary(message: Message, state: FSMContext, session_id: str):
-    """Show summary to main user after selecting meals"""
+async def show_participant_summary(message: Message, state: FSMContext, session_id: str, participant_id: int):
+    """Show summary after selecting meals; the creator also gets the join link"""
     async with async_session_maker() as session:
         try:
             # Get session
@@ -231,28 +295,39 @@ async def show_main_user_summary(message: Message, state: FSMContext, session_id
             )
             db_session = result.scalar_one_or_none()
             
-            # Get main user participant
-            participant_result = await session.execute(
-                select(SessionParticipant)
-                .where(SessionParticipant.session_id == uuid.UUID(session_id))
-                .where(SessionParticipant.is_creator == True)
-            )
-            participant = participant_result.scalar_one_or_none()
+            participant = await session.get(SessionParticipant, participant_id)
             
             if db_session and participant:
+                delivery_portion = participant.total_amount - participant.individual_total - participant.shared_portion
+                delivery_line = f"🚚 Delivery ulush: {format_amount(delivery_portion)} so'm\n" if delivery_portion else ""
+                
                 summary = (
                     f"📊 <b>Sizning hisob-kitobingiz</b>\n\n"
                     f"🏪 <b>{db_session.restaurant_name}</b>\n"
                     f"💰 Jami check: {format_amount(db_session.total_amount)} so'm\n\n"
                     f"🍽 Individual ovqatlar: {format_amount(participant.individual_total)} so'm\n"
-                    f"🤝 Shared ulush: {format_amount(participant.shared_portion)} so'm\n\n"
+                    f"🤝 Shared ulush: {format_amount(participant.shared_portion)} so'm\n"
+                    f"{delivery_line}\n"
                     f"💵 <b>TO'LASH KERAK: {format_amount(participant.total_amount)} so'm</b>\n\n"
-                    f"Session ID: <code>{session_id}</code>\n\n"
-                    f"🎉 <b>Step 3 tugadi!</b>\n\n"
-                    f"Keyingi step: Boshqa ishtirokchilarga link ulashish"
                 )
                 
-                await message.answer(summary)
+                reply_markup = None
+                if participant.is_creator:
+                    join_link = await create_join_link(message.bot, db_session.id)
+                    board_link = await create_board_link(message.bot, db_session.id)
+                    summary += (
+                        f"🔗 <b>Ishtirokchilar uchun link:</b>\n{join_link}\n\n"
+                        f"Linkni guruhga yuboring, har kim o'z ovqatlarini tanlaydi.\n\n"
+                        f"📌 Guruhda jonli board: {board_link}"
+                    )
+                else:
+                    summary += (
+                        f"💳 <b>{db_session.creator_first_name}</b>ga o'tkazing:\n"
+                        f"<code>{db_session.card_number}</code>"
+                    )
+                    reply_markup = get_mark_paid_keyboard(participant.id)
+                
+                await message.answer(summary, reply_markup=reply_markup)
                 
                 # Clear state
                 await state.clear()
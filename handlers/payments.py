@@ -0,0 +1,127 @@
+from datetime import datetime
+from aiogram import Router
+from aiogram.types import CallbackQuery
+from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update, func
+from database.models import Session as DBSession, SessionParticipant, PaymentStatus
+from database.connection import async_session_maker
+from keyboards import get_confirm_payment_keyboard
+from services.netting_service import debt_network
+from services.reminder_service import reminders
+from services.session_board import boards
+from services.history_service import history
+from services.session_snapshot import snapshots
+from services.archive_service import complete_settled_sessions
+from handlers.callback_dispatch import callback_handler
+from utils import format_amount, Op
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+@callback_handler(Op.MARK_PAID)
+async def mark_paid(callback: CallbackQuery, state: FSMContext, participant_id: int):
+    """Debtor says the money was sent: PENDING -> PAID, then ask the creator to confirm"""
+    async with async_session_maker() as session:
+        try:
+            # Conditional on the current status, so double taps change nothing
+            participant = (await session.execute(
+                update(SessionParticipant)
+                .where(SessionParticipant.id == participant_id)
+                .where(SessionParticipant.user_id == callback.from_user.id)
+                .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+                .values(payment_status=PaymentStatus.PAID, paid_at=datetime.utcnow())
+                .returning(SessionParticipant)
+            )).scalar_one_or_none()
+
+            if participant is None:
+                await callback.answer("Bu to'lov allaqachon belgilangan.", show_alert=True)
+                return
+
+            db_session = await session.get(DBSession, participant.session_id)
+            await session.commit()
+
+        except Exception as e:
+            logger.error(f"Error marking participant {participant_id} paid: {e}", exc_info=True)
+            await callback.answer("Xatolik yuz berdi", show_alert=True)
+            return
+
+    debt_network.record(participant, db_session)
+    reminders.cancel(participant_id)
+    boards.schedule(callback.bot, db_session.id)
+    history.invalidate(participant.user_id, db_session.creator_user_id)
+
+    await callback.message.edit_text(
+        f"{callback.message.html_text}\n\n💸 <i>To'landi, tasdiq kutilmoqda</i>"
+    )
+    await callback.answer("✅ Belgilandi")
+
+    try:
+        await callback.bot.send_message(
+            db_session.creator_user_id,
+            f"💸 <b>{participant.first_name}</b> {format_amount(participant.total_amount or 0)} so'm "
+            f"to'laganini belgiladi\n"
+            f"🏪 {db_session.restaurant_name or 'Hisob'}",
+            reply_markup=get_confirm_payment_keyboard(participant_id)
+        )
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        logger.info(f"Creator of session {db_session.id} not reachable: {e}")
+
+    logger.info(f"💸 Participant {participant_id} marked paid in session {db_session.id}")
+
+
+@callback_handler(Op.CONFIRM_PAYMENT)
+async def confirm_payment(callback: CallbackQuery, state: FSMContext, participant_id: int):
+    """Creator confirms the money arrived: PENDING/PAID -> CONFIRMED"""
+    async with async_session_maker() as session:
+        try:
+            participant = (await session.execute(
+                update(SessionParticipant)
+                .where(SessionParticipant.id == participant_id)
+                .where(SessionParticipant.session_id.in_(
+                    select(DBSession.id).where(DBSession.creator_user_id == callback.from_user.id)
+                ))
+                .where(SessionParticipant.payment_status != PaymentStatus.CONFIRMED)
+                .values(
+                    payment_status=PaymentStatus.CONFIRMED,
+                    paid_at=func.coalesce(SessionParticipant.paid_at, datetime.utcnow())
+                )
+                .returning(SessionParticipant)
+            )).scalar_one_or_none()
+
+            if participant is None:
+                await callback.answer("Bu to'lov allaqachon tasdiqlangan.", show_alert=True)
+                return
+
+            db_session = await session.get(DBSession, participant.session_id)
+            completed = await complete_settled_sessions(session, [db_session.id])
+            await session.commit()
+
+        except Exception as e:
+            logger.error(f"Error confirming payment of participant {participant_id}: {e}", exc_info=True)
+            await callback.answer("Xatolik yuz berdi", show_alert=True)
+            return
+
+    debt_network.record(participant, db_session)
+    reminders.cancel(participant_id)
+    if completed:
+        snapshots.invalidate(db_session.id)
+    boards.schedule(callback.bot, db_session.id)
+    history.invalidate(participant.user_id, db_session.creator_user_id)
+
+    await callback.message.edit_text(f"{callback.message.html_text}\n\n✅ <i>Tasdiqlandi</i>")
+    await callback.answer("✅ Tasdiqlandi")
+
+    try:
+        await callback.bot.send_message(
+            participant.user_id,
+            f"✅ <b>{db_session.creator_first_name}</b> {format_amount(participant.total_amount or 0)} so'mlik "
+            f"to'lovingizni tasdiqladi. Rahmat!"
+        )
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        logger.info(f"Participant {participant_id} not reachable: {e}")
+
+    logger.info(f"✅ Payment of participant {participant_id} confirmed in session {db_session.id}")
@@ -9,10 +9,29 @@ from keyboards import (
     get_cancel_keyboard,
     build_categorization_keyboard,
     get_main_menu_keyboard,
-    get_meal_edit_keyboard
+    get_meal_edit_keyboard,
+    build_letter_keyboard,
+    get_keyboard_view,
+    apply_view_callback,
+    CATEGORIZATION
 )
 from services import AIService
-from utils import format_amount
+from services.receipt_store import build_receipt_document, build_meals
+from services.edit_coalescer import edit_coalescer
+from services.calculation_service import ledgers, bump_settlement_version
+from services.session_snapshot import snapshots
+from handlers.callback_dispatch import callback_handler
+from services.image_service import (
+    select_photo_size,
+    is_receipt_document,
+    download_receipt_image,
+    receipt_suffix,
+    check_receipt_quality,
+    QUALITY_HINTS
+)
+from config import MAX_FILE_SIZE_MB
+from utils import format_amount, to_minor, Op
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -47,28 +66,67 @@ async def new_receipt_button(message: Message, state: FSMContext):
 @router.message(ReceiptStates.waiting_for_receipt_image, F.photo)
 async def process_receipt_image(message: Message, state: FSMContext):
     """Process uploaded receipt image with AI"""
+    photo = select_photo_size(message.photo)
+    logger.info(f"🖼 Using {photo.width}x{photo.height} of {len(message.photo)} photo sizes")
+    
+    await analyze_receipt_upload(message, state, photo.file_id, photo.file_unique_id)
+
+
+@router.message(ReceiptStates.waiting_for_receipt_image, F.document)
+async def process_receipt_document(message: Message, state: FSMContext):
+    """Process a receipt sent as an uncompressed file"""
+    document = message.document
+    
+    if not is_receipt_document(document):
+        await message.answer(
+            "❌ Iltimos, rasm faylini yuboring "
+            f"(maksimal {MAX_FILE_SIZE_MB} MB)."
+        )
+        return
+    
+    await analyze_receipt_upload(
+        message, state, document.file_id, document.file_unique_id, receipt_suffix(document)
+    )
+
+
+async def analyze_receipt_upload(
+    message: Message,
+    state: FSMContext,
+    file_id: str,
+    file_unique_id: str,
+    suffix: str = ".jpg"
+):
+    """Download the receipt image, analyze it with AI and create the session"""
     user = message.from_user
-    photo = message.photo[-1]
-    file_id = photo.file_id
+    local_path = None
     
     try:
         processing_msg = await message.answer("⏳ <b>AI check tahlil qilyapti...</b>")
         
-        # Download photo
-        bot = message.bot
-        file = await bot.get_file(file_id)
-        file_path = file.file_path
-        local_path = TEMP_DIR / f"{user.id}_{photo.file_unique_id}.jpg"
+        # Download image
+        local_path = TEMP_DIR / f"{user.id}_{file_unique_id}{suffix}"
+        download = await download_receipt_image(message.bot, file_id, local_path)
         
-        await bot.download_file(file_path, local_path)
-        logger.info(f"📥 Downloaded image: {local_path}")
+        # Reject unreadable photos before the (slow) AI call
+        quality = await asyncio.to_thread(check_receipt_quality, str(local_path))
+        if not quality['ok']:
+            logger.info(f"🔍 Receipt rejected ({quality['reason']}): {quality['metrics']}")
+            await processing_msg.delete()
+            await message.answer(
+                "📷 <b>Rasm sifati yetarli emas</b>\n\n"
+                f"{QUALITY_HINTS[quality['reason']]}"
+            )
+            os.remove(local_path)
+            return
         
         # Analyze with AI
         ai_result = await ai_service.analyze_receipt(str(local_path))
         
-        restaurant_name = ai_result.get('restaurant', 'Unknown')
-        total_amount = ai_result.get('total', 0)
-        items = ai_result.get('items', [])
+        receipt = build_receipt_document(ai_result)
+        receipt['download'] = download
+        restaurant_name = receipt['restaurant']
+        total_amount = receipt['total']
+        items = receipt['items']
         
         if not items or len(items) == 0:
             await processing_msg.delete()
@@ -83,7 +141,8 @@ async def process_receipt_image(message: Message, state: FSMContext):
                 creator_username=user.username,
                 creator_first_name=user.first_name,
                 receipt_image_id=file_id,
-                receipt_text=str(ai_result),
+                receipt_data=receipt,
+                receipt_schema_version=receipt['schema_version'],
                 total_amount=total_amount,
                 restaurant_name=restaurant_name
             )
@@ -91,19 +150,8 @@ async def process_receipt_image(message: Message, state: FSMContext):
             session.add(new_session)
             await session.flush()
             
-            # Create meals from AI result
-            for item in items:
-                is_shared = item.get('type', 'INDIVIDUAL') == 'SHARED'
-                
-                meal = Meal(
-                    session_id=new_session.id,
-                    name=item['name'],
-                    price=item['price'],
-                    quantity_available=item['quantity'],
-                    position=items.index(item) + 1,
-                    is_shared=is_shared
-                )
-                session.add(meal)
+            # Create meals from the parsed receipt
+            session.add_all(build_meals(receipt, new_session.id))
             
             await session.commit()
             
@@ -141,14 +189,30 @@ async def process_receipt_image(message: Message, state: FSMContext):
     except Exception as e:
         logger.error(f"❌ Error processing receipt: {e}", exc_info=True)
         await message.answer("❌ <b>Xatolik yuz berdi</b>\n\nIltimos, qaytadan urinib ko'ring.")
-        if local_path.exists():
+        if local_path and local_path.exists():
             os.remove(local_path)
 
 
-@router.callback_query(F.data.startswith("toggle:"))
-async def toggle_meal_shared(callback: CallbackQuery):
+async def render_categorization_keyboard(session_id: uuid.UUID, state: FSMContext, message_id: int):
+    """Load the session's meals and build the shared/individual keyboard page"""
+    async with async_session_maker() as session:
+        meals_result = await session.execute(
+            select(Meal)
+            .where(Meal.session_id == session_id)
+            .order_by(Meal.position)
+        )
+        meals = meals_result.scalars().all()
+    
+    view = get_keyboard_view(await state.get_data(), message_id)
+    if view['picking']:
+        return build_letter_keyboard(CATEGORIZATION, meals)
+    
+    return build_categorization_keyboard(meals, str(session_id), page=view['page'], letter=view['letter'])
+
+
+@callback_handler(Op.TOGGLE_SHARED)
+async def toggle_meal_shared(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Toggle meal shared/individual"""
-    meal_id = int(callback.data.split(":")[1])
     
     async with async_session_maker() as session:
         try:
@@ -159,21 +223,19 @@ async def toggle_meal_shared(callback: CallbackQuery):
             
             if meal:
                 meal.is_shared = not meal.is_shared
+                await bump_settlement_version(session, meal.session_id)
                 await session.commit()
-                
-                # Rebuild keyboard
-                meals_result = await session.execute(
-                    select(Meal)
-                    .where(Meal.session_id == meal.session_id)
-                    .order_by(Meal.position)
-                )
-                meals = meals_result.scalars().all()
-                
-                keyboard = build_categorization_keyboard(meals, str(meal.session_id))
-                await callback.message.edit_reply_markup(reply_markup=keyboard)
+                ledgers.invalidate(meal.session_id)
+                snapshots.invalidate(meal.session_id)
                 
                 status = "Shared" if meal.is_shared else "Individual"
                 await callback.answer(f"✅ {status}")
+                
+                # Rebuild keyboard once per burst of taps
+                edit_coalescer.schedule(
+                    callback.message,
+                    lambda: render_categorization_keyboard(meal.session_id, state, callback.message.message_id)
+                )
                 logger.info(f"Meal {meal_id} toggled to {status}")
         
         except Exception as e:
@@ -181,10 +243,32 @@ async def toggle_meal_shared(callback: CallbackQuery):
             await callback.answer("Xatolik", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("edit:"))
-async def show_meal_edit_menu(callback: CallbackQuery):
+@callback_handler(Op.PAGE, CATEGORIZATION)
+@callback_handler(Op.LETTER, CATEGORIZATION)
+@callback_handler(Op.LETTERS, CATEGORIZATION)
+async def change_categorization_page(callback: CallbackQuery, state: FSMContext, *_):
+    """Page navigation and letter filter for the shared/individual keyboard"""
+    data = await state.get_data()
+    session_id = data.get('session_id')
+    
+    if not session_id:
+        await callback.answer()
+        return
+    
+    await state.update_data(
+        keyboard_views=apply_view_callback(data, callback.message.message_id, callback.data)
+    )
+    
+    await callback.answer()
+    edit_coalescer.schedule(
+        callback.message,
+        lambda: render_categorization_keyboard(uuid.UUID(session_id), state, callback.message.message_id)
+    )
+
+
+@callback_handler(Op.EDIT_MEAL)
+async def show_meal_edit_menu(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Show edit menu for a meal"""
-    meal_id = int(callback.data.split(":")[1])
     
     async with async_session_maker() as session:
         try:
@@ -208,10 +292,9 @@ async def show_meal_edit_menu(callback: CallbackQuery):
             await callback.answer("Xatolik", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("edit_name_"))
-async def edit_meal_name(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.EDIT_NAME)
+async def edit_meal_name(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Start editing meal name"""
-    meal_id = int(callback.data.split("_")[2])
     
     await state.update_data(editing_meal_id=meal_id, editing_field="name")
     await state.set_state(ReceiptStates.editing_meal)
@@ -223,10 +306,9 @@ async def edit_meal_name(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("edit_price_"))
-async def edit_meal_price(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.EDIT_PRICE)
+async def edit_meal_price(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Start editing meal price"""
-    meal_id = int(callback.data.split("_")[2])
     
     await state.update_data(editing_meal_id=meal_id, editing_field="price")
     await state.set_state(ReceiptStates.editing_meal)
@@ -238,10 +320,9 @@ async def edit_meal_price(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("edit_qty_"))
-async def edit_meal_quantity(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.EDIT_QTY)
+async def edit_meal_quantity(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Start editing meal quantity"""
-    meal_id = int(callback.data.split("_")[2])
     
     await state.update_data(editing_meal_id=meal_id, editing_field="quantity")
     await state.set_state(ReceiptStates.editing_meal)
@@ -280,8 +361,8 @@ async def process_meal_edit(message: Message, state: FSMContext):
                 
             elif field == "price":
                 try:
-                    price = float(new_value.replace(" ", "").replace(",", ""))
-                    if price < 0 or price > 10000000:
+                    price = to_minor(new_value)
+                    if price < 0 or price > to_minor(10000000):
                         await message.answer("❌ Narx noto'g'ri")
                         return
                     meal.price = price
@@ -300,7 +381,10 @@ async def process_meal_edit(message: Message, state: FSMContext):
                     await message.answer("❌ Miqdorni faqat raqam kiriting")
                     return
             
+            await bump_settlement_version(session, meal.session_id)
             await session.commit()
+            ledgers.invalidate(meal.session_id)
+            snapshots.invalidate(meal.session_id)
             
             # Recalculate session total
             session_result = await session.execute(
@@ -313,7 +397,7 @@ async def process_meal_edit(message: Message, state: FSMContext):
                     select(Meal).where(Meal.session_id == db_session.id)
                 )
                 all_meals = meals_result.scalars().all()
-                db_session.total_amount = sum(m.price * m.quantity_available for m in all_meals)
+                db_session.total_amount = sum(m.price for m in all_meals)
                 await session.commit()
             
             await message.answer(f"✅ O'zgartirildi!\n\nYangi qiymat: {new_value}")
@@ -328,10 +412,9 @@ async def process_meal_edit(message: Message, state: FSMContext):
             await message.answer("❌ Xatolik yuz berdi")
 
 
-@router.callback_query(F.data.startswith("delete_"))
-async def delete_meal(callback: CallbackQuery, state: FSMContext):
+@callback_handler(Op.DELETE_MEAL)
+async def delete_meal(callback: CallbackQuery, state: FSMContext, meal_id: int):
     """Delete a meal"""
-    meal_id = int(callback.data.split("_")[1])
     
     async with async_session_maker() as session:
         try:
@@ -344,7 +427,10 @@ async def delete_meal(callback: CallbackQuery, state: FSMContext):
                 session_id = meal.session_id
                 meal_name = meal.name
                 await session.delete(meal)
+                await bump_settlement_version(session, session_id)
                 await session.commit()
+                ledgers.invalidate(session_id)
+                snapshots.invalidate(session_id)
                 
                 # Recalculate total
                 session_result = await session.execute(
@@ -357,7 +443,7 @@ async def delete_meal(callback: CallbackQuery, state: FSMContext):
                         select(Meal).where(Meal.session_id == session_id)
                     )
                     all_meals = meals_result.scalars().all()
-                    db_session.total_amount = sum(m.price * m.quantity_available for m in all_meals)
+                    db_session.total_amount = sum(m.price for m in all_meals)
                     await session.commit()
                 
                 # Get FSM data
@@ -385,16 +471,17 @@ async def delete_meal(callback: CallbackQuery, state: FSMContext):
             await callback.answer("Xatolik", show_alert=True)
 
 
-@router.callback_query(F.data == "back_to_meals")
-async def back_to_meals(callback: CallbackQuery):
+@callback_handler(Op.BACK_TO_MEALS)
+async def back_to_meals(callback: CallbackQuery, state: FSMContext):
     """Close edit menu"""
     await callback.message.delete()
     await callback.answer()
 
 
-@router.callback_query(F.data == "meals_done")
+@callback_handler(Op.MEALS_DONE)
 async def meals_done_proceed(callback: CallbackQuery, state: FSMContext):
     """Proceed to participant count"""
+    edit_coalescer.cancel(callback.message)
     await callback.message.edit_text("✅ Ovqatlar sozlandi!")
     
     await state.set_state(ReceiptStates.entering_participant_count)
@@ -409,9 +496,10 @@ async def meals_done_proceed(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "cancel_session")
+@callback_handler(Op.CANCEL_SESSION)
 async def cancel_session(callback: CallbackQuery, state: FSMContext):
     """Cancel session"""
+    edit_coalescer.cancel(callback.message)
     data = await state.get_data()
     session_id = data.get('session_id')
     
@@ -425,6 +513,7 @@ async def cancel_session(callback: CallbackQuery, state: FSMContext):
                 if db_session:
                     await session.delete(db_session)
                     await session.commit()
+                    snapshots.invalidate(db_session.id)
             except Exception as e:
                 logger.error(f"Error deleting session: {e}")
     
@@ -1,13 +1,16 @@
-from typing import Dict, List
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from database.models import Session as DBSession, Meal, SessionParticipant
+from database.models import Session as DBSession
 from database.connection import async_session_maker
 from states.receipt_states import ReceiptStates
+from services.calculation_service import settle_session, ledgers
+from services.netting_service import debt_network
+from services.session_snapshot import snapshots
 from keyboards import get_cancel_keyboard, get_yes_no_keyboard, build_meal_selection_keyboard
-from utils import format_amount
+from utils import MealSelection, pack, Op
+from handlers.callback_dispatch import callback_handler
 import logging
 import uuid
 
@@ -16,29 +19,6 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 
-def calculate_totals(meals: List, participant_count: int) -> Dict:
-    """Calculate shared and individual totals"""
-    shared_total = 0.0
-    individual_total = 0.0
-    
-    for meal in meals:
-        meal_total = float(meal.price) * float(meal.quantity_available)
-        
-        if meal.is_shared:
-            shared_total += meal_total
-        else:
-            individual_total += meal_total
-    
-    shared_per_person = shared_total / participant_count if participant_count > 0 else 0
-    
-    return {
-        'shared_total': shared_total,
-        'individual_total': individual_total,
-        'shared_per_person': shared_per_person,
-        'total': shared_total + individual_total
-    }
-
-
 @router.message(ReceiptStates.entering_restaurant_name)
 async def process_restaurant_name(message: Message, state: FSMContext):
     """Handle restaurant name input"""
@@ -64,6 +44,7 @@ async def process_restaurant_name(message: Message, state: FSMContext):
             if db_session:
                 db_session.restaurant_name = restaurant_name
                 await session.commit()
+                snapshots.invalidate(db_session.id)
                 
                 await message.answer(f"✅ Restoran nomi saqlandi: <b>{restaurant_name}</b>")
                 
@@ -99,6 +80,7 @@ async def process_participant_count(message: Message, state: FSMContext):
         data = await state.get_data()
         session_id = data.get('session_id')
         
+        db_session = None
         async with async_session_maker() as session:
             try:
                 result = await session.execute(
@@ -110,14 +92,7 @@ async def process_participant_count(message: Message, state: FSMContext):
                     db_session.participant_count = count
                     
                     # Calculate totals
-                    meals_result = await session.execute(
-                        select(Meal).where(Meal.session_id == uuid.UUID(session_id))
-                    )
-                    meals = meals_result.scalars().all()
-                    
-                    totals = calculate_totals(meals, count)
-                    db_session.shared_total = totals['shared_total']
-                    db_session.individual_total = totals['individual_total']
+                    await settle_session(session, db_session)
                     
                     await session.commit()
                     
@@ -135,6 +110,9 @@ async def process_participant_count(message: Message, state: FSMContext):
                     logger.info(f"Participant count set: {count} for session {session_id}")
                 
             except Exception as e:
+                if db_session is not None:
+                    ledgers.invalidate(db_session.id)
+                debt_network.reset()
                 logger.error(f"Error saving participant count: {e}")
                 await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
         
@@ -172,6 +150,7 @@ async def process_card_number(message: Message, state: FSMContext):
             if db_session:
                 db_session.card_number = card_number
                 await session.commit()
+                snapshots.invalidate(db_session.id)
                 
                 await message.answer(f"✅ Karta raqami saqlandi: <code>{card_number}</code>")
                 
@@ -180,7 +159,7 @@ async def process_card_number(message: Message, state: FSMContext):
                 await message.answer(
                     "🚚 <b>Delivery bor edimi?</b>\n\n"
                     "Ya'ni, kimdir uchun ofisga olib kelgan ovqat bor edimi?",
-                    reply_markup=get_yes_no_keyboard("delivery_yes", "delivery_no")
+                    reply_markup=get_yes_no_keyboard(pack(Op.DELIVERY_YES), pack(Op.DELIVERY_NO))
                 )
                 
                 logger.info(f"Card number set for session {session_id}")
@@ -190,7 +169,7 @@ async def process_card_number(message: Message, state: FSMContext):
             await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
 
 
-@router.callback_query(F.data == "delivery_yes")
+@callback_handler(Op.DELIVERY_YES)
 async def delivery_yes_callback(callback: CallbackQuery, state: FSMContext):
     """Handle delivery yes"""
     data = await state.get_data()
@@ -220,7 +199,7 @@ async def delivery_yes_callback(callback: CallbackQuery, state: FSMContext):
             await callback.answer("Xatolik", show_alert=True)
 
 
-@router.callback_query(F.data == "delivery_no")
+@callback_handler(Op.DELIVERY_NO)
 async def delivery_no_callback(callback: CallbackQuery, state: FSMContext):
     """Handle delivery no"""
     data = await state.get_data()
@@ -252,44 +231,35 @@ async def delivery_no_callback(callback: CallbackQuery, state: FSMContext):
 
 async def show_own_meal_selection(message: Message, state: FSMContext, session_id: str):
     """Show individual meal selection for main user"""
-    async with async_session_maker() as session:
-        try:
-            # Get only individual meals (not shared)
-            result = await session.execute(
-                select(Meal)
-                .where(Meal.session_id == uuid.UUID(session_id))
-                .where(Meal.is_shared == False)
-                .order_by(Meal.position)
-            )
-            individual_meals = result.scalars().all()
-            
-            if not individual_meals:
-                await message.answer(
-                    "ℹ️ <b>Individual ovqatlar yo'q</b>\n\n"
-                    "Barcha ovqatlar shared deb belgilangan.\n"
-                    "Keyingi stepga o'tilmoqda..."
-                )
-                # TODO: Skip to next step (Step 4: Share link)
-                return
-            
-            # Set state
-            await state.set_state(ReceiptStates.selecting_own_meals)
-            await state.update_data(
-                selected_meal_ids=set(),
-                meal_quantities={}
-            )
-            
-            # Build keyboard (without edit buttons)
-            keyboard = build_meal_selection_keyboard(individual_meals)
-            
+    try:
+        # Individual meals (not shared), from the cached session snapshot
+        snapshot = await snapshots.get(uuid.UUID(session_id))
+        individual_meals = list(snapshot.individual_meals) if snapshot else []
+        
+        if not individual_meals:
             await message.answer(
-                "👇 <b>O'zingiz nimalar yeganingizni tanlang:</b>\n\n"
-                "Ovqatni bosing, keyin miqdorini sozlang.",
-                reply_markup=keyboard
+                "ℹ️ <b>Individual ovqatlar yo'q</b>\n\n"
+                "Barcha ovqatlar shared deb belgilangan."
             )
-            
-            logger.info(f"Showing {len(individual_meals)} individual meals to main user")
-            
-        except Exception as e:
-            logger.error(f"Error showing meal selection: {e}", exc_info=True)
-            await message.answer("❌ Xatolik yuz berdi.")
\ No newline at end of file
+        
+        # Set state
+        await state.set_state(ReceiptStates.selecting_own_meals)
+        await state.update_data(
+            meal_ids=[meal.id for meal in individual_meals],
+            selection=MealSelection(len(individual_meals)).encode()
+        )
+        
+        # Build keyboard (without edit buttons)
+        keyboard = build_meal_selection_keyboard(individual_meals)
+        
+        await message.answer(
+            "👇 <b>O'zingiz nimalar yeganingizni tanlang:</b>\n\n"
+            "Ovqatni bosing, keyin miqdorini sozlang.",
+            reply_markup=keyboard
+        )
+        
+        logger.info(f"Showing {len(individual_meals)} individual meals to main user")
+        
+    except Exception as e:
+        logger.error(f"Error showing meal selection: {e}", exc_info=True)
+        await message.answer("❌ Xatolik yuz berdi.")
\ No newline at end of file
@@ -58,6 +58,9 @@ async def help_command(message: Message, state: FSMContext):
         "<b>Buyruqlar:</b>\n"
         "/start - Botni qayta boshlash\n"
         "/help - Yordam\n"
+        "/debts - Qarzlar (guruh bo'yicha jamlangan)\n"
+        "/history - Mening sessiyalarim\n"
+        "/stats - Xarajatlar statistikasi\n"
         "/cancel - Bekor qilish"
     )
     
@@ -0,0 +1,51 @@
+from datetime import datetime
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+from services.spending_service import get_spending, month_start
+from config import STATS_MONTHS
+from utils import format_amount
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+TOP_RESTAURANTS = 5
+
+
+@router.message(Command("stats"))
+async def stats_command(message: Message):
+    """The user's spending by month and by restaurant, from the rollups"""
+    user_id = message.from_user.id
+    rows = await get_spending(user_id)
+
+    if not rows:
+        await message.answer("📊 Hali xarajatlar yo'q.")
+        return
+
+    by_month = {}
+    by_restaurant = {}
+    for month, restaurant, amount, sessions in rows:
+        month_amount, month_sessions = by_month.get(month, (0, 0))
+        by_month[month] = (month_amount + amount, month_sessions + sessions)
+        name = restaurant or "Nomsiz"
+        place_amount, place_sessions = by_restaurant.get(name, (0, 0))
+        by_restaurant[name] = (place_amount + amount, place_sessions + sessions)
+
+    this_month = by_month.get(month_start(datetime.utcnow()), (0, 0))
+    lines = [
+        "📊 <b>Xarajatlaringiz</b>\n",
+        f"🗓 Shu oy: <b>{format_amount(this_month[0])} so'm</b> ({this_month[1]} ta sessiya)\n",
+        "📅 <b>Oylar bo'yicha:</b>"
+    ]
+    for month, (amount, sessions) in by_month.items():
+        lines.append(f"{month:%m.%Y} — {format_amount(amount)} so'm ({sessions})")
+
+    lines.append(f"\n🏪 <b>Restoranlar bo'yicha ({STATS_MONTHS} oy):</b>")
+    top = sorted(by_restaurant.items(), key=lambda item: -item[1][0])[:TOP_RESTAURANTS]
+    for name, (amount, sessions) in top:
+        lines.append(f"{name} — {format_amount(amount)} so'm ({sessions})")
+
+    await message.answer("\n".join(lines))
+    logger.info(f"📊 Stats for user {user_id}: {len(rows)} rollup rows")
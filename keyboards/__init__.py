@@ -7,6 +7,21 @@ from keyboards.navigation_keyboards import (
     remove_keyboard
 )
 from keyboards.meal_selection_keyboards import build_meal_selection_keyboard
+from keyboards.board_keyboards import build_board_keyboard
+from keyboards.payment_keyboards import (
+    get_mark_paid_keyboard,
+    get_confirm_payment_keyboard,
+    get_transfer_paid_keyboard,
+    get_confirm_transfer_keyboard
+)
+from keyboards.history_keyboards import build_history_keyboard
+from keyboards.pagination import (
+    build_letter_keyboard,
+    get_keyboard_view,
+    apply_view_callback,
+    SELECTION,
+    CATEGORIZATION
+)
 
 __all__ = [
     'get_main_menu_keyboard',
@@ -15,5 +30,16 @@ __all__ = [
     'get_meal_edit_keyboard',
     'get_yes_no_keyboard',
     'remove_keyboard',
-    'build_meal_selection_keyboard'
+    'build_meal_selection_keyboard',
+    'build_board_keyboard',
+    'get_mark_paid_keyboard',
+    'get_confirm_payment_keyboard',
+    'get_transfer_paid_keyboard',
+    'get_confirm_transfer_keyboard',
+    'build_history_keyboard',
+    'build_letter_keyboard',
+    'get_keyboard_view',
+    'apply_view_callback',
+    'SELECTION',
+    'CATEGORIZATION'
 ]
\ No newline at end of file
@@ -0,0 +1,35 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from typing import Dict, List
+import uuid
+from utils import pack, Op
+
+# Telegram allows 100 buttons per message; longer receipts claim in private chat
+MAX_BOARD_BUTTONS = 60
+
+
+def build_board_keyboard(session_id: uuid.UUID, meals: List, claimed: Dict[int, int], join_link: str) -> InlineKeyboardMarkup:
+    """
+    Live board buttons: one per individual meal plus a private-chat link
+
+    Format:
+    - [🍽 Meal name · 1/3]   units claimed so far out of available
+    - [✅ Meal name · 3/3]   fully claimed, a tap by a claimer releases it
+    - [🙋 Shaxsiy tanlov]    opens the join flow in private chat
+    """
+    keyboard_buttons = []
+
+    for meal in meals[:MAX_BOARD_BUTTONS]:
+        taken = claimed.get(meal.id, 0)
+        mark = "✅" if taken >= meal.quantity_available else "🍽"
+        keyboard_buttons.append([
+            InlineKeyboardButton(
+                text=f"{mark} {meal.name} · {taken}/{meal.quantity_available}",
+                callback_data=pack(Op.BOARD_CLAIM, session_id, meal.id)
+            )
+        ])
+
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="🙋 Shaxsiy tanlov", url=join_link)
+    ])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
@@ -0,0 +1,21 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from typing import Optional
+from utils import pack, Op
+
+
+def build_history_keyboard(first_cursor: Optional[tuple], next_cursor: Optional[tuple]) -> Optional[InlineKeyboardMarkup]:
+    """
+    [⏮ Boshiga] [▶️ Keyingi] under a My Sessions page
+
+    Cursors are services.history_service.Cursor (phase, created_at_us, row_id);
+    first_cursor is None on the first page itself.
+    """
+    row = []
+    if first_cursor is not None:
+        row.append(InlineKeyboardButton(text="⏮ Boshiga", callback_data=pack(Op.HISTORY_PAGE, *first_cursor)))
+    if next_cursor is not None:
+        row.append(InlineKeyboardButton(text="▶️ Keyingi", callback_data=pack(Op.HISTORY_PAGE, *next_cursor)))
+
+    if not row:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[row])
@@ -1,11 +1,16 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Set, Dict
+from typing import List, Set, Dict, Optional
+from keyboards.render_cache import row_cache, assemble
+from keyboards.pagination import paginate, build_page_nav_row, SELECTION
+from utils import format_amount, pack, Op
 
 
 def build_meal_selection_keyboard(
     meals: List,
     selected_meal_ids: Set[int] = None,
-    meal_quantities: Dict[int, int] = None
+    meal_quantities: Dict[int, int] = None,
+    page: int = 0,
+    letter: Optional[str] = None
 ) -> InlineKeyboardMarkup:
     """
     Build keyboard for selecting individual meals with quantity controls
@@ -14,6 +19,7 @@ def build_meal_selection_keyboard(
     - Not selected: [☐ Meal name - price]
     - Selected: [✅ Meal name - price]
                 [➖] [Qty: 2] [➕]
+    - Long receipts: one page of meals plus [◀️] [2/7] [▶️] [🔤]
     """
     if selected_meal_ids is None:
         selected_meal_ids = set()
@@ -21,47 +27,65 @@ def build_meal_selection_keyboard(
     if meal_quantities is None:
         meal_quantities = {}
     
-    keyboard_buttons = []
+    page_meals, page, pages = paginate(meals, page, letter)
+    row_groups = []
     
-    for meal in meals:
+    for meal in page_meals:
         is_selected = meal.id in selected_meal_ids
-        checkbox = "✅" if is_selected else "☐"
+        current_qty = meal_quantities.get(meal.id, 1) if is_selected else 0
         
-        # Format price
-        price_display = f"{(meal.price / meal.quantity_available):,}".replace(',', ' ')
-        
-        # Meal button
-        keyboard_buttons.append([
-            InlineKeyboardButton(
-                text=f"{checkbox} {meal.name} - {price_display}",
-                callback_data=f"select_meal:{meal.id}"
-            )
-        ])
-        
-        # If selected, show quantity controls
-        if is_selected:
-            current_qty = meal_quantities.get(meal.id, 1)
-            keyboard_buttons.append([
-                InlineKeyboardButton(
-                    text="➖",
-                    callback_data=f"qty_dec:{meal.id}"
-                ),
-                InlineKeyboardButton(
-                    text=f"Miqdor: {current_qty}",
-                    callback_data=f"qty_noop:{meal.id}"
-                ),
-                InlineKeyboardButton(
-                    text="➕",
-                    callback_data=f"qty_inc:{meal.id}"
-                )
-            ])
+        # Rows depend only on the meal snapshot and its selection state
+        cache_key = ('select', meal.id, meal.name, meal.unit_price, is_selected, current_qty)
+        row_groups.append(
+            row_cache.get(cache_key, lambda: _render_meal_rows(meal, is_selected, current_qty))
+        )
+    
+    tail = []
+    nav_row = build_page_nav_row(SELECTION, page, pages, letter, len(meals))
+    if nav_row:
+        tail.append(nav_row)
     
     # Confirm button
-    keyboard_buttons.append([
+    tail.append([
         InlineKeyboardButton(
             text="✅ Tasdiqlash",
-            callback_data="confirm_own_meals"
+            callback_data=pack(Op.CONFIRM_OWN_MEALS)
         )
     ])
+    keyboard_buttons = assemble(row_groups, tail)
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+
+def _render_meal_rows(meal, is_selected: bool, current_qty: int) -> List[List[InlineKeyboardButton]]:
+    """Meal button row plus quantity controls when selected"""
+    checkbox = "✅" if is_selected else "☐"
+    
+    # Unit price is precomputed on the meal row
+    price_display = format_amount(meal.unit_price)
+    
+    rows = [[
+        InlineKeyboardButton(
+            text=f"{checkbox} {meal.name} - {price_display}",
+            callback_data=pack(Op.SELECT_MEAL, meal.id)
+        )
+    ]]
+    
+    # If selected, show quantity controls
+    if is_selected:
+        rows.append([
+            InlineKeyboardButton(
+                text="➖",
+                callback_data=pack(Op.QTY_DEC, meal.id)
+            ),
+            InlineKeyboardButton(
+                text=f"Miqdor: {current_qty}",
+                callback_data=pack(Op.QTY_NOOP, meal.id)
+            ),
+            InlineKeyboardButton(
+                text="➕",
+                callback_data=pack(Op.QTY_INC, meal.id)
+            )
+        ])
     
-    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
\ No newline at end of file
+    return rows
\ No newline at end of file
@@ -1,4 +1,8 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from typing import Optional
+from keyboards.render_cache import row_cache, assemble
+from keyboards.pagination import paginate, build_page_nav_row, CATEGORIZATION
+from utils import format_amount, pack, Op
 
 
 def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
@@ -23,71 +27,84 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
-                InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_session")
+                InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL_SESSION))
             ]
         ]
     )
     return keyboard
 
 
-def build_categorization_keyboard(meals: list, session_id: str) -> InlineKeyboardMarkup:
+def build_categorization_keyboard(meals: list, session_id: str, page: int = 0, letter: Optional[str] = None) -> InlineKeyboardMarkup:
     """
     Build keyboard for categorizing meals (shared/individual)
     Each meal row has: [Meal checkbox button] [Small edit button]
+    Long receipts are shown one page at a time.
     """
-    keyboard_buttons = []
+    page_meals, page, pages = paginate(meals, page, letter)
+    row_groups = []
     
-    for meal in meals:
-        # Checkbox based on current type
-        checkbox = "✅" if meal.is_shared else "☐"
-        
-        # Show quantity if > 1
-        qty_display = f" ({meal.quantity_available}×)" if meal.quantity_available > 1 else ""
-        
-        # Format price with space separator
-        price_display = f"{meal.price:,}".replace(',', ' ')
-        
-        # Row with meal button and small edit button
-        keyboard_buttons.append([
-            InlineKeyboardButton(
-                text=f"{checkbox} {meal.name}{qty_display} - {price_display}",
-                callback_data=f"toggle:{meal.id}"
-            ),
-            InlineKeyboardButton(
-                text="✏️",  # Small edit icon only
-                callback_data=f"edit:{meal.id}"
-            )
-        ])
+    for meal in page_meals:
+        cache_key = ('categorize', meal.id, meal.name, meal.price, meal.quantity_available, meal.is_shared)
+        row_groups.append(row_cache.get(cache_key, lambda: _render_categorization_row(meal)))
+    
+    tail = []
+    nav_row = build_page_nav_row(CATEGORIZATION, page, pages, letter, len(meals))
+    if nav_row:
+        tail.append(nav_row)
     
     # Done button at the end
-    keyboard_buttons.append([
+    tail.append([
         InlineKeyboardButton(
             text="✅ Davom etish",
-            callback_data="meals_done"
+            callback_data=pack(Op.MEALS_DONE)
         )
     ])
+    keyboard_buttons = assemble(row_groups, tail)
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
 
 
+def _render_categorization_row(meal) -> list:
+    """[Meal checkbox button] [Small edit button]"""
+    # Checkbox based on current type
+    checkbox = "✅" if meal.is_shared else "☐"
+    
+    # Show quantity if > 1
+    qty_display = f" ({meal.quantity_available}×)" if meal.quantity_available > 1 else ""
+    
+    # Format price with space separator
+    price_display = format_amount(meal.price)
+    
+    return [[
+        InlineKeyboardButton(
+            text=f"{checkbox} {meal.name}{qty_display} - {price_display}",
+            callback_data=pack(Op.TOGGLE_SHARED, meal.id)
+        ),
+        InlineKeyboardButton(
+            text="✏️",  # Small edit icon only
+            callback_data=pack(Op.EDIT_MEAL, meal.id)
+        )
+    ]]
+
+
 def get_meal_edit_keyboard(meal_id: int) -> InlineKeyboardMarkup:
     """Keyboard for meal editing options"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
-                InlineKeyboardButton(text="✏️ Nomini o'zgartirish", callback_data=f"edit_name_{meal_id}"),
+                InlineKeyboardButton(text="✏️ Nomini o'zgartirish", callback_data=pack(Op.EDIT_NAME, meal_id)),
             ],
             [
-                InlineKeyboardButton(text="💰 Narxni o'zgartirish", callback_data=f"edit_price_{meal_id}"),
+                InlineKeyboardButton(text="💰 Narxni o'zgartirish", callback_data=pack(Op.EDIT_PRICE, meal_id)),
             ],
             [
-                InlineKeyboardButton(text="🔢 Miqdorini o'zgartirish", callback_data=f"edit_qty_{meal_id}"),
+                InlineKeyboardButton(text="🔢 Miqdorini o'zgartirish", callback_data=pack(Op.EDIT_QTY, meal_id)),
             ],
             [
-                InlineKeyboardButton(text="🗑 O'chirish", callback_data=f"delete_{meal_id}"),
+                InlineKeyboardButton(text="🗑 O'chirish", callback_data=pack(Op.DELETE_MEAL, meal_id)),
             ],
             [
-                InlineKeyboardButton(text="◀️ Orqaga", callback_data="back_to_meals")
+                InlineKeyboardButton(text="◀️ Orqaga", callback_data=pack(Op.BACK_TO_MEALS))
             ]
         ]
     )
@@ -0,0 +1,92 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from typing import Dict, List, Optional, Tuple
+from config import KEYBOARD_PAGE_SIZE
+from utils import pack, unpack, Op
+
+# Keyboard kinds, the first field of Op.PAGE / Op.LETTER / Op.LETTERS callbacks
+SELECTION = "s"
+CATEGORIZATION = "c"
+
+LETTERS_PER_ROW = 6
+
+
+def first_letter(meal) -> str:
+    return (meal.name or "?").strip()[:1].upper() or "?"
+
+
+def paginate(meals: List, page: int = 0, letter: Optional[str] = None, page_size: int = KEYBOARD_PAGE_SIZE) -> Tuple[List, int, int]:
+    """
+    Slice meals to one page, optionally filtered by first letter
+
+    Returns:
+        (page_meals, page, pages) with page clamped to the valid range
+    """
+    if letter:
+        meals = [meal for meal in meals if first_letter(meal) == letter]
+
+    pages = max(1, -(-len(meals) // page_size))
+    page = min(max(page, 0), pages - 1)
+    start = page * page_size
+    return meals[start:start + page_size], page, pages
+
+
+def build_page_nav_row(kind: str, page: int, pages: int, letter: Optional[str], total_meals: int, page_size: int = KEYBOARD_PAGE_SIZE) -> List[InlineKeyboardButton]:
+    """[◀️] [2/7] [▶️] [🔤] row, empty when everything fits on one page"""
+    if total_meals <= page_size and not letter:
+        return []
+
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=pack(Op.PAGE, kind, page - 1)))
+    row.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=pack(Op.PAGE, kind, page)))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=pack(Op.PAGE, kind, page + 1)))
+
+    if letter:
+        row.append(InlineKeyboardButton(text=f"✖️ {letter}", callback_data=pack(Op.LETTER, kind, "")))
+    else:
+        row.append(InlineKeyboardButton(text="🔤", callback_data=pack(Op.LETTERS, kind)))
+    return row
+
+
+def build_letter_keyboard(kind: str, meals: List) -> InlineKeyboardMarkup:
+    """Grid of first letters present in the receipt"""
+    letters = sorted({first_letter(meal) for meal in meals})
+
+    rows = [
+        [
+            InlineKeyboardButton(text=letter, callback_data=pack(Op.LETTER, kind, letter))
+            for letter in letters[i:i + LETTERS_PER_ROW]
+        ]
+        for i in range(0, len(letters), LETTERS_PER_ROW)
+    ]
+    rows.append([InlineKeyboardButton(text="◀️ Orqaga", callback_data=pack(Op.LETTER, kind, ""))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def get_keyboard_view(data: Dict, message_id: int) -> Dict:
+    """Current page/filter of a keyboard message, from FSM data"""
+    views = data.get('keyboard_views') or {}
+    return views.get(str(message_id), {'page': 0, 'letter': None, 'picking': False})
+
+
+def set_keyboard_view(data: Dict, message_id: int, **changes) -> Dict:
+    """Return an updated keyboard_views dict for state.update_data()"""
+    views = dict(data.get('keyboard_views') or {})
+    view = dict(get_keyboard_view(data, message_id))
+    view.update(changes)
+    views[str(message_id)] = view
+    return views
+
+
+def apply_view_callback(data: Dict, message_id: int, callback_data: str) -> Dict:
+    """Turn an Op.PAGE / Op.LETTERS / Op.LETTER tap into the new keyboard_views dict"""
+    op, args = unpack(callback_data)
+    value = args[1] if len(args) > 1 else None
+
+    if op == Op.PAGE:
+        return set_keyboard_view(data, message_id, page=value, picking=False)
+    if op == Op.LETTERS:
+        return set_keyboard_view(data, message_id, picking=True)
+    # Op.LETTER, an empty letter clears the filter
+    return set_keyboard_view(data, message_id, page=0, letter=value or None, picking=False)
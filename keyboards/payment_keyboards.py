@@ -0,0 +1,51 @@
+from typing import List, Tuple
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils import pack, Op
+
+
+def get_mark_paid_keyboard(participant_id: int) -> InlineKeyboardMarkup:
+    """Debtor's button under reminders and the participant summary"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="💸 To'ladim", callback_data=pack(Op.MARK_PAID, participant_id))
+            ]
+        ]
+    )
+
+
+def get_confirm_payment_keyboard(participant_id: int) -> InlineKeyboardMarkup:
+    """Creator's button to confirm the money arrived"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Pul keldi", callback_data=pack(Op.CONFIRM_PAYMENT, participant_id))
+            ]
+        ]
+    )
+
+
+def get_transfer_paid_keyboard(group_chat_id: int, transfers: List[Tuple[int, str, int]]) -> InlineKeyboardMarkup:
+    """Debtor's buttons under a group's plan in /debts, one per (creditor_user_id, name, amount)"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text=f"💸 {name}ga to'ladim",
+                    callback_data=pack(Op.TRANSFER_PAID, group_chat_id, creditor_user_id, amount)
+                )
+            ]
+            for creditor_user_id, name, amount in transfers
+        ]
+    )
+
+
+def get_confirm_transfer_keyboard(transfer_id: int) -> InlineKeyboardMarkup:
+    """Creditor's button to confirm a netted transfer arrived"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Pul keldi", callback_data=pack(Op.TRANSFER_CONFIRM, transfer_id))
+            ]
+        ]
+    )
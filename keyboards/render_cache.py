@@ -0,0 +1,45 @@
+from aiogram.types import InlineKeyboardButton
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Tuple
+
+Rows = Tuple[Tuple[InlineKeyboardButton, ...], ...]
+
+
+class RowCache:
+    """
+    LRU cache of rendered keyboard rows
+
+    A key is everything the rows depend on (meal snapshot fields plus its
+    selection state), so an unchanged meal maps to the very same button
+    objects on every tap and only changed meals are formatted again.
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._rows: "OrderedDict[Hashable, Rows]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, render: Callable[[], List[List[InlineKeyboardButton]]]) -> Rows:
+        rows = self._rows.get(key)
+        if rows is not None:
+            self.hits += 1
+            self._rows.move_to_end(key)
+            return rows
+
+        self.misses += 1
+        rows = tuple(tuple(row) for row in render())
+        self._rows[key] = rows
+        if len(self._rows) > self.max_entries:
+            self._rows.popitem(last=False)
+        return rows
+
+
+row_cache = RowCache()
+
+
+def assemble(row_groups: List[Rows], tail: List[List[InlineKeyboardButton]]) -> List[List[InlineKeyboardButton]]:
+    """Flatten cached row groups (shared, not copied) plus trailing rows"""
+    keyboard = [list(row) for rows in row_groups for row in rows]
+    keyboard.extend(tail)
+    return keyboard
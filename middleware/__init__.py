@@ -1,3 +1,6 @@
 from middleware.logging_middleware import LoggingMiddleware
+from middleware.update_scheduler import UpdateScheduler
+from middleware.throttling_middleware import ThrottlingMiddleware
+from middleware.outbound_rate_limiter import OutboundRateLimiter, bulk_sends
 
-__all__ = ['LoggingMiddleware']
\ No newline at end of file
+__all__ = ['LoggingMiddleware', 'UpdateScheduler', 'ThrottlingMiddleware', 'OutboundRateLimiter', 'bulk_sends']
\ No newline at end of file
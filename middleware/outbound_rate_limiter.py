@@ -0,0 +1,246 @@
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is served first
+INTERACTIVE = 0
+BULK = 1
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+# Methods that never count against chat limits
+_UNLIMITED_METHODS = {
+    "getUpdates", "getMe", "getFile", "setWebhook", "deleteWebhook",
+    "answerCallbackQuery", "getChat", "getChatMember"
+}
+
+
+@contextmanager
+def bulk_sends():
+    """Mark API calls made inside the block as bulk (reminders, broadcasts)"""
+    token = _send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def ready_in(self, now: float) -> float:
+        """Seconds until one token is available"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Bot session middleware pacing every outgoing chat-bound API call
+
+    A global bucket keeps the bot under Telegram's ~30 msg/s limit and a
+    bucket per chat under the per-chat limits (stricter for groups).
+    Waiting calls are granted in priority order, so interactive replies
+    overtake bulk notifications. Each chat keeps a heap of its waiters;
+    the best waiter of every chat that has a token is offered on one
+    grant heap, and chats out of tokens sit on a timer heap until their
+    bucket refills, so a grant costs O(log n). Offers that went stale
+    (granted, cancelled or overtaken) are skipped when popped. A 429 pauses the affected chat (or
+    everything, for global floods) for retry_after and the call is retried.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        private_rate: float = 1.0,
+        private_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3.0,
+        max_retries: int = 3
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, List[Tuple[int, int, asyncio.Future]]] = {}  # chat -> heap of (priority, seq, future)
+        self._ready: List[Tuple[int, int, int]] = []  # heap of (priority, seq, chat_id) offers
+        self._blocked: List[Tuple[float, int]] = []  # heap of (ready_at, chat_id)
+        self._blocked_chats: Set[int] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+        self.stats: Dict[str, float] = {
+            'sent': 0,
+            'retried_429': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0
+        }
+
+    def _prune(self, now: float):
+        """Forget idle chats whose bucket has refilled completely"""
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity and now >= bucket.paused_until:
+                del self._chat_buckets[chat_id]
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _offer_head(self, chat_id: int):
+        """Offer the chat's best live waiter to the grant heap, dropping cancelled ones"""
+        queue = self._queues.get(chat_id)
+        while queue and queue[0][2].done():
+            heapq.heappop(queue)
+        if not queue:
+            self._queues.pop(chat_id, None)
+            return
+        if chat_id not in self._blocked_chats:
+            priority, seq, _ = queue[0]
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+
+    async def _grant_loop(self):
+        while True:
+            now = time.monotonic()
+            while self._blocked and self._blocked[0][0] <= now:
+                _, chat_id = heapq.heappop(self._blocked)
+                self._blocked_chats.discard(chat_id)
+                self._offer_head(chat_id)
+
+            if not self._ready:
+                await self._sleep_or_wake(self._blocked[0][0] - now if self._blocked else None)
+                continue
+
+            global_wait = self.global_bucket.ready_in(now)
+            if global_wait > 0:
+                await self._sleep_or_wake(global_wait)
+                continue
+
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._queues.get(chat_id)
+            if chat_id in self._blocked_chats or not queue or queue[0][:2] != (priority, seq):
+                continue  # Stale offer; the chat's current head is offered separately
+            if queue[0][2].done():
+                self._offer_head(chat_id)
+                continue
+
+            bucket = self._bucket(chat_id)
+            chat_wait = bucket.ready_in(now)
+            if chat_wait > 0:
+                heapq.heappush(self._blocked, (now + chat_wait, chat_id))
+                self._blocked_chats.add(chat_id)
+                continue
+
+            bucket.tokens -= 1
+            self.global_bucket.tokens -= 1
+            _, _, future = heapq.heappop(queue)
+            future.set_result(None)
+            self._offer_head(chat_id)
+
+    async def _sleep_or_wake(self, delay: Optional[float]):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def acquire(self, chat_id: int, priority: int):
+        if self._loop_task is None or self._loop_task.done():
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._grant_loop())
+
+        started = time.monotonic()
+        if len(self._chat_buckets) > 10000:
+            self._prune(started)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        queue = self._queues.setdefault(chat_id, [])
+        heapq.heappush(queue, entry)
+        if queue[0] is entry and chat_id not in self._blocked_chats:
+            heapq.heappush(self._ready, (priority, entry[1], chat_id))
+        self._wakeup.set()
+        await future
+
+        wait_ms = (time.monotonic() - started) * 1000
+        self.stats['wait_total_ms'] += wait_ms
+        self.stats['wait_max_ms'] = max(self.stats['wait_max_ms'], wait_ms)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if method.__api_method__ in _UNLIMITED_METHODS or not isinstance(chat_id, int):
+            return await make_request(bot, method)
+
+        priority = _send_priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.stats['sent'] += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.stats['retried_429'] += 1
+                pause_until = time.monotonic() + e.retry_after
+                self._bucket(chat_id).paused_until = pause_until
+                if e.retry_after > 5:
+                    # Long pauses usually mean a bot-wide flood limit
+                    self.global_bucket.paused_until = pause_until
+                logger.warning(f"⏳ 429 on {method.__api_method__} for chat {chat_id}, retry in {e.retry_after}s")
+
+    def metrics(self) -> Dict[str, float]:
+        waiting = [entry for queue in self._queues.values() for entry in queue if not entry[2].done()]
+        sent = self.stats['sent']
+        return {
+            'queued_interactive': sum(1 for entry in waiting if entry[0] == INTERACTIVE),
+            'queued_bulk': sum(1 for entry in waiting if entry[0] == BULK),
+            'tracked_chats': len(self._chat_buckets),
+            'sent': sent,
+            'retried_429': self.stats['retried_429'],
+            'wait_avg_ms': self.stats['wait_total_ms'] / sent if sent else 0.0,
+            'wait_max_ms': self.stats['wait_max_ms']
+        }
@@ -0,0 +1,132 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from collections import deque
+from typing import Callable, Dict, Any, Awaitable, Deque, Optional, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Operation classes
+PHOTO = "photo"
+CALLBACK = "callback"
+MESSAGE = "message"
+
+
+class SlidingWindow:
+    """At most `limit` hits in any `period` seconds"""
+
+    __slots__ = ('limit', 'period', 'hits', 'notified_at')
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.hits: Deque[float] = deque()
+        self.notified_at = 0.0
+
+    def allow(self, now: float) -> bool:
+        while self.hits and now - self.hits[0] >= self.period:
+            self.hits.popleft()
+        if len(self.hits) >= self.limit:
+            return False
+        self.hits.append(now)
+        return True
+
+    def retry_in(self, now: float) -> float:
+        return max(0.0, self.period - (now - self.hits[0])) if self.hits else 0.0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-user flood protection, registered as an outer update middleware
+
+    Photos (AI analysis), callbacks and other messages each get their own
+    sliding-window budget. Over-budget updates stop here: callbacks are
+    answered with a short notice and nothing touches the DB or the AI.
+    Register it before UpdateScheduler so floods never get queued.
+    """
+
+    def __init__(
+        self,
+        photo_limit: Tuple[int, float] = (3, 60),
+        callback_limit: Tuple[int, float] = (20, 10),
+        message_limit: Tuple[int, float] = (10, 10),
+        max_tracked_users: int = 50000
+    ):
+        self.limits = {
+            PHOTO: photo_limit,
+            CALLBACK: callback_limit,
+            MESSAGE: message_limit
+        }
+        self.max_tracked_users = max_tracked_users
+        self._windows: Dict[Tuple[int, str], SlidingWindow] = {}
+        self.stats: Dict[str, int] = {PHOTO: 0, CALLBACK: 0, MESSAGE: 0}
+
+    @staticmethod
+    def classify(update: Update) -> Optional[str]:
+        if update.callback_query:
+            return CALLBACK
+        if update.message:
+            if update.message.photo or update.message.document:
+                return PHOTO
+            return MESSAGE
+        return None
+
+    def _window(self, user_id: int, kind: str) -> SlidingWindow:
+        key = (user_id, kind)
+        window = self._windows.get(key)
+        if window is None:
+            if len(self._windows) >= self.max_tracked_users:
+                self._prune(time.monotonic())
+            window = self._windows[key] = SlidingWindow(*self.limits[kind])
+        return window
+
+    def _prune(self, now: float):
+        for key, window in list(self._windows.items()):
+            if not window.hits or now - window.hits[-1] >= window.period:
+                del self._windows[key]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        kind = self.classify(event) if isinstance(event, Update) else None
+
+        if user is None or kind is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        window = self._window(user.id, kind)
+        if window.allow(now):
+            return await handler(event, data)
+
+        self.stats[kind] += 1
+        await self._notify(event, data, window, kind, now)
+        logger.warning(f"🚦 Throttled {kind} from user {user.id}")
+        return None
+
+    async def _notify(self, update: Update, data: Dict[str, Any], window: SlidingWindow, kind: str, now: float):
+        """Tell the user once per window; callbacks must always be answered"""
+        bot = data.get("bot")
+        if bot is None:
+            return
+
+        wait = int(window.retry_in(now)) + 1
+        try:
+            if kind == CALLBACK:
+                await bot.answer_callback_query(
+                    update.callback_query.id,
+                    text=f"⏳ Juda tez! {wait} soniyadan keyin urinib ko'ring."
+                )
+            elif now - window.notified_at >= window.period:
+                window.notified_at = now
+                if kind == PHOTO:
+                    text = f"⏳ Juda ko'p rasm yuborildi. {wait} soniyadan keyin qayta yuboring."
+                else:
+                    text = f"⏳ Juda ko'p xabar. {wait} soniyadan keyin davom eting."
+                await bot.send_message(update.message.chat.id, text)
+        except Exception as e:
+            logger.debug(f"Throttle notice failed: {e}")
@@ -0,0 +1,131 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from collections import deque
+from typing import Callable, Dict, Any, Awaitable, Deque, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('handler', 'event', 'data', 'future', 'enqueued_at')
+
+    def __init__(self, handler, event, data, future):
+        self.handler = handler
+        self.event = event
+        self.data = data
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Outer update middleware: strict per-chat ordering, parallel across chats
+
+    Every update is queued on its chat's FIFO. A fixed pool of workers
+    serves chats round-robin, running at most one update per chat at a
+    time, so concurrent taps in one chat never race on FSM data while a
+    slow receipt analysis in one chat does not hold up the others.
+
+    Register on dp.update.outer_middleware so chat context is resolved first.
+    """
+
+    def __init__(self, workers: int = 32, max_chat_queue: int = 100):
+        self.workers = workers
+        self.max_chat_queue = max_chat_queue
+
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+        self.stats: Dict[str, float] = {
+            'processed': 0,
+            'dropped': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0
+        }
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"🧵 Update scheduler started with {self.workers} workers")
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._queues[chat_id]
+            job = queue.popleft()
+
+            wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+            self.stats['processed'] += 1
+            self.stats['wait_total_ms'] += wait_ms
+            self.stats['wait_max_ms'] = max(self.stats['wait_max_ms'], wait_ms)
+
+            try:
+                if not job.future.cancelled():
+                    job.future.set_result(await job.handler(job.event, job.data))
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                # Requeue the chat behind the others, or forget it when drained
+                if queue:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._queues[chat_id]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        chat_id = chat.id if chat else user.id if user else None
+
+        if chat_id is None:
+            return await handler(event, data)
+
+        if self._ready is None:
+            self._start()
+
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            schedule = True
+        else:
+            schedule = False
+
+        if len(queue) >= self.max_chat_queue:
+            self.stats['dropped'] += 1
+            logger.warning(f"⚠️ Chat {chat_id} queue full ({len(queue)}), dropping update")
+            return None
+
+        job = _Job(handler, event, data, asyncio.get_running_loop().create_future())
+        queue.append(job)
+        if schedule:
+            self._ready.put_nowait(chat_id)
+
+        return await job.future
+
+    def metrics(self) -> Dict[str, float]:
+        """Queue depth and wait-time snapshot"""
+        depths = [len(queue) for queue in self._queues.values()]
+        processed = self.stats['processed']
+        return {
+            'active_chats': len(depths),
+            'queued_updates': sum(depths),
+            'max_chat_depth': max(depths, default=0),
+            'processed': processed,
+            'dropped': self.stats['dropped'],
+            'wait_avg_ms': self.stats['wait_total_ms'] / processed if processed else 0.0,
+            'wait_max_ms': self.stats['wait_max_ms']
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
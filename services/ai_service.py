@@ -1,5 +1,6 @@
 import base64
 import json
+import mimetypes
 import openai
 from config import OPENAI_API_KEY
 import logging
@@ -21,6 +22,7 @@ class AIService:
             # Read and encode image
             with open(image_path, "rb") as f:
                 image_data = base64.b64encode(f.read()).decode("utf-8")
+            mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
             
             # Call OpenAI API
             response = openai.chat.completions.create(
@@ -33,7 +35,7 @@ class AIService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
+                                    "url": f"data:{mime_type};base64,{image_data}"
                                 }
                             }
                         ]
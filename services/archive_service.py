@@ -0,0 +1,282 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, update, delete, func, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from database.models import (
+    Session as DBSession,
+    SessionParticipant,
+    SessionStatus,
+    PaymentStatus,
+    ArchivedSession,
+    ArchivedSessionMember
+)
+from database.connection import async_session_maker
+from config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_BATCH_PAUSE_SECONDS,
+    ARCHIVE_MAX_BATCHES_PER_RUN,
+    ARCHIVE_INTERVAL_SECONDS
+)
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def serialize_session(db_session: DBSession) -> Dict:
+    """
+    Snapshot a session with meals, participants and selections as plain JSON
+
+    Used both for the archive payload and for the read-through history path,
+    so callers see the same shape wherever the session lives.
+    """
+    return {
+        'id': str(db_session.id),
+        'creator_user_id': db_session.creator_user_id,
+        'creator_username': db_session.creator_username,
+        'creator_first_name': db_session.creator_first_name,
+        'restaurant_name': db_session.restaurant_name,
+        'total_amount': db_session.total_amount,
+        'receipt_image_id': db_session.receipt_image_id,
+        'receipt_data': db_session.receipt_data,
+        'card_number': db_session.card_number,
+        'participant_count': db_session.participant_count,
+        'has_delivery': db_session.has_delivery,
+        'shared_total': db_session.shared_total,
+        'individual_total': db_session.individual_total,
+        'status': db_session.status.value,
+        'created_at': _iso(db_session.created_at),
+        'updated_at': _iso(db_session.updated_at),
+        'meals': [
+            {
+                'id': meal.id,
+                'name': meal.name,
+                'price': meal.price,
+                'unit_price': meal.unit_price,
+                'quantity_available': meal.quantity_available,
+                'is_shared': meal.is_shared,
+                'is_delivery': meal.is_delivery,
+                'position': meal.position
+            }
+            for meal in sorted(db_session.meals, key=lambda m: m.position)
+        ],
+        'participants': [
+            {
+                'id': participant.id,
+                'user_id': participant.user_id,
+                'username': participant.username,
+                'first_name': participant.first_name,
+                'is_creator': participant.is_creator,
+                'is_delivery_person': participant.is_delivery_person,
+                'has_confirmed': participant.has_confirmed,
+                'payment_status': participant.payment_status.value,
+                'paid_at': _iso(participant.paid_at),
+                'individual_total': participant.individual_total,
+                'shared_portion': participant.shared_portion,
+                'total_amount': participant.total_amount,
+                'selections': [
+                    {'meal_id': selection.meal_id, 'quantity_selected': selection.quantity_selected}
+                    for selection in participant.selections
+                ]
+            }
+            for participant in db_session.participants
+        ]
+    }
+
+
+async def complete_settled_sessions(session: AsyncSession, session_ids: Iterable[uuid.UUID]) -> List[uuid.UUID]:
+    """
+    SELECTING -> COMPLETED for sessions whose every seat is taken and paid
+
+    A session is done once as many participants have confirmed their meals
+    as the creator announced, and every one of them except the creator has
+    a CONFIRMED payment. Runs in the caller's transaction after payments
+    are confirmed; completed sessions are what the archiver moves out.
+
+    Returns:
+        Ids of the sessions that were completed
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return []
+
+    confirmed = (
+        select(func.count(SessionParticipant.id))
+        .where(SessionParticipant.session_id == DBSession.id)
+        .where(SessionParticipant.has_confirmed == True)
+        .scalar_subquery()
+    )
+    unpaid = (
+        exists()
+        .where(SessionParticipant.session_id == DBSession.id)
+        .where(SessionParticipant.has_confirmed == True)
+        .where(SessionParticipant.is_creator == False)
+        .where(SessionParticipant.payment_status != PaymentStatus.CONFIRMED)
+    )
+    completed = (await session.execute(
+        update(DBSession)
+        .where(DBSession.id.in_(session_ids))
+        .where(DBSession.status == SessionStatus.SELECTING)
+        .where(confirmed >= func.coalesce(DBSession.participant_count, 0))
+        .where(~unpaid)
+        .values(status=SessionStatus.COMPLETED, updated_at=datetime.utcnow())
+        .returning(DBSession.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+
+    for session_id in completed:
+        logger.info(f"🏁 Session {session_id} completed")
+    return list(completed)
+
+
+def _session_with_children():
+    return select(DBSession).options(
+        selectinload(DBSession.meals),
+        selectinload(DBSession.participants).selectinload(SessionParticipant.selections)
+    )
+
+
+class ArchiveService:
+    """Moves old COMPLETED sessions out of the hot tables in small batches"""
+
+    def __init__(
+        self,
+        archive_after: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        batch_pause: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+        max_batches: int = ARCHIVE_MAX_BATCHES_PER_RUN
+    ):
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.max_batches = max_batches
+        self.archived_total = 0
+
+    async def archive_batch(self, cutoff: datetime) -> int:
+        """
+        Archive one batch of sessions completed before cutoff in a single transaction
+
+        Rows are claimed with FOR UPDATE SKIP LOCKED so several bot processes
+        can run the archiver without stepping on each other.
+
+        Returns:
+            Number of sessions archived
+        """
+        async with async_session_maker() as session:
+            async with session.begin():
+                result = await session.execute(
+                    _session_with_children()
+                    .where(DBSession.status == SessionStatus.COMPLETED)
+                    .where(DBSession.updated_at < cutoff)
+                    .order_by(DBSession.updated_at)
+                    .limit(self.batch_size)
+                    .with_for_update(of=DBSession, skip_locked=True)
+                )
+                sessions = result.scalars().all()
+
+                if not sessions:
+                    return 0
+
+                now = datetime.utcnow()
+                for db_session in sessions:
+                    archived = ArchivedSession(
+                        id=db_session.id,
+                        creator_user_id=db_session.creator_user_id,
+                        restaurant_name=db_session.restaurant_name,
+                        total_amount=db_session.total_amount,
+                        payload=serialize_session(db_session),
+                        created_at=db_session.created_at,
+                        completed_at=db_session.updated_at,
+                        archived_at=now
+                    )
+                    archived.members = [
+                        ArchivedSessionMember(
+                            user_id=participant.user_id,
+                            first_name=participant.first_name,
+                            is_creator=participant.is_creator,
+                            total_amount=participant.total_amount,
+                            payment_status=participant.payment_status,
+                            paid_at=participant.paid_at,
+                            created_at=participant.created_at
+                        )
+                        for participant in db_session.participants
+                    ]
+                    session.add(archived)
+
+                # Children go with the FK cascades
+                await session.execute(
+                    delete(DBSession).where(DBSession.id.in_([s.id for s in sessions]))
+                )
+
+        return len(sessions)
+
+    async def run_once(self) -> int:
+        """Archive everything due, pausing between batches to limit DB pressure"""
+        cutoff = datetime.utcnow() - self.archive_after
+        archived = 0
+
+        for _ in range(self.max_batches):
+            count = await self.archive_batch(cutoff)
+            archived += count
+
+            if count < self.batch_size:
+                break
+
+            await asyncio.sleep(self.batch_pause)
+
+        self.archived_total += archived
+        if archived:
+            logger.info(f"📦 Archived {archived} completed sessions (total: {self.archived_total})")
+        return archived
+
+    async def run_forever(self, interval: int = ARCHIVE_INTERVAL_SECONDS):
+        """Background loop, started from bot.py"""
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Archival run failed: {e}", exc_info=True)
+
+            await asyncio.sleep(interval)
+
+
+async def get_session_history(session_id: uuid.UUID) -> Optional[Dict]:
+    """
+    Read-through lookup for history views
+
+    Checks the hot tables first and falls back to the archive. Both paths
+    return the serialize_session() shape.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(
+            _session_with_children().where(DBSession.id == session_id)
+        )
+        db_session = result.scalar_one_or_none()
+
+        if db_session:
+            return serialize_session(db_session)
+
+        archived = await session.get(ArchivedSession, session_id)
+        return archived.payload if archived else None
+
+
+async def get_archived_sessions_for_user(user_id: int, limit: int = 20) -> List[ArchivedSession]:
+    """Archived sessions where the user was creator or participant, newest first"""
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(ArchivedSession)
+            .join(ArchivedSessionMember, ArchivedSessionMember.session_id == ArchivedSession.id)
+            .where(ArchivedSessionMember.user_id == user_id)
+            .order_by(ArchivedSession.created_at.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().unique().all())
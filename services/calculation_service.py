@@ -1,312 +1,561 @@
-from typing import Dict, List
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-from database.models import Session as DBSession, Meal, SessionParticipant
-from database.connection import async_session_maker
-from states.receipt_states import ReceiptStates
-from keyboards import get_cancel_keyboard, get_yes_no_keyboard, build_meal_selection_keyboard
-from utils import format_amount
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set
+import numpy as np
+from sqlalchemy import select, update, func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Session as DBSession, Meal, SessionParticipant, UserMealSelection
+from services.netting_service import debt_network
+from services.spending_service import record_spending
 import logging
 import uuid
 
 logger = logging.getLogger(__name__)
 
-router = Router()
-
-
-@router.message(ReceiptStates.entering_restaurant_name)
-async def process_restaurant_name(message: Message, state: FSMContext):
-    """Handle restaurant name input"""
-    restaurant_name = message.text.strip()
-    
-    if len(restaurant_name) < 2 or len(restaurant_name) > 100:
-        await message.answer(
-            "❌ Restoran nomi 2-100 belgi orasida bo'lishi kerak.\n"
-            "Iltimos, qaytadan kiriting:"
-        )
-        return
-    
-    data = await state.get_data()
-    session_id = data.get('session_id')
-    
-    async with async_session_maker() as session:
-        try:
-            result = await session.execute(
-                select(DBSession).where(DBSession.id == uuid.UUID(session_id))
-            )
-            db_session = result.scalar_one_or_none()
-            
-            if db_session:
-                db_session.restaurant_name = restaurant_name
-                await session.commit()
-                
-                await message.answer(f"✅ Restoran nomi saqlandi: <b>{restaurant_name}</b>")
-                
-                await state.set_state(ReceiptStates.entering_participant_count)
-                
-                await message.answer(
-                    "👥 <b>Necha kishi ovqatlandingiz?</b>\n\n"
-                    "O'zingizni ham hisobga oling.\n"
-                    "Masalan: agar 3 kishi bo'lsangiz, 3 deb yozing.",
-                    reply_markup=get_cancel_keyboard()
-                )
-                
-                logger.info(f"Restaurant name set: {restaurant_name} for session {session_id}")
-            
-        except Exception as e:
-            logger.error(f"Error saving restaurant name: {e}")
-            await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
-
-
-@router.message(ReceiptStates.entering_participant_count)
-async def process_participant_count(message: Message, state: FSMContext):
-    """Handle participant count input"""
-    try:
-        count = int(message.text.strip())
-        
-        if count < 2 or count > 50:
-            await message.answer(
-                "❌ Ishtirokchilar soni 2 dan 50 gacha bo'lishi kerak.\n"
-                "Iltimos, to'g'ri raqam kiriting:"
-            )
-            return
-        
-        data = await state.get_data()
-        session_id = data.get('session_id')
-        
-        async with async_session_maker() as session:
-            try:
-                result = await session.execute(
-                    select(DBSession).where(DBSession.id == uuid.UUID(session_id))
-                )
-                db_session = result.scalar_one_or_none()
-                
-                if db_session:
-                    db_session.participant_count = count
-                    
-                    # Calculate totals
-                    meals_result = await session.execute(
-                        select(Meal).where(Meal.session_id == uuid.UUID(session_id))
-                    )
-                    meals = meals_result.scalars().all()
-                    
-                    totals = calculate_totals(meals, count)
-                    db_session.shared_total = totals['shared_total']
-                    db_session.individual_total = totals['individual_total']
-                    
-                    await session.commit()
-                    
-                    await message.answer(f"✅ Ishtirokchilar soni: <b>{count} kishi</b>")
-                    
-                    await state.set_state(ReceiptStates.entering_card_number)
-                    
-                    await message.answer(
-                        "💳 <b>Karta raqamingizni kiriting</b>\n\n"
-                        "Boshqalar sizga pul o'tkazishi uchun.\n"
-                        "Masalan: 8600 1234 5678 9012",
-                        reply_markup=get_cancel_keyboard()
-                    )
-                    
-                    logger.info(f"Participant count set: {count} for session {session_id}")
-                
-            except Exception as e:
-                logger.error(f"Error saving participant count: {e}")
-                await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
-        
-    except ValueError:
-        await message.answer(
-            "❌ Iltimos, faqat raqam kiriting.\n"
-            "Masalan: 3"
-        )
-
-
-@router.message(ReceiptStates.entering_card_number)
-async def process_card_number(message: Message, state: FSMContext):
-    """Handle card number input"""
-    card_number = message.text.strip()
-    
-    digits_only = ''.join(filter(str.isdigit, card_number))
-    
-    if len(digits_only) < 16 or len(digits_only) > 19:
-        await message.answer(
-            "❌ Karta raqami 16-19 raqamdan iborat bo'lishi kerak.\n"
-            "Iltimos, to'g'ri karta raqamini kiriting:"
-        )
-        return
-    
-    data = await state.get_data()
-    session_id = data.get('session_id')
-    
-    async with async_session_maker() as session:
-        try:
-            result = await session.execute(
-                select(DBSession).where(DBSession.id == uuid.UUID(session_id))
-            )
-            db_session = result.scalar_one_or_none()
-            
-            if db_session:
-                db_session.card_number = card_number
-                await session.commit()
-                
-                await message.answer(f"✅ Karta raqami saqlandi: <code>{card_number}</code>")
-                
-                await state.set_state(ReceiptStates.checking_delivery)
-                
-                await message.answer(
-                    "🚚 <b>Delivery bor edimi?</b>\n\n"
-                    "Ya'ni, kimdir uchun ofisga olib kelgan ovqat bor edimi?",
-                    reply_markup=get_yes_no_keyboard("delivery_yes", "delivery_no")
-                )
-                
-                logger.info(f"Card number set for session {session_id}")
-            
-        except Exception as e:
-            logger.error(f"Error saving card number: {e}")
-            await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
-
-
-@router.callback_query(F.data == "delivery_yes")
-async def delivery_yes_callback(callback: CallbackQuery, state: FSMContext):
-    """Handle delivery yes"""
-    data = await state.get_data()
-    session_id = data.get('session_id')
-    
-    async with async_session_maker() as session:
-        try:
-            result = await session.execute(
-                select(DBSession).where(DBSession.id == uuid.UUID(session_id))
-            )
-            db_session = result.scalar_one_or_none()
-            
-            if db_session:
-                db_session.has_delivery = True
-                await session.commit()
-                
-                await callback.message.edit_text("✅ Delivery bor deb belgilandi")
-                
-                # Move to meal selection
-                await show_own_meal_selection(callback.message, state, session_id)
-                
-                await callback.answer()
-                logger.info(f"Delivery enabled for session {session_id}")
-        
-        except Exception as e:
-            logger.error(f"Error setting delivery: {e}")
-            await callback.answer("Xatolik", show_alert=True)
-
-
-@router.callback_query(F.data == "delivery_no")
-async def delivery_no_callback(callback: CallbackQuery, state: FSMContext):
-    """Handle delivery no"""
-    data = await state.get_data()
-    session_id = data.get('session_id')
-    
-    async with async_session_maker() as session:
-        try:
-            result = await session.execute(
-                select(DBSession).where(DBSession.id == uuid.UUID(session_id))
-            )
-            db_session = result.scalar_one_or_none()
-            
-            if db_session:
-                db_session.has_delivery = False
-                await session.commit()
-                
-                await callback.message.edit_text("✅ Delivery yo'q deb belgilandi")
-                
-                # Move to meal selection
-                await show_own_meal_selection(callback.message, state, session_id)
-                
-                await callback.answer()
-                logger.info(f"No delivery for session {session_id}")
-        
-        except Exception as e:
-            logger.error(f"Error setting delivery: {e}")
-            await callback.answer("Xatolik", show_alert=True)
-
-
-
-async def show_own_meal_selection(message: Message, state: FSMContext, session_id: str):
-    """Show individual meal selection for main user"""
-    async with async_session_maker() as session:
-        try:
-            # Get only individual meals (not shared)
-            result = await session.execute(
-                select(Meal)
-                .where(Meal.session_id == uuid.UUID(session_id))
-                .where(Meal.is_shared == False)
-                .order_by(Meal.position)
-            )
-            individual_meals = result.scalars().all()
-            
-            if not individual_meals:
-                await message.answer(
-                    "ℹ️ Individual ovqatlar yo'q.\n"
-                    "Faqat shared ovqatlar bor."
-                )
-                # TODO: Move to next step (sharing)
-                return
-            
-            # Set state
-            await state.set_state(ReceiptStates.selecting_own_meals)
-            await state.update_data(
-                selected_meal_ids=set(),
-                meal_quantities={}
-            )
-            
-            # Build keyboard
-            keyboard = build_meal_selection_keyboard(individual_meals)
-            
-            await message.answer(
-                "👇 <b>O'zingiz nimalar yeganingizni tanlang:</b>\n\n"
-                "Ovqatni bosing, keyin miqdorini sozlang.",
-                reply_markup=keyboard
-            )
-            
-            logger.info(f"Showing {len(individual_meals)} individual meals to main user")
-            
-        except Exception as e:
-            logger.error(f"Error showing meal selection: {e}")
-            await message.answer("❌ Xatolik yuz berdi.")
-
-def calculate_totals(meals: List, participant_count: int) -> Dict:
-    """Calculate shared and individual totals"""
-    shared_total = 0.0
-    individual_total = 0.0
-    
-    for meal in meals:
-        # Price is always the TOTAL price for all quantities
-        meal_total = float(meal.price)
-        
-        if meal.is_shared:
-            shared_total += meal_total
-        else:
-            individual_total += meal_total
-    
-    shared_per_person = shared_total / participant_count if participant_count > 0 else 0.0
-    
-    return {
-        'shared_total': shared_total,
-        'individual_total': individual_total,
-        'shared_per_person': shared_per_person,
-        'total': shared_total + individual_total
+# Meal kinds, one per matrix row
+INDIVIDUAL = 0
+SHARED = 1
+DELIVERY = 2
+
+
+class SettlementError(ValueError):
+    """Selections that cannot be settled, e.g. more units claimed than bought"""
+
+
+def meal_kind(meal) -> int:
+    if meal.is_delivery:
+        return DELIVERY
+    return SHARED if meal.is_shared else INDIVIDUAL
+
+
+def allocate(prices: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Split every row's price over its columns in proportion to the weights
+
+    Each row is floored and the leftover tiyin go one by one to the columns
+    with the largest remainders (ties to the leftmost), so every row sums to
+    its price exactly and nothing is lost or invented by rounding.
+    """
+    denominators = weights.sum(axis=1)
+    if (denominators <= 0).any():
+        raise SettlementError("Every meal row needs a positive weight")
+
+    scaled = prices[:, None] * weights
+    amounts = scaled // denominators[:, None]
+    remainders = scaled % denominators[:, None]
+    leftover = prices - amounts.sum(axis=1)
+
+    order = np.argsort(-remainders, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(weights.shape[1]), order.shape), axis=1)
+    return amounts + (ranks < leftover[:, None])
+
+
+def settle_matrix(
+    prices: np.ndarray,
+    available: np.ndarray,
+    kinds: np.ndarray,
+    quantities: np.ndarray,
+    participant_count: int = 0
+) -> Dict:
+    """
+    Settle a whole session in one vectorized pass
+
+    Args:
+        prices: line totals in tiyin, one per meal
+        available: units bought per meal
+        kinds: INDIVIDUAL / SHARED / DELIVERY per meal
+        quantities: meals × participants matrix of claimed units. For shared
+            and delivery meals a non-zero entry means "I share this"; a
+            meal nobody marked is split among everyone who ate.
+        participant_count: how many people ate, including ones that have
+            not joined yet (their shares are reported as pending)
+
+    Returns:
+        Dict with per-column individual/shared/delivery amounts, pending
+        and unclaimed money. All amounts add up to the receipt total.
+    """
+    meal_count, joined = quantities.shape
+    pending_slots = max(participant_count - joined, 0)
+    eaters = joined + pending_slots
+
+    # Columns: joined participants | pending slots | unclaimed
+    weights = np.zeros((meal_count, eaters + 1), dtype=np.int64)
+    weights[:, :joined] = quantities
+
+    individual = kinds == INDIVIDUAL
+    claimed = quantities.sum(axis=1)
+    if (claimed[individual] > available[individual]).any():
+        raise SettlementError("More units claimed than available")
+    weights[individual, -1] = available[individual] - claimed[individual]
+
+    # Shared rows nobody narrowed down are split among everyone who ate
+    everyone = ~individual & (claimed == 0)
+    weights[everyone, :eaters] = 1
+    weights[~individual & (weights.sum(axis=1) == 0), -1] = 1
+
+    amounts = allocate(prices, weights)
+
+    by_kind = {
+        kind: amounts[kinds == kind].sum(axis=0)
+        for kind in (INDIVIDUAL, SHARED, DELIVERY)
     }
-    
-def calculate_participant_total(selected_meals: List, shared_portion: float, participant_count: int) -> Dict:
-    """Calculate what one participant owes"""
-    individual_total = 0.0
-    
-    for selection in selected_meals:
-        # Price per unit = total price / quantity available
-        price_per_unit = float(selection.meal.price) / float(selection.meal.quantity_available)
-        individual_total += price_per_unit * float(selection.quantity_selected)
-    
-    total = individual_total + shared_portion
-    
+    totals = amounts.sum(axis=0)
+
     return {
-        'individual_total': individual_total,
-        'shared_portion': shared_portion,
-        'total': total
-    }
\ No newline at end of file
+        'total': int(prices.sum()),
+        'individual_total': int(prices[individual].sum()),
+        'shared_total': int(prices[kinds == SHARED].sum()),
+        'delivery_total': int(prices[kinds == DELIVERY].sum()),
+        'individual': by_kind[INDIVIDUAL][:joined],
+        'shared': by_kind[SHARED][:joined],
+        'delivery': by_kind[DELIVERY][:joined],
+        'totals': totals[:joined],
+        'pending': int(totals[joined:eaters].sum()),
+        'pending_slots': pending_slots,
+        'unclaimed': int(totals[-1])
+    }
+
+
+def settle(meals: Sequence, participant_ids: List[int], selections: Sequence, participant_count: int = 0) -> Dict:
+    """
+    Settle from ORM rows (or anything with the same attributes)
+
+    Args:
+        meals: Meal rows of the session
+        participant_ids: SessionParticipant ids, one matrix column each
+        selections: (participant_id, meal_id, quantity_selected) rows
+
+    Returns:
+        settle_matrix() result plus 'participants': {participant_id: amounts}
+    """
+    row = {meal.id: i for i, meal in enumerate(meals)}
+    column = {participant_id: j for j, participant_id in enumerate(participant_ids)}
+
+    prices = np.fromiter((meal.price for meal in meals), dtype=np.int64, count=len(meals))
+    available = np.fromiter((meal.quantity_available for meal in meals), dtype=np.int64, count=len(meals))
+    kinds = np.fromiter((meal_kind(meal) for meal in meals), dtype=np.int8, count=len(meals))
+
+    quantities = np.zeros((len(meals), len(participant_ids)), dtype=np.int64)
+    picked = [(row[m], column[p], q) for p, m, q in selections if m in row and p in column]
+    if picked:
+        rows, columns, values = zip(*picked)
+        np.add.at(quantities, (np.array(rows), np.array(columns)), np.array(values, dtype=np.int64))
+
+    result = settle_matrix(prices, available, kinds, quantities, participant_count)
+    result['participants'] = {
+        participant_id: {
+            'individual_total': int(result['individual'][j]),
+            'shared_portion': int(result['shared'][j]),
+            'delivery_portion': int(result['delivery'][j]),
+            'total_amount': int(result['totals'][j])
+        }
+        for participant_id, j in column.items()
+    }
+    return result
+
+
+async def bump_settlement_version(session: AsyncSession, session_id) -> int:
+    """
+    Increment Session.settlement_version in the caller's transaction
+
+    Row-locks the session until commit. Meal edits use it directly; a
+    settlement only takes this path after losing a compare-and-set.
+    """
+    return (await session.execute(
+        update(DBSession)
+        .where(DBSession.id == session_id)
+        .values(settlement_version=func.coalesce(DBSession.settlement_version, 0) + 1)
+        .returning(DBSession.settlement_version)
+        .execution_options(synchronize_session=False)
+    )).scalar_one()
+
+
+async def _advance_version(session: AsyncSession, db_session: DBSession, seen: int) -> Optional[int]:
+    """
+    Compare-and-set seen -> seen + 1, None if another transaction got there first
+
+    Issued after the settlement's reads and writes, so the session row is
+    only locked from here to the caller's commit. A concurrent settlement
+    that read the same version waits for that commit, then misses.
+    """
+    version = (await session.execute(
+        update(DBSession)
+        .where(DBSession.id == db_session.id)
+        .where(func.coalesce(DBSession.settlement_version, 0) == seen)
+        .values(settlement_version=seen + 1)
+        .returning(DBSession.settlement_version)
+        .execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    if version is not None:
+        set_committed_value(db_session, 'settlement_version', version)
+    return version
+
+
+async def settle_session(session: AsyncSession, db_session: DBSession, locked: bool = False) -> Dict:
+    """
+    Recompute and store every participant's amounts for one session
+
+    Runs inside the caller's transaction; pending changes are flushed by
+    the queries, so just-added selections are included. Only confirmed
+    participants get a column: someone who merely opened the join link
+    holds no share, the seat stays pending.
+
+    No lock is held while settling: the version read with db_session is
+    compare-and-set at the end. If another settlement committed meanwhile,
+    the session is settled again with its row locked (locked=True), which
+    sees every committed change.
+
+    The cached ledger and the debt network are updated before the caller
+    commits; on rollback call ledgers.invalidate(db_session.id) and
+    debt_network.reset(). A ledger left behind by a rollback in another
+    process is caught by its settlement_version.
+    """
+    if locked:
+        version = await bump_settlement_version(session, db_session.id)
+        set_committed_value(db_session, 'settlement_version', version)
+    else:
+        seen = db_session.settlement_version or 0
+
+    meals = (await session.execute(
+        select(Meal).where(Meal.session_id == db_session.id).order_by(Meal.position)
+    )).scalars().all()
+
+    participants = (await session.execute(
+        select(SessionParticipant)
+        .where(SessionParticipant.session_id == db_session.id)
+        .where(SessionParticipant.has_confirmed == True)
+        .order_by(SessionParticipant.id)
+        # Rows another settlement committed meanwhile (rolled_up_amount) must not be stale
+        .execution_options(populate_existing=True)
+    )).scalars().all()
+
+    selections = (await session.execute(
+        select(UserMealSelection.participant_id, UserMealSelection.meal_id, UserMealSelection.quantity_selected)
+        .join(Meal, Meal.id == UserMealSelection.meal_id)
+        .where(Meal.session_id == db_session.id)
+    )).all()
+
+    participant_ids = [p.id for p in participants]
+    participant_count = db_session.participant_count or 0
+    result = settle(meals, participant_ids, selections, participant_count)
+    ledgers.stats['full'] += 1
+
+    for participant in participants:
+        amounts = result['participants'][participant.id]
+        participant.individual_total = amounts['individual_total']
+        participant.shared_portion = amounts['shared_portion']
+        participant.total_amount = amounts['total_amount']
+        debt_network.record(participant, db_session)
+    await record_spending(session, db_session, participants)
+
+    db_session.individual_total = result['individual_total']
+    db_session.shared_total = result['shared_total'] + result['delivery_total']
+
+    if not locked:
+        version = await _advance_version(session, db_session, seen)
+        if version is None:
+            ledgers.stats['lost_races'] += 1
+            return await settle_session(session, db_session, locked=True)
+
+    # Later selection changes on this session are applied incrementally
+    ledger = SettlementLedger.from_rows(db_session.id, meals, participant_ids, selections, participant_count)
+    ledger.version = version
+    ledgers.put(ledger)
+
+    logger.info(
+        f"🧮 Settled session {db_session.id}: {len(meals)} meals × {len(participants)} participants, "
+        f"pending {result['pending']}, unclaimed {result['unclaimed']}"
+    )
+    return result
+
+
+def allocate_row(price: int, weights: Dict[int, int]) -> Dict[int, int]:
+    """
+    allocate() for a single sparse row {column: weight}
+
+    Same floor + largest remainder rule and the same tie-break (lower
+    column first), so it reproduces the matrix result cell for cell.
+    """
+    denominator = sum(weights.values())
+    if denominator <= 0:
+        raise SettlementError("Every meal row needs a positive weight")
+
+    amounts = {}
+    remainders = {}
+    for column, weight in weights.items():
+        amounts[column], remainders[column] = divmod(price * weight, denominator)
+
+    leftover = price - sum(amounts.values())
+    for column in sorted(remainders, key=lambda c: (-remainders[c], c))[:leftover]:
+        amounts[column] += 1
+    return amounts
+
+
+class SettlementLedger:
+    """
+    Running settlement of one session, updated per selection change
+
+    Keeps what settle_matrix() would compute, but as aggregates: units
+    claimed per meal, the current allocation of every meal row and the
+    individual/shared/delivery sums per eater column. Changing one
+    selection re-allocates only that meal's row and applies the difference
+    to the sums, so the cost does not grow with the number of meals or
+    selections in the session. Joined participants occupy the first
+    columns in participant id order, like the matrix in settle_session(),
+    so largest-remainder tie-breaks land on the same people in both paths.
+    A participant joining after everyone with a lower id takes over the
+    next pending slot, whose amounts are already allocated; otherwise the
+    columns are renumbered and every row re-split.
+
+    Anything that breaks an invariant raises SettlementError; callers then
+    fall back to a full settle_session(). `version` is the
+    Session.settlement_version the ledger reflects.
+    """
+
+    def __init__(self, session_id, meals: Sequence, participant_count: int):
+        self.session_id = session_id
+        self.version = 0
+        self.participant_count = participant_count
+        self.meals = {
+            meal.id: (meal.price, meal.quantity_available, meal_kind(meal))
+            for meal in meals
+        }
+        self.total = sum(price for price, _, _ in self.meals.values())
+
+        self.slots: Dict[int, int] = {}  # participant_id -> column
+        self.eaters = participant_count
+        self.unclaimed = participant_count  # last column
+
+        self.quantities: Dict[int, Dict[int, int]] = {meal_id: {} for meal_id in self.meals}
+        self.claimed: Dict[int, int] = {meal_id: 0 for meal_id in self.meals}
+        self.rows: Dict[int, Dict[int, int]] = {}
+        self.sums = {kind: [0] * (self.eaters + 1) for kind in (INDIVIDUAL, SHARED, DELIVERY)}
+
+        for meal_id in self.meals:
+            self._reallocate(meal_id)
+
+    @classmethod
+    def from_rows(cls, session_id, meals: Sequence, participant_ids: List[int], selections: Sequence, participant_count: int) -> "SettlementLedger":
+        ledger = cls(session_id, meals, max(participant_count, len(participant_ids)))
+        for participant_id in sorted(participant_ids):
+            ledger.add_participant(participant_id)
+        for participant_id, meal_id, quantity in selections:
+            if meal_id in ledger.meals and participant_id in ledger.slots:
+                ledger.set_selection(participant_id, meal_id, ledger.quantities[meal_id].get(ledger.slots[participant_id], 0) + quantity)
+        return ledger
+
+    def _weights(self, meal_id: int) -> Dict[int, int]:
+        _, available, kind = self.meals[meal_id]
+        weights = dict(self.quantities[meal_id])
+
+        if kind == INDIVIDUAL:
+            if available - self.claimed[meal_id] > 0:
+                weights[self.unclaimed] = available - self.claimed[meal_id]
+        elif not weights:
+            # Nobody narrowed the shared meal down: everyone who ate pays
+            weights = {column: 1 for column in range(self.eaters)} or {self.unclaimed: 1}
+        return weights
+
+    def _reallocate(self, meal_id: int) -> Set[int]:
+        """Re-split one row and move the difference into the sums"""
+        price, _, kind = self.meals[meal_id]
+        old = self.rows.get(meal_id, {})
+        new = allocate_row(price, self._weights(meal_id))
+        if sum(new.values()) != price:
+            raise SettlementError(f"Row for meal {meal_id} does not add up")
+
+        sums = self.sums[kind]
+        changed = set()
+        for column in old.keys() | new.keys():
+            delta = new.get(column, 0) - old.get(column, 0)
+            if delta:
+                sums[column] += delta
+                changed.add(column)
+        self.rows[meal_id] = new
+        return changed
+
+    def add_participant(self, participant_id: int) -> Set[int]:
+        """
+        Give a joining participant its column, in participant id order
+
+        Returns:
+            Participant ids whose amounts changed
+        """
+        if participant_id in self.slots:
+            return set()
+        if len(self.slots) >= self.eaters:
+            raise SettlementError("More participants than the session has room for")
+        if all(other < participant_id for other in self.slots):
+            self.slots[participant_id] = len(self.slots)
+            return {participant_id}
+
+        # Joined out of id order: shift the later columns up by one and re-split
+        before = {other: self.amounts(other) for other in self.slots}
+        order = sorted([*self.slots, participant_id])
+        moved = {self.slots[other]: column for column, other in enumerate(order) if other in self.slots}
+        self.slots = {other: column for column, other in enumerate(order)}
+        self.quantities = {
+            meal_id: {moved[column]: quantity for column, quantity in row.items()}
+            for meal_id, row in self.quantities.items()
+        }
+        self.rows = {}
+        self.sums = {kind: [0] * (self.eaters + 1) for kind in self.sums}
+        for meal_id in self.meals:
+            self._reallocate(meal_id)
+        return {participant_id} | {other for other, amounts in before.items() if self.amounts(other) != amounts}
+
+    def set_selection(self, participant_id: int, meal_id: int, quantity: int) -> Set[int]:
+        """
+        Set one participant's quantity for one meal (0 removes it)
+
+        Returns:
+            Participant ids whose amounts changed
+        """
+        if meal_id not in self.meals or participant_id not in self.slots:
+            raise SettlementError(f"Unknown meal {meal_id} or participant {participant_id}")
+        if quantity < 0:
+            raise SettlementError("Negative quantity")
+
+        column = self.slots[participant_id]
+        row = self.quantities[meal_id]
+        claimed = self.claimed[meal_id] - row.get(column, 0) + quantity
+
+        _, available, kind = self.meals[meal_id]
+        if kind == INDIVIDUAL and claimed > available:
+            raise SettlementError(f"Meal {meal_id}: {claimed} of {available} units claimed")
+
+        if quantity:
+            row[column] = quantity
+        else:
+            row.pop(column, None)
+        self.claimed[meal_id] = claimed
+
+        changed_columns = self._reallocate(meal_id)
+        by_column = {slot: pid for pid, slot in self.slots.items()}
+        return {by_column[column] for column in changed_columns if column in by_column}
+
+    def amounts(self, participant_id: int) -> Dict[str, int]:
+        column = self.slots[participant_id]
+        individual = self.sums[INDIVIDUAL][column]
+        shared = self.sums[SHARED][column]
+        delivery = self.sums[DELIVERY][column]
+        return {
+            'individual_total': individual,
+            'shared_portion': shared,
+            'delivery_portion': delivery,
+            'total_amount': individual + shared + delivery
+        }
+
+    def check(self):
+        """Every tiyin of the receipt is allocated exactly once"""
+        allocated = sum(sum(sums) for sums in self.sums.values())
+        if allocated != self.total:
+            raise SettlementError(f"Ledger allocates {allocated}, receipt total is {self.total}")
+
+
+class LedgerCache:
+    """Ledgers of recently active sessions, least recently used evicted"""
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._ledgers: "OrderedDict[uuid.UUID, SettlementLedger]" = OrderedDict()
+        self.stats: Dict[str, int] = {'incremental': 0, 'full': 0, 'stale': 0, 'lost_races': 0, 'invariant_failures': 0}
+
+    def get(self, session_id) -> Optional[SettlementLedger]:
+        ledger = self._ledgers.get(session_id)
+        if ledger is not None:
+            self._ledgers.move_to_end(session_id)
+        return ledger
+
+    def put(self, ledger: SettlementLedger):
+        self._ledgers[ledger.session_id] = ledger
+        self._ledgers.move_to_end(ledger.session_id)
+        if len(self._ledgers) > self.max_sessions:
+            self._ledgers.popitem(last=False)
+
+    def take(self, session_id) -> Optional[SettlementLedger]:
+        """Remove and return a ledger; a transaction holds it until put() back"""
+        return self._ledgers.pop(session_id, None)
+
+    def invalidate(self, session_id):
+        """Drop a ledger after meal edits or a rolled back transaction"""
+        self._ledgers.pop(session_id, None)
+
+
+ledgers = LedgerCache()
+
+
+async def apply_selection_changes(
+    session: AsyncSession,
+    db_session: DBSession,
+    changes: Sequence,
+    joined: Sequence[int] = ()
+) -> Dict[int, Dict[str, int]]:
+    """
+    Incremental settlement for selection changes in the caller's transaction
+
+    Args:
+        changes: (participant_id, meal_id, new_quantity) triples already
+            written to user_meal_selections
+        joined: ids of participants created in this transaction
+
+    Returns:
+        {participant_id: amounts} for every participant whose amounts changed;
+        those rows are updated. On any invariant violation the whole session
+        is settled from scratch instead. If the transaction is rolled back,
+        call ledgers.invalidate(db_session.id) and debt_network.reset().
+
+    The ledger is cached per process and taken out of the cache while a
+    transaction applies changes to it, so concurrent transactions in this
+    process settle in full instead of sharing it. It is only used when it
+    matches the session's settlement_version; nothing is locked until the
+    compare-and-set at the end, and losing that race (another process
+    committed a change meanwhile) means a full settle instead.
+    """
+    seen = db_session.settlement_version or 0
+    ledger = ledgers.take(db_session.id)
+    if ledger is not None and ledger.version != seen:
+        ledgers.stats['stale'] += 1
+        ledger = None
+    changed = set()
+
+    try:
+        if ledger is None or ledger.participant_count != max(db_session.participant_count or 0, len(ledger.slots)):
+            raise SettlementError("No current ledger for this session")
+
+        for participant_id in joined:
+            changed |= ledger.add_participant(participant_id)
+        for participant_id, meal_id, quantity in changes:
+            changed |= ledger.set_selection(participant_id, meal_id, quantity)
+        ledger.check()
+    except SettlementError as e:
+        if ledger is not None:
+            ledgers.stats['invariant_failures'] += 1
+            logger.warning(f"⚠️ Settlement ledger for {db_session.id} rebuilt: {e}")
+        result = await settle_session(session, db_session)
+        return result['participants']
+
+    amounts = {participant_id: ledger.amounts(participant_id) for participant_id in changed}
+
+    if amounts:
+        participants = (await session.execute(
+            select(SessionParticipant).where(SessionParticipant.id.in_(amounts))
+        )).scalars().all()
+        for participant in participants:
+            participant.individual_total = amounts[participant.id]['individual_total']
+            participant.shared_portion = amounts[participant.id]['shared_portion']
+            participant.total_amount = amounts[participant.id]['total_amount']
+            debt_network.record(participant, db_session)
+        await record_spending(session, db_session, participants)
+
+    version = await _advance_version(session, db_session, seen)
+    if version is None:
+        ledgers.stats['lost_races'] += 1
+        result = await settle_session(session, db_session, locked=True)
+        return result['participants']
+
+    ledger.version = version
+    ledgers.put(ledger)
+    ledgers.stats['incremental'] += 1
+    return amounts
@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Meal
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+async def claim_units(session: AsyncSession, session_id: uuid.UUID, meal_id: int, units: int) -> bool:
+    """
+    Atomically reserve (or, with negative units, release) units of one meal
+
+    A single conditional UPDATE ... WHERE claimed + n <= quantity_available:
+    Postgres re-checks the condition on the latest row version, so two
+    concurrent claims for the last unit cannot both succeed. Only the meal's
+    row is locked, until the caller's transaction ends.
+    """
+    result = await session.execute(
+        update(Meal)
+        .where(Meal.id == meal_id)
+        .where(Meal.session_id == session_id)
+        .where(Meal.is_shared == False)
+        .where(Meal.claimed + units <= Meal.quantity_available)
+        .where(Meal.claimed + units >= 0)
+        .values(claimed=Meal.claimed + units)
+        .returning(Meal.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def claim_meals(session: AsyncSession, session_id: uuid.UUID, claims: Dict[int, int]) -> Tuple[List[int], List[int]]:
+    """
+    Reserve several meals in the caller's transaction
+
+    Meals are claimed in id order, so concurrent claimers with overlapping
+    meals lock rows in the same order and never deadlock.
+
+    Returns:
+        (claimed meal ids, rejected meal ids). Roll back if anything was
+        rejected to release the claims made so far.
+    """
+    claimed, rejected = [], []
+    for meal_id in sorted(claims):
+        if await claim_units(session, session_id, meal_id, claims[meal_id]):
+            claimed.append(meal_id)
+        else:
+            rejected.append(meal_id)
+
+    if rejected:
+        logger.info(f"🍽 Claim rejected in session {session_id}: meals {rejected}")
+    return claimed, rejected
+
+
+async def remaining_units(session: AsyncSession, meal_id: int) -> Optional[int]:
+    """Units nobody has confirmed yet, for live feedback before claiming"""
+    result = await session.execute(
+        select(Meal.quantity_available - Meal.claimed).where(Meal.id == meal_id)
+    )
+    return result.scalar_one_or_none()
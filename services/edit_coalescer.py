@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+from config import EDIT_COALESCE_WINDOW_MS
+import logging
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]
+RenderFn = Callable[[], Awaitable[Optional[InlineKeyboardMarkup]]]
+
+
+def markup_digest(markup: Optional[InlineKeyboardMarkup]) -> str:
+    """Stable hash of a rendered keyboard"""
+    if markup is None:
+        return ""
+    raw = markup.model_dump_json(exclude_none=True).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class EditCoalescer:
+    """
+    Collapses rapid keyboard edits of the same message into one
+
+    Handlers answer the callback right away and hand over a render function
+    instead of editing. Within `window` seconds only the last render per
+    message is run, and the edit is skipped when the rendered markup hash
+    matches what the message already shows. One edit per message is in
+    flight at a time, so edits never arrive out of order.
+    """
+
+    def __init__(self, window: float = EDIT_COALESCE_WINDOW_MS / 1000, max_tracked: int = 10000):
+        self.window = window
+        self.max_tracked = max_tracked
+
+        self._pending: Dict[MessageKey, Tuple[Bot, RenderFn]] = {}
+        self._tasks: Dict[MessageKey, asyncio.Task] = {}
+        self._digests: "OrderedDict[MessageKey, str]" = OrderedDict()
+
+        self.stats: Dict[str, int] = {
+            'scheduled': 0,
+            'coalesced': 0,
+            'sent': 0,
+            'unchanged': 0,
+            'failed': 0
+        }
+
+    def schedule(self, message: Message, render: RenderFn):
+        """Queue a keyboard re-render for message"""
+        key = (message.chat.id, message.message_id)
+        self.stats['scheduled'] += 1
+
+        if key not in self._digests:
+            self._remember(key, markup_digest(message.reply_markup))
+
+        if key in self._pending:
+            self.stats['coalesced'] += 1
+        self._pending[key] = (message.bot, render)
+
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    def cancel(self, message: Message):
+        """
+        Drop a queued re-render of message
+
+        Call before replacing the message or clearing the state its render
+        reads, so a late edit does not bring back the old keyboard.
+        """
+        key = (message.chat.id, message.message_id)
+        self._pending.pop(key, None)
+        self._digests.pop(key, None)
+        task = self._tasks.pop(key, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    def _remember(self, key: MessageKey, digest: str):
+        self._digests[key] = digest
+        self._digests.move_to_end(key)
+        while len(self._digests) > self.max_tracked:
+            self._digests.popitem(last=False)
+
+    async def _run(self, key: MessageKey):
+        try:
+            delay = self.window
+            while key in self._pending:
+                await asyncio.sleep(delay)
+                bot, render = self._pending.pop(key)
+                delay = await self._send(key, bot, render) or self.window
+        finally:
+            # cancel() may already have handed the key to a newer task
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def _send(self, key: MessageKey, bot: Bot, render: RenderFn) -> Optional[float]:
+        """Render and edit once, returns a backoff delay after a flood error"""
+        try:
+            markup = await render()
+            digest = markup_digest(markup)
+
+            if self._digests.get(key) == digest:
+                self.stats['unchanged'] += 1
+                return None
+
+            await bot.edit_message_reply_markup(chat_id=key[0], message_id=key[1], reply_markup=markup)
+            self._remember(key, digest)
+            self.stats['sent'] += 1
+
+        except TelegramRetryAfter as e:
+            # Keep the newest pending render if there is one, else retry this one
+            self._pending.setdefault(key, (bot, render))
+            logger.warning(f"⏳ Edit for {key} rate limited, retrying in {e.retry_after}s")
+            return float(e.retry_after)
+
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                self._remember(key, digest)
+                self.stats['unchanged'] += 1
+            else:
+                self.stats['failed'] += 1
+                logger.error(f"❌ Keyboard edit failed for {key}: {e}")
+
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"❌ Keyboard render failed for {key}: {e}", exc_info=True)
+
+        return None
+
+
+edit_coalescer = EditCoalescer()
@@ -0,0 +1,230 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import (
+    Session as DBSession,
+    SessionParticipant,
+    ArchivedSession,
+    ArchivedSessionMember,
+    PaymentStatus
+)
+from database.connection import async_session_maker
+from config import HISTORY_PAGE_SIZE, HISTORY_CACHE_TTL_SECONDS
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Cursor phases: live sessions first, then the archive (always older)
+HOT = "h"
+ARCHIVE = "a"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Cursor(NamedTuple):
+    """Position after the last row shown: (created_at, id) of the member row, 0/0 = from the top"""
+    phase: str
+    created_at_us: int
+    row_id: int
+
+
+FIRST_PAGE = Cursor(HOT, 0, 0)
+
+
+class HistoryEntry(NamedTuple):
+    session_id: uuid.UUID
+    restaurant_name: Optional[str]
+    created_at: datetime
+    status: str  # SessionStatus value, or "archived"
+    is_creator: bool
+    session_total: Optional[int]
+    my_amount: Optional[int]
+    my_payment_status: PaymentStatus
+    owed_to_me: int  # Creator only: amounts still PENDING
+    paid_to_me: int  # Creator only: amounts PAID or CONFIRMED
+
+
+class HistoryPage(NamedTuple):
+    entries: List[HistoryEntry]
+    next_cursor: Optional[Cursor]
+
+
+def to_micros(value: datetime) -> int:
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _after(member, cursor: Cursor):
+    """Keyset condition: rows strictly older than the cursor, served by the (user_id, created_at, id) index"""
+    return tuple_(member.created_at, member.id) < tuple_(from_micros(cursor.created_at_us), cursor.row_id)
+
+
+async def _creator_totals(session: AsyncSession, member, session_ids: List) -> Dict:
+    """session_id -> (pending, paid) amounts of the other members"""
+    if not session_ids:
+        return {}
+    rows = (await session.execute(
+        select(member.session_id, member.payment_status, func.sum(member.total_amount))
+        .where(member.session_id.in_(session_ids))
+        .where(member.is_creator == False)
+        .group_by(member.session_id, member.payment_status)
+    )).all()
+
+    totals: Dict = {}
+    for session_id, status, amount in rows:
+        pending, paid = totals.get(session_id, (0, 0))
+        if status == PaymentStatus.PENDING:
+            pending += amount or 0
+        else:
+            paid += amount or 0
+        totals[session_id] = (pending, paid)
+    return totals
+
+
+async def _hot_rows(session: AsyncSession, user_id: int, cursor: Cursor, limit: int) -> List[Tuple[int, HistoryEntry]]:
+    query = (
+        select(
+            SessionParticipant.id,
+            SessionParticipant.created_at,
+            SessionParticipant.is_creator,
+            SessionParticipant.total_amount,
+            SessionParticipant.payment_status,
+            DBSession.id,
+            DBSession.restaurant_name,
+            DBSession.total_amount,
+            DBSession.status
+        )
+        .join(DBSession, DBSession.id == SessionParticipant.session_id)
+        .where(SessionParticipant.user_id == user_id)
+        .where(SessionParticipant.has_confirmed == True)
+        .order_by(SessionParticipant.created_at.desc(), SessionParticipant.id.desc())
+        .limit(limit)
+    )
+    if cursor.created_at_us:
+        query = query.where(_after(SessionParticipant, cursor))
+    rows = (await session.execute(query)).all()
+
+    totals = await _creator_totals(session, SessionParticipant, [row[5] for row in rows if row[2]])
+    return [
+        (row_id, HistoryEntry(
+            session_id, restaurant, created_at, status.value, is_creator, session_total,
+            amount, payment_status, *totals.get(session_id, (0, 0))
+        ))
+        for row_id, created_at, is_creator, amount, payment_status, session_id, restaurant, session_total, status in rows
+    ]
+
+
+async def _archived_rows(session: AsyncSession, user_id: int, cursor: Cursor, limit: int) -> List[Tuple[int, HistoryEntry]]:
+    query = (
+        select(
+            ArchivedSessionMember.id,
+            ArchivedSessionMember.created_at,
+            ArchivedSessionMember.is_creator,
+            ArchivedSessionMember.total_amount,
+            ArchivedSessionMember.payment_status,
+            ArchivedSession.id,
+            ArchivedSession.restaurant_name,
+            ArchivedSession.total_amount
+        )
+        .join(ArchivedSession, ArchivedSession.id == ArchivedSessionMember.session_id)
+        .where(ArchivedSessionMember.user_id == user_id)
+        .order_by(ArchivedSessionMember.created_at.desc(), ArchivedSessionMember.id.desc())
+        .limit(limit)
+    )
+    if cursor.created_at_us:
+        query = query.where(_after(ArchivedSessionMember, cursor))
+    rows = (await session.execute(query)).all()
+
+    totals = await _creator_totals(session, ArchivedSessionMember, [row[5] for row in rows if row[2]])
+    return [
+        (row_id, HistoryEntry(
+            session_id, restaurant, created_at, "archived", is_creator, session_total,
+            amount, payment_status, *totals.get(session_id, (0, 0))
+        ))
+        for row_id, created_at, is_creator, amount, payment_status, session_id, restaurant, session_total in rows
+    ]
+
+
+async def load_history_page(user_id: int, cursor: Cursor = FIRST_PAGE, page_size: int = HISTORY_PAGE_SIZE) -> HistoryPage:
+    """
+    One page of the user's sessions, newest first, as creator or participant
+
+    Keyset pagination: each query seeks straight to the cursor on the
+    (user_id, created_at, id) index and reads page_size + 1 rows, so page
+    50 costs the same as page 1. Live sessions come first, then archived
+    ones, which are always older.
+    """
+    rows: List[Tuple[int, HistoryEntry]] = []
+    async with async_session_maker() as session:
+        if cursor.phase == HOT:
+            rows = await _hot_rows(session, user_id, cursor, page_size + 1)
+            if len(rows) > page_size:
+                last_id, last = rows[page_size - 1]
+                return HistoryPage(
+                    [entry for _, entry in rows[:page_size]],
+                    Cursor(HOT, to_micros(last.created_at), last_id)
+                )
+            cursor = Cursor(ARCHIVE, 0, 0)
+
+        archived = await _archived_rows(session, user_id, cursor, page_size - len(rows) + 1)
+
+    entries = [entry for _, entry in rows]
+    room = page_size - len(entries)
+    entries += [entry for _, entry in archived[:room]]
+
+    next_cursor = None
+    if len(archived) > room:
+        if room:
+            last_id, last = archived[room - 1]
+            next_cursor = Cursor(ARCHIVE, to_micros(last.created_at), last_id)
+        else:
+            next_cursor = Cursor(ARCHIVE, 0, 0)
+    return HistoryPage(entries, next_cursor)
+
+
+class HistoryCache:
+    """
+    First history page per user, the one opened from the main menu
+
+    Later pages are cheap keyset queries and are not cached. Handlers that
+    change a user's participation or payments call invalidate(); the TTL
+    covers changes made by other users in the same sessions.
+    """
+
+    def __init__(self, ttl: float = HISTORY_CACHE_TTL_SECONDS, max_users: int = 5000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._pages: "OrderedDict[int, Tuple[float, HistoryPage]]" = OrderedDict()
+        self.stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+    async def get_page(self, user_id: int, cursor: Optional[Cursor] = None) -> HistoryPage:
+        if cursor is not None and cursor != FIRST_PAGE:
+            return await load_history_page(user_id, cursor)
+
+        entry = self._pages.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.stats['hits'] += 1
+            self._pages.move_to_end(user_id)
+            return entry[1]
+
+        self.stats['misses'] += 1
+        page = await load_history_page(user_id)
+        self._pages[user_id] = (time.monotonic(), page)
+        self._pages.move_to_end(user_id)
+        if len(self._pages) > self.max_users:
+            self._pages.popitem(last=False)
+        return page
+
+    def invalidate(self, *user_ids: int):
+        for user_id in user_ids:
+            self._pages.pop(user_id, None)
+
+
+history = HistoryCache()
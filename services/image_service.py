@@ -0,0 +1,165 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+from aiogram import Bot
+from aiogram.types import PhotoSize, Document
+from PIL import Image
+import numpy as np
+from config import (
+    RECEIPT_MIN_PIXELS,
+    MAX_FILE_SIZE_MB,
+    QUALITY_MIN_SHORT_SIDE,
+    QUALITY_MIN_SHARPNESS,
+    QUALITY_MIN_BRIGHTNESS,
+    QUALITY_MAX_CLIPPED,
+    QUALITY_MIN_RECEIPT_AREA
+)
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Running totals across receipts, for logs/metrics
+download_stats: Dict[str, float] = {
+    'receipts': 0,
+    'bytes': 0,
+    'ms': 0.0
+}
+
+
+def select_photo_size(photos: List[PhotoSize], min_pixels: int = RECEIPT_MIN_PIXELS) -> PhotoSize:
+    """
+    Smallest PhotoSize with at least min_pixels, or the largest one available
+
+    Telegram sends several resolutions of every photo; the medium ones are
+    usually legible enough for receipt text and download much faster.
+    """
+    candidates = sorted(photos, key=lambda p: p.width * p.height)
+    for photo in candidates:
+        if photo.width * photo.height >= min_pixels:
+            return photo
+    return candidates[-1]
+
+
+# File suffix per image MIME type; Telegram photos are always JPEG
+IMAGE_SUFFIXES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/bmp': '.bmp',
+    'image/tiff': '.tiff'
+}
+
+
+def receipt_suffix(document: Optional[Document] = None) -> str:
+    """File suffix for a downloaded receipt: from the MIME type, then the file name, else .jpg"""
+    if document is None:
+        return '.jpg'
+    suffix = IMAGE_SUFFIXES.get((document.mime_type or "").lower())
+    if suffix is None and document.file_name:
+        suffix = Path(document.file_name).suffix.lower() or None
+    return suffix or '.jpg'
+
+
+def is_receipt_document(document: Optional[Document]) -> bool:
+    """Uncompressed image sent as a file, within Telegram's download limit"""
+    if document is None or not (document.mime_type or "").startswith("image/"):
+        return False
+    return (document.file_size or 0) <= MAX_FILE_SIZE_MB * 1024 * 1024
+
+
+async def download_receipt_image(bot: Bot, file_id: str, destination: Path) -> Dict:
+    """
+    Download a receipt image and record size and time
+
+    Returns:
+        Dict with bytes and ms for this download
+    """
+    started = time.perf_counter()
+
+    file = await bot.get_file(file_id)
+    await bot.download_file(file.file_path, destination)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    size = file.file_size or destination.stat().st_size
+
+    download_stats['receipts'] += 1
+    download_stats['bytes'] += size
+    download_stats['ms'] += elapsed_ms
+
+    logger.info(f"📥 Downloaded {destination.name}: {size / 1024:.0f} KB in {elapsed_ms:.0f}ms")
+    return {'bytes': size, 'ms': round(elapsed_ms, 1)}
+
+
+# Retake hints shown to the user, keyed by check_receipt_quality() reason
+QUALITY_HINTS = {
+    'resolution': "Rasm juda kichik. Checkni yaqinroqdan, to'liq suratga oling.",
+    'dark': "Rasm juda qorong'i. Yorug'roq joyda suratga oling.",
+    'overexposed': "Rasmda blik bor. Chiroq yoki quyosh aksi tushmaydigan qilib suratga oling.",
+    'blurry': "Rasm xira. Telefonni qimirlatmasdan, fokuslab qayta suratga oling.",
+    'receipt_area': "Check rasmda juda kichik. Check kadrning ko'p qismini egallasin."
+}
+
+# Long side used for the pixel statistics; keeps the gate in the millisecond range
+_ANALYSIS_SIDE = 1024
+
+
+def _otsu_threshold(gray: np.ndarray) -> float:
+    """Brightness threshold separating paper from background"""
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(histogram)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(histogram * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return float(np.argmax(between))
+
+
+def check_receipt_quality(image_path: str) -> Dict:
+    """
+    Fast local checks before spending an AI call on a photo
+
+    Checks resolution, exposure (mean brightness and blown-out share),
+    sharpness (variance of the Laplacian) and how much of the frame the
+    bright receipt paper covers.
+
+    Returns:
+        Dict with ok, reason (None or a QUALITY_HINTS key) and metrics
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+        gray_image = image.convert("L")
+        gray_image.thumbnail((_ANALYSIS_SIDE, _ANALYSIS_SIDE))
+        gray = np.asarray(gray_image, dtype=np.float32)
+
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    threshold = _otsu_threshold(gray)
+
+    metrics = {
+        'width': width,
+        'height': height,
+        'brightness': round(float(gray.mean()), 1),
+        'clipped': round(float((gray >= 254).mean()), 3),
+        'sharpness': round(float(laplacian.var()), 1),
+        'receipt_area': round(float((gray > threshold).mean()), 3)
+    }
+
+    if min(width, height) < QUALITY_MIN_SHORT_SIDE:
+        reason = 'resolution'
+    elif metrics['brightness'] < QUALITY_MIN_BRIGHTNESS:
+        reason = 'dark'
+    elif metrics['clipped'] > QUALITY_MAX_CLIPPED:
+        reason = 'overexposed'
+    elif metrics['sharpness'] < QUALITY_MIN_SHARPNESS:
+        reason = 'blurry'
+    elif metrics['receipt_area'] < QUALITY_MIN_RECEIPT_AREA:
+        reason = 'receipt_area'
+    else:
+        reason = None
+
+    return {'ok': reason is None, 'reason': reason, 'metrics': metrics}
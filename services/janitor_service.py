@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from aiogram.fsm.storage.base import BaseStorage
+from sqlalchemy import select, delete, func
+from database.models import Session as DBSession, Meal, SessionStatus
+from database.connection import async_session_maker
+from config import (
+    SESSION_ABANDON_AFTER_SECONDS,
+    JANITOR_BATCH_SIZE,
+    JANITOR_INTERVAL_SECONDS,
+    JANITOR_BATCH_PAUSE_SECONDS
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LifecycleJanitor:
+    """
+    Reclaims abandoned flows so memory and table sizes stay bounded
+
+    - FSM contexts idle past the storage TTL (storage.purge_expired())
+    - Sessions stuck in CREATING since before the abandon threshold, with
+      their meals; scanned via ix_sessions_status_updated_at
+    """
+
+    def __init__(
+        self,
+        storage: Optional[BaseStorage] = None,
+        abandon_after: timedelta = timedelta(seconds=SESSION_ABANDON_AFTER_SECONDS),
+        batch_size: int = JANITOR_BATCH_SIZE,
+        batch_pause: float = JANITOR_BATCH_PAUSE_SECONDS
+    ):
+        self.storage = storage
+        self.abandon_after = abandon_after
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.counters: Dict[str, int] = {
+            'runs': 0,
+            'fsm_contexts_expired': 0,
+            'sessions_reclaimed': 0,
+            'meals_reclaimed': 0
+        }
+
+    async def purge_fsm(self) -> int:
+        """Expire idle FSM contexts if the storage supports it"""
+        purge = getattr(self.storage, 'purge_expired', None)
+        if purge is None:
+            return 0
+
+        expired = 0
+        while True:
+            count = await purge(limit=self.batch_size)
+            expired += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+
+        self.counters['fsm_contexts_expired'] += expired
+        return expired
+
+    async def reclaim_sessions_batch(self, cutoff: datetime) -> int:
+        """Delete one batch of abandoned CREATING sessions, returns sessions deleted"""
+        async with async_session_maker() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(DBSession.id)
+                    .where(DBSession.status == SessionStatus.CREATING)
+                    .where(DBSession.updated_at < cutoff)
+                    .order_by(DBSession.updated_at)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                session_ids = list(result.scalars().all())
+
+                if not session_ids:
+                    return 0
+
+                meals_count = await session.execute(
+                    select(func.count(Meal.id)).where(Meal.session_id.in_(session_ids))
+                )
+                self.counters['meals_reclaimed'] += meals_count.scalar_one()
+
+                # Meals and selections go with the FK cascades
+                await session.execute(
+                    delete(DBSession).where(DBSession.id.in_(session_ids))
+                )
+
+        self.counters['sessions_reclaimed'] += len(session_ids)
+        return len(session_ids)
+
+    async def reclaim_sessions(self) -> int:
+        cutoff = datetime.utcnow() - self.abandon_after
+        reclaimed = 0
+
+        while True:
+            count = await self.reclaim_sessions_batch(cutoff)
+            reclaimed += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+
+        return reclaimed
+
+    async def run_once(self) -> Dict[str, int]:
+        """One janitor pass, returns what this pass reclaimed"""
+        expired = await self.purge_fsm()
+        reclaimed = await self.reclaim_sessions()
+        self.counters['runs'] += 1
+
+        if expired or reclaimed:
+            logger.info(f"🧹 Janitor: {expired} FSM contexts expired, {reclaimed} abandoned sessions reclaimed")
+
+        return {'fsm_contexts_expired': expired, 'sessions_reclaimed': reclaimed}
+
+    async def run_forever(self, interval: int = JANITOR_INTERVAL_SECONDS):
+        """Background loop, started from bot.py"""
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Janitor run failed: {e}", exc_info=True)
+
+            await asyncio.sleep(interval)
@@ -0,0 +1,310 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Set, Tuple
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Session as DBSession, SessionParticipant, SessionStatus, PaymentStatus, DebtTransfer
+from database.connection import async_session_maker
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Transfer(NamedTuple):
+    debtor: int  # user_id who pays
+    creditor: int  # user_id who receives
+    amount: int  # tiyin
+
+
+def plan_transfers(balances: Dict[int, int]) -> List[Transfer]:
+    """
+    Min-cash-flow plan settling net balances (positive = is owed money)
+
+    Debtors and creditors with exactly opposite balances are paired first
+    (one transfer each). The rest is settled greedily, largest debtor to
+    largest creditor via two heaps: every transfer clears at least one
+    person, so n people need at most n - 1 transfers, in O(n log n).
+    """
+    creditors_by_amount: Dict[int, List[int]] = defaultdict(list)
+    for user_id, balance in balances.items():
+        if balance > 0:
+            creditors_by_amount[balance].append(user_id)
+
+    transfers = []
+    debtors = []
+    for user_id, balance in sorted(balances.items()):
+        if balance >= 0:
+            continue
+        match = creditors_by_amount.get(-balance)
+        if match:
+            transfers.append(Transfer(user_id, match.pop(), -balance))
+        else:
+            debtors.append((balance, user_id))
+
+    creditors = [(-amount, user_id) for amount, users in creditors_by_amount.items() for user_id in users]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    while debtors and creditors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append(Transfer(debtor, creditor, amount))
+
+        if debt + amount < 0:
+            heapq.heappush(debtors, (debt + amount, debtor))
+        if credit + amount < 0:
+            heapq.heappush(creditors, (credit + amount, creditor))
+
+    return transfers
+
+
+class DebtNetwork:
+    """
+    Open PENDING balances netted per board group
+
+    A group is every session whose live board was posted to the same group
+    chat (Session.board_chat_id): its members agreed to settle together, so
+    only their debts are netted against each other and card numbers are
+    only shown inside the group. Sessions without a board are not netted;
+    their debts are paid directly with the per-session buttons.
+
+    Every unpaid SessionParticipant of a board session is one debt from the
+    participant to the session creator; every confirmed plan transfer
+    (DebtTransfer) offsets it, and every allocation row undoes the offset
+    of the debt it cleared. Balances are running sums per group, so
+    adding, changing or settling a debt is O(1); plans are recomputed
+    lazily per group and cached until its balances change.
+    """
+
+    def __init__(self):
+        self.debts: Dict[int, Tuple[int, int, int, int]] = {}  # participant_id -> (debtor, creditor, amount, group)
+        self.transfers: Dict[int, Tuple[int, int, int, int]] = {}  # transfer_id -> (debtor, creditor, amount, group)
+        self.balances: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.labels: Dict[int, Set[str]] = defaultdict(set)  # group -> restaurant names
+        self.names: Dict[int, str] = {}
+        self.cards: Dict[int, str] = {}
+        self.loaded = False
+        self._plans: Dict[int, List[Transfer]] = {}
+
+    def _shift(self, group: int, debtor: int, creditor: int, amount: int):
+        balances = self.balances[group]
+        balances[debtor] -= amount
+        balances[creditor] += amount
+        for user_id in (debtor, creditor):
+            if not balances[user_id]:
+                del balances[user_id]
+        if not balances:
+            del self.balances[group]
+        self._plans.pop(group, None)
+
+    def set_debt(self, participant_id: int, debtor: int, creditor: int, amount: int, group: int):
+        self.remove_debt(participant_id)
+        if amount <= 0 or debtor == creditor:
+            return
+        self.debts[participant_id] = (debtor, creditor, amount, group)
+        self._shift(group, debtor, creditor, amount)
+
+    def remove_debt(self, participant_id: int):
+        """Called when a participant's payment is confirmed"""
+        debt = self.debts.pop(participant_id, None)
+        if debt is None:
+            return
+        debtor, creditor, amount, group = debt
+        self._shift(group, creditor, debtor, amount)
+
+    def record(self, participant: SessionParticipant, db_session: DBSession):
+        """Mirror a participant row after its amount or payment status changed"""
+        if not self.loaded:
+            return
+        group = db_session.board_chat_id
+        if (
+            group is None
+            or participant.is_creator
+            or not participant.has_confirmed
+            or participant.payment_status != PaymentStatus.PENDING
+        ):
+            self.remove_debt(participant.id)
+            return
+
+        self.names.setdefault(participant.user_id, participant.first_name)
+        self.names.setdefault(db_session.creator_user_id, db_session.creator_first_name)
+        if db_session.card_number:
+            self.cards[db_session.creator_user_id] = db_session.card_number
+        self.labels[group].add(db_session.restaurant_name or "Hisob")
+        self.set_debt(participant.id, participant.user_id, db_session.creator_user_id, participant.total_amount or 0, group)
+
+    def record_transfer(self, transfer: DebtTransfer):
+        """A confirmed plan transfer pays down the debtor's balance in its group; an allocation reverses that"""
+        if not self.loaded or transfer.id in self.transfers:
+            return
+        if transfer.status != PaymentStatus.CONFIRMED or transfer.settled:
+            return
+        self.transfers[transfer.id] = (
+            transfer.debtor_user_id, transfer.creditor_user_id, transfer.amount, transfer.group_chat_id
+        )
+        if transfer.participant_id is None:
+            self._shift(transfer.group_chat_id, transfer.creditor_user_id, transfer.debtor_user_id, transfer.amount)
+        else:
+            self._shift(transfer.group_chat_id, transfer.debtor_user_id, transfer.creditor_user_id, transfer.amount)
+
+    def reset(self):
+        """Forget everything; the next plan reloads from the database"""
+        self.__init__()
+
+    def plan(self, group: int) -> List[Transfer]:
+        plan = self._plans.get(group)
+        if plan is None:
+            plan = self._plans[group] = plan_transfers(dict(self.balances.get(group, {})))
+        return plan
+
+    def plan_for(self, user_id: int) -> Dict[int, List[Transfer]]:
+        """group -> plan, for every group where user_id still pays or receives"""
+        return {
+            group: self.plan(group)
+            for group, balances in self.balances.items()
+            if user_id in balances
+        }
+
+    def debts_in_group(self, group: int) -> int:
+        """Open per-session debts the group's plan replaces"""
+        return sum(1 for *_, debt_group in self.debts.values() if debt_group == group)
+
+
+debt_network = DebtNetwork()
+
+
+async def load_debt_network() -> DebtNetwork:
+    """Build the network from all open balances once; later changes are applied incrementally"""
+    if debt_network.loaded:
+        return debt_network
+
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(SessionParticipant, DBSession)
+            .join(DBSession, DBSession.id == SessionParticipant.session_id)
+            .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+            .where(SessionParticipant.is_creator == False)
+            .where(SessionParticipant.has_confirmed == True)
+            .where(DBSession.status != SessionStatus.CREATING)
+            .where(DBSession.board_chat_id.isnot(None))
+            .order_by(DBSession.created_at)
+        )).all()
+
+        transfers = (await session.execute(
+            select(DebtTransfer)
+            .where(DebtTransfer.settled == False)
+            .where(DebtTransfer.status == PaymentStatus.CONFIRMED)
+        )).scalars().all()
+
+    debt_network.loaded = True
+    for participant, db_session in rows:
+        debt_network.record(participant, db_session)
+    for transfer in transfers:
+        debt_network.record_transfer(transfer)
+
+    logger.info(
+        f"🔄 Debt network loaded: {len(debt_network.debts)} open debts, "
+        f"{len(debt_network.transfers)} transfers, {len(debt_network.balances)} groups"
+    )
+    return debt_network
+
+
+async def apply_transfers(session: AsyncSession, group: int) -> List[Tuple[int, int, int, uuid.UUID]]:
+    """
+    Clear the group's participant debts that confirmed transfers already pay for
+
+    Every confirmed transfer gives its payer credit; allocations move credit
+    from a cleared debt's debtor to its creditor, so balances stay exactly
+    what the open debts and transfers say. A pending debt is cleared, oldest
+    session first, once its debtor's credit covers it, repeated until no
+    more fit - a creditor paid on behalf of someone else can then clear their
+    own debts. Runs in the caller's transaction with the rows locked. When
+    nobody holds credit any more, the group's rows are marked settled.
+
+    Returns:
+        (participant_id, user_id, creator_user_id, session_id) of the cleared debts
+    """
+    pending = (await session.execute(
+        select(
+            SessionParticipant.id,
+            SessionParticipant.user_id,
+            SessionParticipant.total_amount,
+            DBSession.id,
+            DBSession.creator_user_id
+        )
+        .join(DBSession, DBSession.id == SessionParticipant.session_id)
+        .where(DBSession.board_chat_id == group)
+        .where(DBSession.status != SessionStatus.CREATING)
+        .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+        .where(SessionParticipant.is_creator == False)
+        .where(SessionParticipant.has_confirmed == True)
+        .where(SessionParticipant.total_amount > 0)
+        .order_by(DBSession.created_at, SessionParticipant.id)
+        .with_for_update(of=SessionParticipant)
+    )).all()
+
+    entries = (await session.execute(
+        select(DebtTransfer)
+        .where(DebtTransfer.group_chat_id == group)
+        .where(DebtTransfer.settled == False)
+        .where(DebtTransfer.status == PaymentStatus.CONFIRMED)
+        .with_for_update()
+    )).scalars().all()
+
+    credit: Dict[int, int] = defaultdict(int)
+    for entry in entries:
+        sign = 1 if entry.participant_id is None else -1
+        credit[entry.debtor_user_id] += sign * entry.amount
+        credit[entry.creditor_user_id] -= sign * entry.amount
+
+    cleared = []
+    remaining = list(pending)
+    progress = True
+    while progress:
+        progress = False
+        for row in list(remaining):
+            participant_id, debtor, amount, session_id, creditor = row
+            if credit[debtor] >= amount:
+                credit[debtor] -= amount
+                credit[creditor] += amount
+                cleared.append(row)
+                remaining.remove(row)
+                progress = True
+
+    now = datetime.utcnow()
+    if cleared:
+        await session.execute(
+            update(SessionParticipant)
+            .where(SessionParticipant.id.in_([row[0] for row in cleared]))
+            .values(payment_status=PaymentStatus.CONFIRMED, paid_at=func.coalesce(SessionParticipant.paid_at, now))
+            .execution_options(synchronize_session=False)
+        )
+        session.add_all([
+            DebtTransfer(
+                group_chat_id=group,
+                debtor_user_id=debtor,
+                creditor_user_id=creditor,
+                amount=amount,
+                participant_id=participant_id,
+                status=PaymentStatus.CONFIRMED,
+                settled=not any(credit.values()),
+                confirmed_at=now
+            )
+            for participant_id, debtor, amount, _, creditor in cleared
+        ])
+
+    if entries and not any(credit.values()):
+        await session.execute(
+            update(DebtTransfer)
+            .where(DebtTransfer.id.in_([entry.id for entry in entries]))
+            .values(settled=True)
+            .execution_options(synchronize_session=False)
+        )
+        logger.info(f"🔄 Group {group}: all transfer credit spent, rows settled")
+
+    if cleared:
+        logger.info(f"🔄 Group {group}: {len(cleared)} debts cleared by transfers")
+    return [(participant_id, user_id, creator, session_id) for participant_id, user_id, _, session_id, creator in cleared]
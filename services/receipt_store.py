@@ -0,0 +1,157 @@
+from typing import Dict, List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Session as DBSession, Meal
+from database.connection import async_session_maker
+from utils.money import to_minor
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Bump when the document layout changes and add a step to upgrade_receipt_document
+RECEIPT_SCHEMA_VERSION = 1
+
+
+def build_receipt_document(ai_result: Dict) -> Dict:
+    """
+    Normalize raw AI output into the versioned receipt document stored in JSONB
+
+    Document layout (v1):
+        {
+            "schema_version": 1,
+            "restaurant": "Rayhon",
+            "total": 30968000,            # tiyin
+            "items": [
+                {"position": 1, "name": "Лагман", "quantity": 3,
+                 "price": 14700000, "type": "INDIVIDUAL"}
+            ],
+            "raw": {...}                  # untouched AI response
+        }
+    """
+    items = []
+    for position, item in enumerate(ai_result.get('items') or [], start=1):
+        name = str(item.get('name') or '').strip()
+        if not name:
+            continue
+
+        try:
+            quantity = int(item.get('quantity') or 1)
+        except (TypeError, ValueError):
+            quantity = 1
+
+        items.append({
+            'position': position,
+            'name': name,
+            'quantity': max(quantity, 1),
+            'price': to_minor(item.get('price') or 0),
+            'type': 'SHARED' if item.get('type') == 'SHARED' else 'INDIVIDUAL'
+        })
+
+    return {
+        'schema_version': RECEIPT_SCHEMA_VERSION,
+        'restaurant': ai_result.get('restaurant') or 'Unknown',
+        'total': to_minor(ai_result.get('total') or 0),
+        'items': items,
+        'raw': ai_result
+    }
+
+
+def upgrade_receipt_document(document: Dict) -> Dict:
+    """Bring a stored document up to RECEIPT_SCHEMA_VERSION"""
+    version = document.get('schema_version', 0)
+
+    if version > RECEIPT_SCHEMA_VERSION:
+        raise ValueError(f"Unknown receipt schema version: {version}")
+
+    if version < 1:
+        # v0 is the bare AI response
+        document = build_receipt_document(document)
+
+    return document
+
+
+def build_meals(document: Dict, session_id: uuid.UUID) -> List[Meal]:
+    """Create Meal rows from a receipt document"""
+    return [
+        Meal(
+            session_id=session_id,
+            name=item['name'],
+            price=item['price'],
+            quantity_available=item['quantity'],
+            position=item['position'],
+            is_shared=item['type'] == 'SHARED'
+        )
+        for item in document['items']
+    ]
+
+
+async def reprocess_receipt(session: AsyncSession, session_id: uuid.UUID) -> Optional[DBSession]:
+    """
+    Rebuild a session's meals from its stored receipt, without calling the AI
+
+    Existing meals (and their selections) are replaced. The caller commits.
+    """
+    result = await session.execute(
+        select(DBSession).where(DBSession.id == session_id)
+    )
+    db_session = result.scalar_one_or_none()
+
+    if not db_session or not db_session.receipt_data:
+        return None
+
+    document = upgrade_receipt_document(db_session.receipt_data)
+
+    await session.execute(delete(Meal).where(Meal.session_id == session_id))
+    session.add_all(build_meals(document, session_id))
+
+    db_session.receipt_data = document
+    db_session.receipt_schema_version = document['schema_version']
+    db_session.restaurant_name = document['restaurant']
+    db_session.total_amount = document['total']
+
+    logger.info(f"♻️ Reprocessed receipt for session {session_id} ({len(document['items'])} items)")
+    return db_session
+
+
+async def search_sessions(
+    item_name: Optional[str] = None,
+    restaurant: Optional[str] = None,
+    exact: bool = False,
+    limit: int = 50
+) -> List[DBSession]:
+    """
+    Find sessions by receipt item and/or restaurant name
+
+    Args:
+        item_name: Item to look for, e.g. "Лагман"
+        restaurant: Restaurant name fragment (trigram ILIKE)
+        exact: Match item_name exactly via JSONB containment (GIN) instead of
+            a fuzzy trigram match on meal names
+        limit: Maximum number of sessions
+
+    Returns:
+        Sessions, newest first
+    """
+    query = select(DBSession)
+
+    if item_name:
+        if exact:
+            query = query.where(
+                DBSession.receipt_data.contains({'items': [{'name': item_name}]})
+            )
+        else:
+            query = query.where(
+                DBSession.id.in_(
+                    select(Meal.session_id).where(Meal.name.ilike(f"%{item_name}%"))
+                )
+            )
+
+    if restaurant:
+        query = query.where(DBSession.restaurant_name.ilike(f"%{restaurant}%"))
+
+    query = query.order_by(DBSession.created_at.desc()).limit(limit)
+
+    async with async_session_maker() as session:
+        result = await session.execute(query)
+        return list(result.scalars().all())
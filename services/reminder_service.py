@@ -0,0 +1,287 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, NamedTuple, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update, func, exists, tuple_
+from database.models import Session as DBSession, SessionParticipant, SessionStatus, PaymentStatus, DebtTransfer
+from database.connection import async_session_maker
+from keyboards import get_mark_paid_keyboard
+from middleware import bulk_sends
+from utils import format_amount
+from config import (
+    REMINDER_INTERVAL_SECONDS,
+    REMINDER_MAX_COUNT,
+    REMINDER_SCAN_INTERVAL_SECONDS,
+    REMINDER_SCAN_LIMIT,
+    REMINDER_TICK_SECONDS,
+    REMINDER_BATCH_SIZE
+)
+import logging
+import math
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Reminder(NamedTuple):
+    participant_id: int
+    user_id: int
+    amount: int
+    session_id: uuid.UUID
+    restaurant_name: Optional[str]
+    creator_first_name: str
+    card_number: Optional[str]
+    contacted_at: datetime  # Last reminder (or join) before this one was claimed
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel with one slot per tick
+
+    add() and cancel() are O(1); advance() pops every slot whose tick has
+    passed. Timers further out than the wheel span land in the last slot,
+    so the span must cover the scan horizon.
+    """
+
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self.slots: List[Dict[Hashable, object]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._cursor = int(time.monotonic() // tick)  # Next tick to fire
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def add(self, due: float, key: Hashable, item) -> bool:
+        """Schedule item at monotonic time due; False if key is already scheduled"""
+        if key in self._slot_of:
+            return False
+        tick = min(max(int(due // self.tick), self._cursor), self._cursor + len(self.slots) - 1)
+        index = tick % len(self.slots)
+        self.slots[index][key] = item
+        self._slot_of[key] = index
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        index = self._slot_of.pop(key, None)
+        if index is None:
+            return False
+        del self.slots[index][key]
+        return True
+
+    def advance(self, now: float) -> List:
+        """Items of every tick up to now, in due order"""
+        target = int(now // self.tick)
+        due = []
+        # After a long stall every slot is due once, not once per missed tick
+        for tick in range(self._cursor, min(target + 1, self._cursor + len(self.slots))):
+            slot = self.slots[tick % len(self.slots)]
+            for key, item in slot.items():
+                del self._slot_of[key]
+                due.append(item)
+            slot.clear()
+        self._cursor = max(self._cursor, target + 1)
+        return due
+
+
+class ReminderScheduler:
+    """
+    Payment reminders for pending debts, without a timer per participant
+
+    Every `scan_interval` one query over ix_session_participants_payment_status_session
+    loads the debts whose next reminder falls before the following scan,
+    and puts them on a timer wheel. The wheel is advanced every tick; due
+    reminders go out in batches marked as bulk sends, so the outbound rate
+    limiter paces them behind interactive replies. Each batch is recorded
+    with one UPDATE. Paying through the buttons cancels a queued reminder.
+
+    Every bot process runs a scheduler, so a reminder is claimed only when
+    its tick fires: one conditional UPDATE moves last_reminded_at forward
+    for the rows still pending and untouched since the scan, and only the
+    process that wins it sends. Nothing is claimed while a reminder waits
+    on the wheel, so a restart loses no reminders. Sends that fail with a
+    retryable error hand the claim back.
+    """
+
+    def __init__(
+        self,
+        interval: timedelta = timedelta(seconds=REMINDER_INTERVAL_SECONDS),
+        max_count: int = REMINDER_MAX_COUNT,
+        scan_interval: float = REMINDER_SCAN_INTERVAL_SECONDS,
+        scan_limit: int = REMINDER_SCAN_LIMIT,
+        tick: float = REMINDER_TICK_SECONDS,
+        batch_size: int = REMINDER_BATCH_SIZE
+    ):
+        self.interval = interval
+        self.max_count = max_count
+        self.scan_interval = scan_interval
+        self.scan_limit = scan_limit
+        self.batch_size = batch_size
+        self.wheel = TimerWheel(tick, math.ceil(scan_interval / tick) + 1)
+        self.counters: Dict[str, int] = {
+            'scans': 0,
+            'scheduled': 0,
+            'sent': 0,
+            'undeliverable': 0,
+            'failed': 0,
+            'cancelled': 0
+        }
+
+    async def scan(self) -> int:
+        """Queue every reminder due before the next scan, returns how many were added"""
+        now = datetime.utcnow()
+        horizon = now + timedelta(seconds=self.scan_interval)
+        last_contact = func.coalesce(SessionParticipant.last_reminded_at, SessionParticipant.created_at)
+        # A debtor whose netted transfer in this board group awaits confirmation is not nagged
+        netting = (
+            exists()
+            .where(DebtTransfer.group_chat_id == DBSession.board_chat_id)
+            .where(DebtTransfer.debtor_user_id == SessionParticipant.user_id)
+            .where(DebtTransfer.status == PaymentStatus.PAID)
+        )
+
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(
+                    SessionParticipant.id,
+                    SessionParticipant.user_id,
+                    SessionParticipant.total_amount,
+                    last_contact,
+                    DBSession.id,
+                    DBSession.restaurant_name,
+                    DBSession.creator_first_name,
+                    DBSession.card_number
+                )
+                .join(DBSession, DBSession.id == SessionParticipant.session_id)
+                .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+                .where(SessionParticipant.is_creator == False)
+                .where(SessionParticipant.has_confirmed == True)
+                .where(SessionParticipant.total_amount > 0)
+                .where(SessionParticipant.reminder_count < self.max_count)
+                .where(DBSession.status != SessionStatus.CREATING)
+                .where(~netting)
+                .where(last_contact <= horizon - self.interval)
+                .order_by(last_contact)
+                .limit(self.scan_limit)
+            )).all()
+
+        added = 0
+        clock = time.monotonic()
+        for participant_id, user_id, amount, contacted_at, session_id, restaurant, creator, card in rows:
+            delay = max(0.0, (contacted_at + self.interval - now).total_seconds())
+            reminder = Reminder(participant_id, user_id, amount, session_id, restaurant, creator, card, contacted_at)
+            if self.wheel.add(clock + delay, participant_id, reminder):
+                added += 1
+
+        self.counters['scans'] += 1
+        self.counters['scheduled'] += added
+        if added:
+            logger.info(f"🔔 Reminder scan: {added} queued, {len(self.wheel)} waiting")
+        return added
+
+    def cancel(self, participant_id: int):
+        """Drop a queued reminder, e.g. after the debtor marked it paid"""
+        if self.wheel.cancel(participant_id):
+            self.counters['cancelled'] += 1
+
+    async def _send(self, bot: Bot, reminder: Reminder) -> bool:
+        """One reminder; False only for errors worth retrying on a later scan"""
+        card_line = f"\n💳 <code>{reminder.card_number}</code>" if reminder.card_number else ""
+        try:
+            await bot.send_message(
+                reminder.user_id,
+                f"🔔 <b>To'lov eslatmasi</b>\n\n"
+                f"🏪 {reminder.restaurant_name or 'Hisob'}\n"
+                f"💵 <b>{reminder.creator_first_name}</b>ga {format_amount(reminder.amount)} so'm o'tkazishingiz kerak"
+                f"{card_line}",
+                reply_markup=get_mark_paid_keyboard(reminder.participant_id)
+            )
+            self.counters['sent'] += 1
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Blocked the bot or never opened it; counts as reminded so it is not retried forever
+            self.counters['undeliverable'] += 1
+            logger.info(f"🔕 Reminder for participant {reminder.participant_id} undeliverable: {e}")
+        except Exception as e:
+            self.counters['failed'] += 1
+            logger.error(f"❌ Reminder for participant {reminder.participant_id} failed: {e}")
+            return False
+        return True
+
+    async def send_batch(self, bot: Bot, batch: List[Reminder]):
+        # Claim now, not at scan time: rows paid since the scan (its wheel cancel may
+        # have gone to another process) or already reminded by another process drop out
+        last_contact = func.coalesce(SessionParticipant.last_reminded_at, SessionParticipant.created_at)
+        async with async_session_maker() as session:
+            claimed = set((await session.execute(
+                update(SessionParticipant)
+                .where(tuple_(SessionParticipant.id, last_contact).in_(
+                    [(reminder.participant_id, reminder.contacted_at) for reminder in batch]
+                ))
+                .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+                .values(last_reminded_at=last_contact + self.interval)
+                .returning(SessionParticipant.id)
+                .execution_options(synchronize_session=False)
+            )).scalars().all())
+            await session.commit()
+        batch = [reminder for reminder in batch if reminder.participant_id in claimed]
+        if not batch:
+            return
+
+        with bulk_sends():
+            results = await asyncio.gather(*(self._send(bot, reminder) for reminder in batch))
+
+        done = [reminder.participant_id for reminder, ok in zip(batch, results) if ok]
+        failed = [reminder for reminder, ok in zip(batch, results) if not ok]
+        async with async_session_maker() as session:
+            if done:
+                await session.execute(
+                    update(SessionParticipant)
+                    .where(SessionParticipant.id.in_(done))
+                    .where(SessionParticipant.payment_status == PaymentStatus.PENDING)
+                    .values(
+                        reminder_count=SessionParticipant.reminder_count + 1,
+                        last_reminded_at=datetime.utcnow()
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            # Hand the claim back so the next scan, in any process, retries
+            for reminder in failed:
+                await session.execute(
+                    update(SessionParticipant)
+                    .where(SessionParticipant.id == reminder.participant_id)
+                    .where(SessionParticipant.last_reminded_at == reminder.contacted_at + self.interval)
+                    .values(last_reminded_at=reminder.contacted_at)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+
+    async def fire_due(self, bot: Bot) -> int:
+        """Send everything the wheel has due now, returns reminders handled"""
+        due = self.wheel.advance(time.monotonic())
+        for start in range(0, len(due), self.batch_size):
+            await self.send_batch(bot, due[start:start + self.batch_size])
+        return len(due)
+
+    async def run_forever(self, bot: Bot):
+        """Background loop, started from bot.py"""
+        next_scan = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_scan:
+                    next_scan = time.monotonic() + self.scan_interval
+                    await self.scan()
+                await self.fire_due(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Reminder run failed: {e}", exc_info=True)
+
+            await asyncio.sleep(self.wheel.tick)
+
+
+reminders = ReminderScheduler()
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import html
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select, update
+from config import BOARD_DEBOUNCE_MS, BOARD_MIN_EDIT_INTERVAL_SECONDS
+from database.models import Session as DBSession, Meal, SessionParticipant, UserMealSelection, PaymentStatus
+from database.connection import async_session_maker
+from services.session_snapshot import snapshots, SessionSnapshot
+from services.edit_coalescer import markup_digest
+from keyboards import build_board_keyboard
+from utils import format_amount, create_join_link
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Telegram message text limit
+MAX_BOARD_TEXT = 4096
+
+_PAYMENT_MARKS = {
+    PaymentStatus.PENDING: "",
+    PaymentStatus.PAID: " 💸",
+    PaymentStatus.CONFIRMED: " ✅"
+}
+
+
+def render_board_text(snapshot: SessionSnapshot, participants: List, selections: List) -> Tuple[str, Dict[int, int]]:
+    """
+    Board text from one session's participants and selections
+
+    Returns:
+        (text, units claimed per meal id) - the counts feed the keyboard
+    """
+    names = {p.id: html.escape(p.first_name or "?") for p in participants}
+    claimed: Dict[int, int] = {}
+    claimers: Dict[int, List[str]] = {}
+    for participant_id, meal_id, quantity in selections:
+        claimed[meal_id] = claimed.get(meal_id, 0) + quantity
+        name = names.get(participant_id, "?")
+        claimers.setdefault(meal_id, []).append(name if quantity == 1 else f"{name} ×{quantity}")
+
+    lines = [
+        f"📌 <b>{html.escape(snapshot.restaurant_name or 'Hisob')}</b> — jonli holat",
+        f"💰 Jami: {format_amount(snapshot.total_amount or 0)} so'm",
+        "",
+        "🍽 <b>Ovqatlar:</b>"
+    ]
+    for meal in snapshot.meals:
+        name = html.escape(meal.name)
+        if meal.is_shared:
+            lines.append(f"🤝 {name} — umumiy")
+            continue
+        taken = claimed.get(meal.id, 0)
+        mark = "✅" if taken >= meal.quantity_available else "🟡" if taken else "⚪️"
+        who = f" — {', '.join(claimers[meal.id])}" if meal.id in claimers else ""
+        lines.append(f"{mark} {name} {taken}/{meal.quantity_available}{who}")
+
+    confirmed = [p for p in participants if p.has_confirmed]
+    expected = max(snapshot.participant_count or 0, len(confirmed))
+    lines += ["", f"👥 <b>Kim qancha to'laydi ({len(confirmed)}/{expected}):</b>"]
+    for participant in confirmed:
+        lines.append(
+            f"• {names[participant.id]} — {format_amount(participant.total_amount or 0)} so'm"
+            f"{_PAYMENT_MARKS.get(participant.payment_status, '')}"
+        )
+    if expected > len(confirmed):
+        lines.append(f"⏳ Yana {expected - len(confirmed)} kishi tanlashi kerak")
+
+    lines += ["", "👇 Ovqatni bosib o'zingizga oling, qayta bossangiz bekor bo'ladi."]
+
+    text = "\n".join(lines)
+    if len(text) > MAX_BOARD_TEXT:
+        text = text[:MAX_BOARD_TEXT - 1] + "…"
+    return text, claimed
+
+
+async def render_board(bot: Bot, snapshot: SessionSnapshot) -> Tuple[str, InlineKeyboardMarkup]:
+    """Aggregate every participant's selections in two queries and render"""
+    async with async_session_maker() as session:
+        participants = (await session.execute(
+            select(SessionParticipant)
+            .where(SessionParticipant.session_id == snapshot.id)
+            .order_by(SessionParticipant.id)
+        )).scalars().all()
+
+        selections = (await session.execute(
+            select(UserMealSelection.participant_id, UserMealSelection.meal_id, UserMealSelection.quantity_selected)
+            .join(Meal, Meal.id == UserMealSelection.meal_id)
+            .where(Meal.session_id == snapshot.id)
+            .order_by(UserMealSelection.id)
+        )).all()
+
+    text, claimed = render_board_text(snapshot, participants, selections)
+    join_link = await create_join_link(bot, snapshot.id)
+    markup = build_board_keyboard(snapshot.id, list(snapshot.individual_meals), claimed, join_link)
+    return text, markup
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SessionBoards:
+    """
+    One live board message per session, re-rendered after changes
+
+    Handlers call schedule() after committing a change; they never edit the
+    board themselves. Changes are debounced per session: the first one
+    starts a timer, later ones within the window ride along, and a whole
+    burst of taps costs one aggregate query and at most one edit. Edits of
+    one board are at least `min_interval` apart to stay under the group
+    chat limit. The rendered text and keyboard are hashed separately, so
+    an unchanged board is not edited at all and a keyboard-only change
+    uses the cheaper editMessageReplyMarkup.
+    """
+
+    def __init__(
+        self,
+        window: float = BOARD_DEBOUNCE_MS / 1000,
+        min_interval: float = BOARD_MIN_EDIT_INTERVAL_SECONDS,
+        max_tracked: int = 1000
+    ):
+        self.window = window
+        self.min_interval = min_interval
+        self.max_tracked = max_tracked
+
+        self._dirty: Dict[uuid.UUID, Bot] = {}
+        self._tasks: Dict[uuid.UUID, asyncio.Task] = {}
+        self._edited_at: Dict[uuid.UUID, float] = {}
+        self._digests: "OrderedDict[uuid.UUID, Tuple[str, str]]" = OrderedDict()
+
+        self.stats: Dict[str, int] = {
+            'scheduled': 0,
+            'coalesced': 0,
+            'text_edits': 0,
+            'markup_edits': 0,
+            'unchanged': 0,
+            'failed': 0
+        }
+
+    def schedule(self, bot: Bot, session_id: uuid.UUID):
+        """Mark a session's board stale; a no-op for sessions without one"""
+        self.stats['scheduled'] += 1
+        if session_id in self._dirty:
+            self.stats['coalesced'] += 1
+        self._dirty[session_id] = bot
+
+        if session_id not in self._tasks:
+            self._tasks[session_id] = asyncio.create_task(self._run(session_id))
+
+    async def post(self, bot: Bot, chat_id: int, session_id: uuid.UUID) -> Optional[int]:
+        """
+        Send and pin the board in a group chat, replacing any earlier one
+
+        Returns:
+            Board message id, or None if the session is gone
+        """
+        snapshot = await snapshots.get(session_id)
+        if snapshot is None:
+            return None
+
+        text, markup = await render_board(bot, snapshot)
+        message = await bot.send_message(chat_id, text, reply_markup=markup)
+
+        try:
+            await bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            logger.info(f"📌 Board for {session_id} not pinned (bot is not an admin?): {e}")
+
+        async with async_session_maker() as session:
+            await session.execute(
+                update(DBSession)
+                .where(DBSession.id == session_id)
+                .values(board_chat_id=chat_id, board_message_id=message.message_id)
+            )
+            await session.commit()
+        snapshots.invalidate(session_id)
+
+        self._remember(session_id, (_text_digest(text), markup_digest(markup)))
+        self._edited_at[session_id] = time.monotonic()
+        logger.info(f"📌 Board for session {session_id} posted in chat {chat_id}")
+        return message.message_id
+
+    def _remember(self, session_id: uuid.UUID, digests: Tuple[str, str]):
+        self._digests[session_id] = digests
+        self._digests.move_to_end(session_id)
+        while len(self._digests) > self.max_tracked:
+            evicted, _ = self._digests.popitem(last=False)
+            self._edited_at.pop(evicted, None)
+
+    async def _run(self, session_id: uuid.UUID):
+        try:
+            while session_id in self._dirty:
+                ready_at = self._edited_at.get(session_id, 0.0) + self.min_interval
+                await asyncio.sleep(max(self.window, ready_at - time.monotonic()))
+                bot = self._dirty.pop(session_id)
+                backoff = await self._refresh(bot, session_id)
+                if backoff:
+                    self._dirty.setdefault(session_id, bot)
+                    await asyncio.sleep(backoff)
+        finally:
+            self._tasks.pop(session_id, None)
+
+    async def _refresh(self, bot: Bot, session_id: uuid.UUID) -> Optional[float]:
+        """Render once and edit only what changed, returns a backoff delay after a flood error"""
+        try:
+            snapshot = await snapshots.get(session_id)
+            if snapshot is None or snapshot.board_message_id is None:
+                return None
+
+            text, markup = await render_board(bot, snapshot)
+            digests = (_text_digest(text), markup_digest(markup))
+            previous = self._digests.get(session_id)
+
+            if previous == digests:
+                self.stats['unchanged'] += 1
+                return None
+
+            if previous is not None and previous[0] == digests[0]:
+                await bot.edit_message_reply_markup(
+                    chat_id=snapshot.board_chat_id,
+                    message_id=snapshot.board_message_id,
+                    reply_markup=markup
+                )
+                self.stats['markup_edits'] += 1
+            else:
+                await bot.edit_message_text(
+                    text=text,
+                    chat_id=snapshot.board_chat_id,
+                    message_id=snapshot.board_message_id,
+                    reply_markup=markup
+                )
+                self.stats['text_edits'] += 1
+
+            self._remember(session_id, digests)
+            self._edited_at[session_id] = time.monotonic()
+
+        except TelegramRetryAfter as e:
+            logger.warning(f"⏳ Board edit for {session_id} rate limited, retrying in {e.retry_after}s")
+            return float(e.retry_after)
+
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                self._remember(session_id, digests)
+                self.stats['unchanged'] += 1
+            else:
+                self.stats['failed'] += 1
+                logger.error(f"❌ Board edit failed for {session_id}: {e}")
+
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"❌ Board render failed for {session_id}: {e}", exc_info=True)
+
+        return None
+
+
+boards = SessionBoards()
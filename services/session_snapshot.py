@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+from sqlalchemy import select
+from database.models import Session as DBSession, Meal, SessionStatus
+from database.connection import async_session_maker
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class MealSnapshot(NamedTuple):
+    id: int
+    name: str
+    price: int
+    unit_price: int
+    quantity_available: int
+    is_shared: bool
+    position: int
+
+
+class SessionSnapshot(NamedTuple):
+    """
+    Read-only view of a session for joiners
+
+    `version` is a digest of the meal list, so a participant who started
+    choosing from one menu can be told when the creator changed it.
+    """
+    id: uuid.UUID
+    version: str
+    status: SessionStatus
+    creator_user_id: int
+    creator_first_name: str
+    restaurant_name: Optional[str]
+    card_number: Optional[str]
+    total_amount: Optional[int]
+    participant_count: Optional[int]
+    board_chat_id: Optional[int]
+    board_message_id: Optional[int]
+    meals: Tuple[MealSnapshot, ...]
+
+    @property
+    def individual_meals(self) -> Tuple[MealSnapshot, ...]:
+        return tuple(meal for meal in self.meals if not meal.is_shared)
+
+    @property
+    def shared_meals(self) -> Tuple[MealSnapshot, ...]:
+        return tuple(meal for meal in self.meals if meal.is_shared)
+
+
+def meals_version(meals: Tuple[MealSnapshot, ...]) -> str:
+    digest = hashlib.blake2b(repr(meals).encode(), digest_size=6)
+    return digest.hexdigest()
+
+
+async def build_snapshot(session_id: uuid.UUID) -> Optional[SessionSnapshot]:
+    """Two queries: the session row and its meals"""
+    async with async_session_maker() as session:
+        db_session = (await session.execute(
+            select(DBSession).where(DBSession.id == session_id)
+        )).scalar_one_or_none()
+        if db_session is None:
+            return None
+
+        rows = (await session.execute(
+            select(Meal).where(Meal.session_id == session_id).order_by(Meal.position)
+        )).scalars().all()
+
+    meals = tuple(
+        MealSnapshot(meal.id, meal.name, meal.price, meal.unit_price, meal.quantity_available, meal.is_shared, meal.position)
+        for meal in rows
+    )
+    return SessionSnapshot(
+        id=db_session.id,
+        version=meals_version(meals),
+        status=db_session.status,
+        creator_user_id=db_session.creator_user_id,
+        creator_first_name=db_session.creator_first_name,
+        restaurant_name=db_session.restaurant_name,
+        card_number=db_session.card_number,
+        total_amount=db_session.total_amount,
+        participant_count=db_session.participant_count,
+        board_chat_id=db_session.board_chat_id,
+        board_message_id=db_session.board_message_id,
+        meals=meals
+    )
+
+
+class SnapshotCache:
+    """
+    Session snapshots kept in memory, built at most once per burst
+
+    Concurrent misses for the same session share one in-flight build, so a
+    link posted to a big group costs two queries instead of one per joiner.
+    Writers call invalidate() after changing the session or its meals; the
+    TTL bounds staleness for changes made elsewhere (janitor, archiver).
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._snapshots: "OrderedDict[uuid.UUID, Tuple[float, SessionSnapshot]]" = OrderedDict()
+        self._building: Dict[uuid.UUID, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {'hits': 0, 'builds': 0, 'coalesced': 0}
+
+    async def get(self, session_id: uuid.UUID) -> Optional[SessionSnapshot]:
+        entry = self._snapshots.get(session_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.stats['hits'] += 1
+            self._snapshots.move_to_end(session_id)
+            return entry[1]
+
+        building = self._building.get(session_id)
+        if building is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(building)
+
+        future = asyncio.get_running_loop().create_future()
+        self._building[session_id] = future
+        self.stats['builds'] += 1
+        try:
+            snapshot = await build_snapshot(session_id)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; nobody waiting is fine too
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            if snapshot is not None and self._building.get(session_id) is future:
+                self._store(session_id, snapshot)
+            future.set_result(snapshot)
+            return snapshot
+        finally:
+            if self._building.get(session_id) is future:
+                del self._building[session_id]
+
+    def _store(self, session_id: uuid.UUID, snapshot: SessionSnapshot):
+        self._snapshots[session_id] = (time.monotonic(), snapshot)
+        self._snapshots.move_to_end(session_id)
+        if len(self._snapshots) > self.max_sessions:
+            self._snapshots.popitem(last=False)
+
+    def invalidate(self, session_id: uuid.UUID):
+        """Drop the snapshot; an in-flight build is not stored either"""
+        self._snapshots.pop(session_id, None)
+        self._building.pop(session_id, None)
+
+
+snapshots = SnapshotCache()
@@ -0,0 +1,189 @@
+from datetime import date, datetime
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import select, update, delete, func, cast, text, union_all, Date
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import (
+    Session as DBSession,
+    SessionParticipant,
+    ArchivedSession,
+    ArchivedSessionMember,
+    UserSpendingRollup
+)
+from database.connection import async_session_maker
+from config import STATS_MONTHS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def months_back(month: date, months: int) -> date:
+    """First day of the month `months` before month"""
+    index = month.year * 12 + month.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def restaurant_key(name) -> str:
+    """Rollup key for a restaurant name; must match _restaurant_key_sql()"""
+    return (name or "").strip().lower()[:255]
+
+
+def _restaurant_key_sql(column):
+    return func.substr(func.lower(func.trim(func.coalesce(column, ""))), 1, 255)
+
+
+async def record_spending(session: AsyncSession, db_session: DBSession, participants: Sequence[SessionParticipant]):
+    """
+    Apply participants' total_amount changes to the rollups in the caller's transaction
+
+    Each participant row remembers the amount already counted
+    (rolled_up_amount), so only the difference is added: one multi-row
+    upsert per call, whatever the number of participants. A participant
+    counts once confirmed; the first time also adds one session.
+    """
+    month = month_start(db_session.created_at)
+    key = restaurant_key(db_session.restaurant_name)
+    deltas: Dict[int, List[int]] = {}
+
+    for participant in participants:
+        if not participant.has_confirmed:
+            continue
+        total = int(participant.total_amount or 0)
+        counted = participant.rolled_up_amount
+        delta = total - (counted or 0)
+        new_session = 1 if counted is None else 0
+        if not delta and not new_session:
+            continue
+
+        row = deltas.setdefault(participant.user_id, [0, 0])
+        row[0] += delta
+        row[1] += new_session
+        participant.rolled_up_amount = total
+
+    if not deltas:
+        return
+
+    stmt = insert(UserSpendingRollup).values([
+        {
+            'user_id': user_id,
+            'month': month,
+            'restaurant_key': key,
+            'restaurant_name': db_session.restaurant_name,
+            'total_amount': amount,
+            'session_count': sessions,
+            'updated_at': datetime.utcnow()
+        }
+        for user_id, (amount, sessions) in deltas.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_user_spending_rollups_user_month_restaurant",
+        set_={
+            'total_amount': UserSpendingRollup.total_amount + stmt.excluded.total_amount,
+            'session_count': UserSpendingRollup.session_count + stmt.excluded.session_count,
+            'restaurant_name': func.coalesce(stmt.excluded.restaurant_name, UserSpendingRollup.restaurant_name),
+            'updated_at': stmt.excluded.updated_at
+        }
+    )
+    await session.execute(stmt)
+
+
+def _rollup_source(member, parent, *conditions):
+    """Per user × month × restaurant sums of one member table joined to its sessions"""
+    month = cast(func.date_trunc("month", parent.created_at), Date)
+    key = _restaurant_key_sql(parent.restaurant_name)
+    return (
+        select(
+            member.user_id.label("user_id"),
+            month.label("month"),
+            key.label("restaurant_key"),
+            func.max(parent.restaurant_name).label("restaurant_name"),
+            func.sum(func.coalesce(member.total_amount, 0)).label("total_amount"),
+            func.count().label("session_count")
+        )
+        .join(parent, parent.id == member.session_id)
+        .where(*conditions)
+        .group_by(member.user_id, month, key)
+    )
+
+
+async def backfill_spending() -> int:
+    """
+    Rebuild every rollup from the live and archived participant rows
+
+    Runs in one transaction. Live settlements write session_participants
+    before the rollups, so the participant table is locked first: SHARE
+    ROW EXCLUSIVE waits for settlements already in flight to commit and
+    holds new ones off at their first participant write, before they
+    could queue on the rollup lock. Taking the locks the other way round
+    deadlocks with a settlement holding participant rows. Blocked
+    settlements resume after the rebuild and add their deltas on top of
+    it. Readers are never blocked; a second backfill waits its turn.
+    Returns the number of rollup rows.
+    """
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text("LOCK TABLE session_participants IN SHARE ROW EXCLUSIVE MODE"))
+            await session.execute(text("LOCK TABLE user_spending_rollups IN EXCLUSIVE MODE"))
+            await session.execute(delete(UserSpendingRollup))
+
+            sources = union_all(
+                _rollup_source(SessionParticipant, DBSession, SessionParticipant.has_confirmed == True),
+                _rollup_source(ArchivedSessionMember, ArchivedSession, ArchivedSessionMember.total_amount.isnot(None))
+            ).subquery()
+
+            # A session archived mid-month adds a second row for the same key
+            combined = (
+                select(
+                    sources.c.user_id,
+                    sources.c.month,
+                    sources.c.restaurant_key,
+                    func.max(sources.c.restaurant_name),
+                    func.sum(sources.c.total_amount),
+                    func.sum(sources.c.session_count),
+                    func.now()
+                )
+                .group_by(sources.c.user_id, sources.c.month, sources.c.restaurant_key)
+            )
+            await session.execute(
+                insert(UserSpendingRollup).from_select(
+                    ['user_id', 'month', 'restaurant_key', 'restaurant_name', 'total_amount', 'session_count', 'updated_at'],
+                    combined
+                )
+            )
+
+            await session.execute(
+                update(SessionParticipant)
+                .where(SessionParticipant.has_confirmed == True)
+                .values(rolled_up_amount=func.coalesce(SessionParticipant.total_amount, 0))
+                .execution_options(synchronize_session=False)
+            )
+
+            rows = (await session.execute(select(func.count(UserSpendingRollup.id)))).scalar_one()
+
+    logger.info(f"📈 Spending rollups rebuilt: {rows} rows")
+    return rows
+
+
+async def get_spending(user_id: int, months: int = STATS_MONTHS) -> List[Tuple[date, str, int, int]]:
+    """
+    (month, restaurant_name, total_amount, session_count) rows of the last
+    `months` months, newest first - one range scan of the unique index
+    """
+    since = months_back(month_start(datetime.utcnow()), months - 1)
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(
+                UserSpendingRollup.month,
+                UserSpendingRollup.restaurant_name,
+                UserSpendingRollup.total_amount,
+                UserSpendingRollup.session_count
+            )
+            .where(UserSpendingRollup.user_id == user_id)
+            .where(UserSpendingRollup.month >= since)
+            .order_by(UserSpendingRollup.month.desc())
+        )).all()
+    return [tuple(row) for row in rows]
@@ -1,3 +1,29 @@
 from utils.formatters import format_amount, format_receipt_text, clean_receipt_text
+from utils.money import MINOR_UNITS, to_minor, to_major, unit_price, split_evenly
+from utils.selection import MealSelection
+from utils.callback_codec import Op, Callback, CallbackDecodeError, pack, unpack, uuid_token, parse_uuid_token
+from utils.deep_links import JOIN_PREFIX, BOARD_PREFIX, create_join_link, create_board_link, parse_start_payload
 
-__all__ = ['format_amount', 'format_receipt_text', 'clean_receipt_text']
\ No newline at end of file
+__all__ = [
+    'format_amount',
+    'format_receipt_text',
+    'clean_receipt_text',
+    'MINOR_UNITS',
+    'to_minor',
+    'to_major',
+    'unit_price',
+    'split_evenly',
+    'MealSelection',
+    'Op',
+    'Callback',
+    'CallbackDecodeError',
+    'pack',
+    'unpack',
+    'uuid_token',
+    'parse_uuid_token',
+    'JOIN_PREFIX',
+    'BOARD_PREFIX',
+    'create_join_link',
+    'create_board_link',
+    'parse_start_payload'
+]
\ No newline at end of file
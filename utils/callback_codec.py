@@ -0,0 +1,190 @@
+import base64
+import uuid
+from typing import Any, Dict, NamedTuple, Tuple
+
+# Bumped whenever an op's field layout changes; older buttons then decode as stale
+CALLBACK_VERSION = "1"
+
+# Telegram rejects callback_data longer than this
+MAX_CALLBACK_BYTES = 64
+
+FIELD_SEPARATOR = "."
+
+
+class Op:
+    """One-character op codes, the second byte of every payload"""
+    SELECT_MEAL = "m"
+    QTY_INC = "+"
+    QTY_DEC = "-"
+    QTY_NOOP = "="
+    CONFIRM_OWN_MEALS = "c"
+    TOGGLE_SHARED = "t"
+    EDIT_MEAL = "e"
+    EDIT_NAME = "n"
+    EDIT_PRICE = "p"
+    EDIT_QTY = "q"
+    DELETE_MEAL = "d"
+    BACK_TO_MEALS = "b"
+    MEALS_DONE = "f"
+    CANCEL_SESSION = "x"
+    DELIVERY_YES = "Y"
+    DELIVERY_NO = "N"
+    PAGE = "P"
+    LETTER = "L"
+    LETTERS = "K"
+    BOARD_CLAIM = "g"
+    MARK_PAID = "$"
+    CONFIRM_PAYMENT = "!"
+    HISTORY_PAGE = "H"
+    TRANSFER_PAID = "T"
+    TRANSFER_CONFIRM = "V"
+
+
+# Field types per op: i = int (base36), u = UUID (22 chars base64url), s = str.
+# A str field may only contain the separator when it is the last field.
+SCHEMAS: Dict[str, Tuple[str, ...]] = {
+    Op.SELECT_MEAL: ('i',),
+    Op.QTY_INC: ('i',),
+    Op.QTY_DEC: ('i',),
+    Op.QTY_NOOP: ('i',),
+    Op.CONFIRM_OWN_MEALS: (),
+    Op.TOGGLE_SHARED: ('i',),
+    Op.EDIT_MEAL: ('i',),
+    Op.EDIT_NAME: ('i',),
+    Op.EDIT_PRICE: ('i',),
+    Op.EDIT_QTY: ('i',),
+    Op.DELETE_MEAL: ('i',),
+    Op.BACK_TO_MEALS: (),
+    Op.MEALS_DONE: (),
+    Op.CANCEL_SESSION: (),
+    Op.DELIVERY_YES: (),
+    Op.DELIVERY_NO: (),
+    Op.PAGE: ('s', 'i'),
+    Op.LETTER: ('s', 's'),
+    Op.LETTERS: ('s',),
+    Op.BOARD_CLAIM: ('u', 'i'),
+    Op.MARK_PAID: ('i',),
+    Op.CONFIRM_PAYMENT: ('i',),
+    Op.HISTORY_PAGE: ('s', 'i', 'i'),
+    Op.TRANSFER_PAID: ('i', 'i', 'i'),
+    Op.TRANSFER_CONFIRM: ('i',)
+}
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class CallbackDecodeError(ValueError):
+    """Payload from another version, a foreign bot or a tampered client"""
+
+
+class Callback(NamedTuple):
+    op: str
+    args: Tuple[Any, ...]
+
+
+def _int_to_base36(value: int) -> str:
+    if value < 0:
+        return "-" + _int_to_base36(-value)
+    digits = []
+    while True:
+        value, remainder = divmod(value, 36)
+        digits.append(_DIGITS[remainder])
+        if not value:
+            return "".join(reversed(digits))
+
+
+def uuid_token(value: Any) -> str:
+    """UUID as 22 base64url characters, for callbacks and deep links"""
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return base64.urlsafe_b64encode(value.bytes).rstrip(b"=").decode()
+
+
+def parse_uuid_token(token: str) -> uuid.UUID:
+    """
+    Reverse uuid_token()
+
+    Raises:
+        ValueError: not a 22-character base64url UUID
+    """
+    if len(token) != 22:
+        raise ValueError(f"Bad UUID token: {token!r}")
+    try:
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(token + "=="))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Bad UUID token: {token!r}") from e
+
+
+def _encode_field(kind: str, value: Any, last: bool) -> str:
+    if kind == 'i':
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError(f"Expected int, got {value!r}")
+        return _int_to_base36(value)
+    if kind == 'u':
+        return uuid_token(value)
+    value = str(value)
+    if not last and FIELD_SEPARATOR in value:
+        raise ValueError(f"Non-final str field may not contain {FIELD_SEPARATOR!r}: {value!r}")
+    return value
+
+
+def _decode_field(kind: str, raw: str) -> Any:
+    if kind == 'i':
+        return int(raw, 36)
+    if kind == 'u':
+        return parse_uuid_token(raw)
+    return raw
+
+
+def pack(op: str, *args: Any) -> str:
+    """
+    Encode a callback as <version><op><field>.<field>...
+
+    Raises:
+        ValueError/TypeError: unknown op, wrong arguments or payload over 64 bytes
+    """
+    schema = SCHEMAS.get(op)
+    if schema is None:
+        raise ValueError(f"Unknown callback op: {op!r}")
+    if len(args) != len(schema):
+        raise ValueError(f"Op {op!r} takes {len(schema)} fields, got {len(args)}")
+
+    last = len(schema) - 1
+    fields = FIELD_SEPARATOR.join(
+        _encode_field(kind, value, i == last) for i, (kind, value) in enumerate(zip(schema, args))
+    )
+    data = f"{CALLBACK_VERSION}{op}{fields}"
+
+    if len(data.encode()) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"Callback data over {MAX_CALLBACK_BYTES} bytes: {data!r}")
+    return data
+
+
+def unpack(data: str) -> Callback:
+    """
+    Decode pack() output into a typed Callback
+
+    Raises:
+        CallbackDecodeError: wrong version, unknown op or malformed fields
+    """
+    if len(data) < 2 or data[0] != CALLBACK_VERSION:
+        raise CallbackDecodeError(f"Unsupported callback data: {data!r}")
+
+    op = data[1]
+    schema = SCHEMAS.get(op)
+    if schema is None:
+        raise CallbackDecodeError(f"Unknown callback op: {data!r}")
+    if not schema:
+        if len(data) != 2:
+            raise CallbackDecodeError(f"Unexpected fields: {data!r}")
+        return Callback(op, ())
+
+    raw_fields = data[2:].split(FIELD_SEPARATOR, len(schema) - 1)
+    if len(raw_fields) != len(schema):
+        raise CallbackDecodeError(f"Wrong field count: {data!r}")
+
+    try:
+        args = tuple(_decode_field(kind, raw) for kind, raw in zip(schema, raw_fields))
+    except ValueError as e:
+        raise CallbackDecodeError(f"Malformed field in {data!r}: {e}")
+    return Callback(op, args)
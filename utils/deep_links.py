@@ -0,0 +1,29 @@
+from typing import Optional
+from aiogram import Bot
+from aiogram.utils.deep_linking import create_start_link, create_startgroup_link
+from utils.callback_codec import uuid_token, parse_uuid_token
+import uuid
+
+# /start payload prefixes, followed by the 22-character session token
+JOIN_PREFIX = "j"  # Private chat: participant picks their meals
+BOARD_PREFIX = "b"  # Group chat: post the live session board
+
+
+async def create_join_link(bot: Bot, session_id: uuid.UUID) -> str:
+    """t.me deep link that opens the join flow for a session"""
+    return await create_start_link(bot, f"{JOIN_PREFIX}{uuid_token(session_id)}")
+
+
+async def create_board_link(bot: Bot, session_id: uuid.UUID) -> str:
+    """t.me link that lets the creator pick a group and post the board there"""
+    return await create_startgroup_link(bot, f"{BOARD_PREFIX}{uuid_token(session_id)}")
+
+
+def parse_start_payload(payload: Optional[str], prefix: str) -> Optional[uuid.UUID]:
+    """Session id from a /start payload with the given prefix, None if malformed"""
+    if not payload or not payload.startswith(prefix):
+        return None
+    try:
+        return parse_uuid_token(payload[len(prefix):])
+    except ValueError:
+        return None
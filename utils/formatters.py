@@ -1,10 +1,14 @@
 from typing import List
+from utils.money import MINOR_UNITS
 import re
 
 
-def format_amount(amount: float) -> str:
-    """Format amount with thousands separator"""
-    return f"{amount:,.0f}".replace(",", " ")
+def format_amount(amount: int) -> str:
+    """Format minor-unit amount as whole so'm with thousands separator"""
+    if amount is None:
+        amount = 0
+    som = (2 * amount + MINOR_UNITS) // (2 * MINOR_UNITS)
+    return f"{som:,}".replace(",", " ")
 
 
 def format_receipt_text(text: str) -> str:
@@ -0,0 +1,59 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Union
+
+# Amounts are stored as integer tiyin (1 so'm = 100 tiyin)
+MINOR_UNITS = 100
+
+MoneyInput = Union[int, float, str, Decimal]
+
+
+def to_minor(amount: MoneyInput) -> int:
+    """
+    Convert a so'm amount (AI output, user input) to integer minor units
+
+    Args:
+        amount: Amount in so'm, e.g. 15000, "15 000", 15000.5
+
+    Returns:
+        Amount in tiyin, rounded half up
+    """
+    if isinstance(amount, bool):
+        raise TypeError("Amount must be a number, not bool")
+    if isinstance(amount, int):
+        return amount * MINOR_UNITS
+    if isinstance(amount, str):
+        amount = amount.replace(" ", "").replace(",", "")
+
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+
+    return int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_major(minor: int) -> Decimal:
+    """Convert minor units back to so'm (for export/logging only)"""
+    return Decimal(minor) / MINOR_UNITS
+
+
+def unit_price(price: int, quantity: int) -> int:
+    """Price of one unit of a line, rounded half up"""
+    if quantity <= 0:
+        return price
+    return (2 * price + quantity) // (2 * quantity)
+
+
+def split_evenly(amount: int, parts: int) -> List[int]:
+    """
+    Split amount into `parts` integer shares that sum exactly to amount
+
+    The remainder is spread one tiyin at a time over the first shares.
+    """
+    if parts <= 0:
+        return []
+    base, remainder = divmod(amount, parts)
+    return [base + 1 if i < remainder else base for i in range(parts)]
@@ -0,0 +1,95 @@
+import base64
+from typing import Dict, List, Set, Tuple
+
+# Quantities are packed one byte per selected meal
+MAX_PACKED_QUANTITY = 255
+
+
+class MealSelection:
+    """
+    Compact meal selection for FSM data
+
+    Meals are addressed by their index in the list shown to the user (the
+    `meal_ids` list stored once when the flow starts). A bitmap marks the
+    selected indexes and a bytearray holds one quantity per index, so a tap
+    is an O(1) bit flip or byte increment and the FSM only stores a short
+    string: base64(bitmap) "." base64(quantities of selected meals).
+    """
+
+    __slots__ = ('size', 'bits', 'quantities')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.bits = 0
+        self.quantities = bytearray(size)
+
+    def is_selected(self, index: int) -> bool:
+        return bool(self.bits >> index & 1)
+
+    def quantity(self, index: int) -> int:
+        return self.quantities[index] if self.is_selected(index) else 0
+
+    def toggle(self, index: int) -> bool:
+        """Flip selection, a newly selected meal starts at quantity 1"""
+        self.bits ^= 1 << index
+        selected = self.is_selected(index)
+        self.quantities[index] = 1 if selected else 0
+        return selected
+
+    def increment(self, index: int, limit: int) -> bool:
+        """Add one unit, returns False if already at limit"""
+        current = self.quantities[index]
+        if not self.is_selected(index) or current >= min(limit, MAX_PACKED_QUANTITY):
+            return False
+        self.quantities[index] = current + 1
+        return True
+
+    def decrement(self, index: int) -> bool:
+        """Remove one unit, never below 1, returns False if unchanged"""
+        current = self.quantities[index]
+        if not self.is_selected(index) or current <= 1:
+            return False
+        self.quantities[index] = current - 1
+        return True
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def selected_indexes(self) -> List[int]:
+        return [i for i in range(self.size) if self.bits >> i & 1]
+
+    def to_ids(self, meal_ids: List[int]) -> Tuple[Set[int], Dict[int, int]]:
+        """Expand to (selected_meal_ids, meal_quantities) for keyboards and saving"""
+        selected_ids = set()
+        quantities = {}
+        for index in self.selected_indexes():
+            meal_id = meal_ids[index]
+            selected_ids.add(meal_id)
+            quantities[meal_id] = self.quantities[index]
+        return selected_ids, quantities
+
+    def encode(self) -> str:
+        bitmap = self.bits.to_bytes((self.size + 7) // 8, 'little')
+        packed = bytes(self.quantities[i] for i in self.selected_indexes())
+        return f"{_b64encode(bitmap)}.{_b64encode(packed)}"
+
+    @classmethod
+    def decode(cls, encoded: str, size: int) -> "MealSelection":
+        selection = cls(size)
+        if not encoded:
+            return selection
+
+        bitmap, _, packed = encoded.partition('.')
+        selection.bits = int.from_bytes(_b64decode(bitmap), 'little') & ((1 << size) - 1)
+        packed = _b64decode(packed)
+        for position, index in enumerate(selection.selected_indexes()):
+            selection.quantities[index] = packed[position] if position < len(packed) else 1
+        return selection
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
@@ -0,0 +1,102 @@
+"""
+Post synthetic Telegram updates to a locally running webhook server
+
+Usage:
+    BOT_MODE=webhook python bot.py            # in one terminal
+    python webhook_harness.py text /start     # in another
+    python webhook_harness.py callback select_meal:12 --count 5
+    python webhook_harness.py text /help --bad-secret
+
+Replies go out through the real Bot API, so use a test bot token.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from aiohttp import ClientSession
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Harness", "username": "harness"}
+
+
+def _chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "private", "first_name": "Harness"}
+
+
+def text_update(text: str, user_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids) % 1_000_000,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": _user(user_id),
+            "text": text
+        }
+    }
+
+
+def callback_update(data: str, user_id: int, chat_id: int, message_id: int) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": _chat(chat_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "Bot"},
+                "text": "harness"
+            }
+        }
+    }
+
+
+async def post_updates(url: str, secret: str, updates: list):
+    async with ClientSession() as http:
+        for update in updates:
+            started = time.perf_counter()
+            async with http.post(
+                url,
+                json=update,
+                headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+            ) as response:
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"update {update['update_id']}: HTTP {response.status} in {elapsed:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post synthetic updates to the webhook")
+    parser.add_argument("kind", choices=["text", "callback"])
+    parser.add_argument("payload", help="Message text or callback data")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBAPP_PORT', '8080')}{os.getenv('WEBHOOK_PATH', '/webhook')}")
+    parser.add_argument("--user-id", type=int, default=int(os.getenv("HARNESS_USER_ID", "1")))
+    parser.add_argument("--chat-id", type=int, default=None)
+    parser.add_argument("--message-id", type=int, default=1)
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--bad-secret", action="store_true", help="Send a wrong secret, expect 401")
+    args = parser.parse_args()
+
+    chat_id = args.chat_id or args.user_id
+    secret = "wrong-secret" if args.bad_secret else os.getenv("WEBHOOK_SECRET", "")
+
+    if args.kind == "text":
+        updates = [text_update(args.payload, args.user_id, chat_id) for _ in range(args.count)]
+    else:
+        updates = [callback_update(args.payload, args.user_id, chat_id, args.message_id) for _ in range(args.count)]
+
+    asyncio.run(post_updates(args.url, secret, updates))
+
+
+if __name__ == "__main__":
+    main()